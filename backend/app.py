@@ -1,12 +1,14 @@
 import os
-from flask import Flask, send_from_directory
+from flask import Flask, send_from_directory, jsonify
 from flask_cors import CORS
 from flask_session import Session
 from routes.auth import auth_bp
 from routes.credits import credits_bp
 from routes.admin import admin_bp
-from routes.match import match_bp
+from routes.match import match_bp, warm_up_models
 from routes.upload import upload_bp
+from routes.jobs import jobs_bp
+from config import MODEL_WARMUP, MAX_UPLOAD_BYTES
 
 # Ensure Flask finds frontend files
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))  # Get backend folder path
@@ -25,6 +27,7 @@ app.config["SESSION_PERMANENT"] = False # Make the session data transient
 app.config["SESSION_USE_SIGNER"] = True # Sign session data
 app.config["SESSION_FILE_DIR"] = SESSION_DIR  # Use the ensured directory
 app.config["SECRET_KEY"] = "supersecretkey" # Secret key for signing
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES # Larger request bodies are rejected before they are read
 
 Session(app)
 
@@ -41,12 +44,21 @@ def serve_index():
 def serve_static_files(filename):
     return send_from_directory(app.static_folder, filename)
 
+# Uploads over MAX_CONTENT_LENGTH
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({"error": f"Request is larger than the {MAX_UPLOAD_BYTES / (1024 * 1024):g} MB limit"}), 413
+
 # Register Routes (API Endpoints)
 app.register_blueprint(auth_bp)
 app.register_blueprint(credits_bp)
 app.register_blueprint(admin_bp)
 app.register_blueprint(match_bp)
 app.register_blueprint(upload_bp)
+app.register_blueprint(jobs_bp)
 
 if __name__ == "__main__":
+    # The debug reloader imports this file in a watcher process too; only the serving child warms up
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        warm_up_models(MODEL_WARMUP)
     app.run(debug=True)
@@ -0,0 +1,152 @@
+"""Benchmark credit deductions from many concurrent clients and check that none are lost.
+
+"json" replays the old users.json read-modify-write; "ledger" charges through
+utils/credit_ledger.py (compare-and-decrement plus ledger row in one SQLite
+transaction). Clients are threads spread over --processes processes, each
+with its own throwaway database. A share of the charges is resent with the
+same idempotency key, as a client retrying after a timeout would. Lost
+updates are successful deductions missing from the final balance. Run from
+the backend folder, e.g.:
+    python benchCredits.py --clients 64 --charges 200 --processes 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+
+USERNAME = "bench_user"
+
+
+def legacy_deduct(users_file):
+    """The deduction previously in routes/credits.py: load users.json, decrement, rewrite the file."""
+    try:
+        with open(users_file, "r") as f:
+            users = json.load(f)
+    except json.JSONDecodeError:
+        return "error"  # Read a half-written file
+    user = users.get(USERNAME)
+    if not user or user["credits"] <= 0:
+        return "insufficient"
+    user["credits"] -= 1
+    with open(users_file, "w") as f:
+        json.dump(users, f, indent=4)
+    return "ok"
+
+
+def run_clients(mode, target, process, clients, charges, retry_ratio, results):
+    """Run clients threads of charges each in this process; put the status counts on results."""
+    if mode == "ledger":
+        from utils.credit_ledger import get_credit_ledger
+        ledger = get_credit_ledger()
+
+    counts = {}
+    lock = threading.Lock()
+
+    def client(number):
+        rng = random.Random(process * 1000 + number)
+        local = {}
+        for charge in range(charges):
+            # A resend reuses the key of the previous charge, which must not be charged again
+            if charge and rng.random() < retry_ratio:
+                charge -= 1
+            if mode == "ledger":
+                status = ledger.charge(USERNAME, key=f"scan:{USERNAME}:{process}-{number}-{charge}")
+            else:
+                status = legacy_deduct(target)
+            local[status] = local.get(status, 0) + 1
+        with lock:
+            for status, count in local.items():
+                counts[status] = counts.get(status, 0) + count
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(counts)
+
+
+def run_mode(mode, args, tmp_dir):
+    attempts = args.clients * args.charges
+    balance = args.balance if args.balance is not None else attempts * 2  # Enough for every charge unless set lower
+    target = os.path.join(tmp_dir, "users.json")
+    if mode == "ledger":
+        os.environ["DATABASE_PATH"] = os.path.join(tmp_dir, "bench.db")
+        from utils.storage import create_user
+        create_user(USERNAME, "x", "user", balance)
+    else:
+        with open(target, "w") as f:
+            json.dump({USERNAME: {"password": "x", "role": "user", "credits": balance}}, f)
+
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    per_process = [args.clients // args.processes + (n < args.clients % args.processes) for n in range(args.processes)]
+    processes = [
+        context.Process(target=run_clients, args=(mode, target, n, count, args.charges, args.retry_ratio, results))
+        for n, count in enumerate(per_process) if count
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    counts = {}
+    for _ in processes:
+        for status, count in results.get().items():
+            counts[status] = counts.get(status, 0) + count
+    for process in processes:
+        process.join()
+    seconds = time.perf_counter() - start
+
+    if mode == "ledger":
+        from utils.storage import get_user, audit_credit_ledger, get_credit_transactions
+        final = get_user(USERNAME)["credits"]
+        ledger_rows = len(get_credit_transactions(USERNAME, limit=attempts + 1)) - 1  # Minus the opening entry
+        audit = audit_credit_ledger()
+    else:
+        with open(target) as f:
+            final = json.load(f)[USERNAME]["credits"]
+        ledger_rows, audit = None, None
+
+    ok = counts.get("ok", 0)
+    return {
+        "attempts": attempts,
+        "seconds": seconds,
+        "per_s": attempts / seconds,
+        "counts": counts,
+        "balance": balance,
+        "final": final,
+        "lost": ok - (balance - final),
+        "ledger_rows": ledger_rows,
+        "audit": audit
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["json", "ledger"], choices=["json", "ledger"])
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--charges", type=int, default=100, help="charges per client")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--balance", type=int, default=None, help="starting credits (default: enough for all)")
+    parser.add_argument("--retry-ratio", type=float, default=0.1, help="share of charges resent with a used key")
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients x {args.charges} charges over {args.processes} processes")
+    print(f"{'mode':<7} {'charges/s':>10} {'ok':>7} {'dup':>6} {'insuff':>7} {'errors':>7} {'lost':>6} {'ledger':>7} {'audit':>6}")
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result = run_mode(mode, args, tmp_dir)
+        counts = result["counts"]
+        print(
+            f"{mode:<7} {result['per_s']:>10.0f} {counts.get('ok', 0):>7} {counts.get('duplicate', 0):>6} "
+            f"{counts.get('insufficient', 0):>7} {counts.get('error', 0):>7} {result['lost']:>6} "
+            f"{'-' if result['ledger_rows'] is None else result['ledger_rows']:>7} "
+            f"{'-' if result['audit'] is None else ('ok' if not result['audit'] else 'FAIL'):>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark the embedding backends: parity with fp32, throughput, latency and memory.
+
+Each backend runs in its own process so peak RSS is measured in isolation.
+Run from the backend folder, e.g.:
+    python benchEncoders.py --backends torch torch_int8 onnx onnx_int8 --texts 512
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+from config import MODEL_NAME, ONNX_DIR, ENCODE_BATCH_SIZE
+from utils.encoders import ENCODER_BACKENDS, PARITY_TEXTS, load_encoder, load_sentence_transformer, parity_check
+
+TEST_FILES_DIR = "../Test Files"
+
+
+def sample_texts(count):
+    """Sentences from the bundled test files, padded with PARITY_TEXTS when there are too few."""
+    texts = []
+    if os.path.isdir(TEST_FILES_DIR):
+        for name in sorted(os.listdir(TEST_FILES_DIR)):
+            if name.endswith(".txt"):
+                with open(os.path.join(TEST_FILES_DIR, name), "r", encoding="utf-8", errors="ignore") as f:
+                    texts.extend(line.strip() for line in f.read().split(".") if len(line.strip()) > 20)
+    texts = texts or list(PARITY_TEXTS)
+    return [texts[i % len(texts)] for i in range(count)]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_backend(backend, count, batch_size):
+    """Measure one backend in this process and return its results."""
+    texts = sample_texts(count)
+
+    start = time.perf_counter()
+    encoder = load_encoder(MODEL_NAME, backend, ONNX_DIR, parity_threshold=0.0)
+    load_seconds = time.perf_counter() - start
+    encoder.encode(texts[:batch_size], batch_size=batch_size)  # Warm-up
+
+    start = time.perf_counter()
+    encoder.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+    throughput = count / (time.perf_counter() - start)
+
+    latencies = []
+    for text in texts[:min(count, 200)]:
+        start = time.perf_counter()
+        encoder.encode([text], batch_size=1, normalize_embeddings=True)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    rss_mb = peak_rss_mb()  # Before the fp32 reference used for parity is loaded
+    parity = None
+    if backend != "torch":
+        parity = parity_check(load_sentence_transformer(MODEL_NAME, device="cpu"), encoder, texts[:200])
+    return {
+        "backend": backend,
+        "load_s": load_seconds,
+        "texts_per_s": throughput,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "rss_mb": rss_mb,
+        "parity": parity
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(ENCODER_BACKENDS), choices=list(ENCODER_BACKENDS))
+    parser.add_argument("--texts", type=int, default=512, help="texts encoded for the throughput run")
+    parser.add_argument("--batch-size", type=int, default=ENCODE_BATCH_SIZE)
+    parser.add_argument("--json", action="store_true", help="run a single backend and print its result as JSON")
+    args = parser.parse_args()
+
+    if args.json:
+        print(json.dumps(run_backend(args.backends[0], args.texts, args.batch_size)))
+        return
+
+    print(f"Model {MODEL_NAME}, {args.texts} texts, batch size {args.batch_size}")
+    print(f"{'backend':<12} {'load s':>8} {'texts/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'RSS MB':>8} {'min cos':>8} {'mean cos':>9}")
+    for backend in args.backends:
+        command = [sys.executable, __file__, "--json", "--backends", backend, "--texts", str(args.texts), "--batch-size", str(args.batch_size)]
+        output = subprocess.run(command, capture_output=True, text=True)
+        if output.returncode != 0:
+            print(f"{backend:<12} ERROR: {output.stderr.strip().splitlines()[-1] if output.stderr.strip() else 'failed'}")
+            continue
+
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        parity = result["parity"] or {"min_cosine": 1.0, "mean_cosine": 1.0}
+        print(
+            f"{backend:<12} {result['load_s']:>8.1f} {result['texts_per_s']:>9.1f} {result['p50_ms']:>8.2f} "
+            f"{result['p99_ms']:>8.2f} {result['rss_mb']:>8.0f} {parity['min_cosine']:>8.4f} {parity['mean_cosine']:>9.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
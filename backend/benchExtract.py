@@ -0,0 +1,79 @@
+"""Benchmark text extraction: the old serial pdfplumber path vs PyMuPDF vs the process pool.
+
+Reports pages per second over the bundled test files and reference documents
+(non-PDF files count as one page). Run from the backend folder, e.g.:
+    python benchExtract.py --repeat 5 --workers 1 4
+"""
+import argparse
+import os
+import time
+from config import REFERENCE_DOCS_DIR
+from utils.extraction import Extractor, available_cores, extract_serial, file_type, pdf_page_count
+
+DEFAULT_DIRS = ["../Test Files", REFERENCE_DOCS_DIR]
+
+
+def collect_files(dirs):
+    files = []
+    for folder in dirs:
+        if os.path.isdir(folder):
+            files.extend(
+                os.path.join(folder, name) for name in sorted(os.listdir(folder))
+                if file_type(name) and os.path.isfile(os.path.join(folder, name))
+            )
+    return files
+
+
+def count_pages(files):
+    return sum(pdf_page_count(path) if file_type(path) == "pdf" else 1 for path in files)
+
+
+def extract_pdfplumber(path):
+    """The extraction previously in match.py: pdfplumber only, extract_text() called twice per page."""
+    if file_type(path) != "pdf":
+        return extract_serial(path)
+    import pdfplumber
+    with pdfplumber.open(path) as pdf:
+        return "\n".join([page.extract_text() for page in pdf.pages if page.extract_text()])
+
+
+def timed(run, files, repeat):
+    start = time.perf_counter()
+    characters = 0
+    for _ in range(repeat):
+        characters = sum(len(text or "") for text in run(files))
+    return (time.perf_counter() - start) / repeat, characters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dirs", nargs="+", default=DEFAULT_DIRS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, available_cores()])
+    parser.add_argument("--pages-per-task", type=int, default=16)
+    args = parser.parse_args()
+
+    files = collect_files(args.dirs)
+    if not files:
+        print("No files to extract")
+        return
+    pages = count_pages(files)
+    print(f"{len(files)} files, {pages} pages, {available_cores()} cores available")
+    print(f"{'method':<22} {'seconds':>9} {'pages/s':>9} {'chars':>9}")
+
+    runs = [
+        ("pdfplumber serial", lambda paths: [extract_pdfplumber(path) for path in paths]),
+        ("pymupdf serial", lambda paths: [extract_serial(path) for path in paths]),
+    ]
+    for workers in args.workers:
+        extractor = Extractor(workers=workers, pages_per_task=args.pages_per_task)
+        list(extractor.extract_many(files))  # Start the pool outside the timing
+        runs.append((f"pool x{workers}", lambda paths, extractor=extractor: [text for _, text in extractor.extract_many(paths)]))
+
+    for name, run in runs:
+        seconds, characters = timed(run, files, args.repeat)
+        print(f"{name:<22} {seconds:>9.3f} {pages / seconds:>9.1f} {characters:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark the FAISS index modes: build time, size, query latency and recall@k vs Flat.
+
+Run from the backend folder, e.g.:
+    python benchIndex.py --n 1000000 --dim 1024 --queries 500 --k 10
+"""
+import argparse
+import time
+import numpy as np
+import faiss
+from config import INDEX_CONFIG
+from utils.index_factory import (
+    INDEX_MODES, METRICS, build_index, apply_search_params, train_index, recall_at_k, query_latencies
+)
+
+# Search-time knob swept for each mode
+SWEEPS = {
+    "flat": [("none", None)],
+    "flat_fp16": [("none", None)],
+    "flat_sq8": [("none", None)],
+    "ivf_flat": [("nprobe", n) for n in (1, 4, 16, 64)],
+    "hnsw": [("ef_search", n) for n in (16, 32, 64, 128)],
+    "ivf_pq": [("nprobe", n) for n in (1, 4, 16, 64)],
+    "opq_ivf_pq": [("nprobe", n) for n in (1, 4, 16, 64)],
+}
+
+
+def synthetic_corpus(n, dim, clusters=1000, seed=0):
+    """Clustered unit vectors, a rough stand-in for sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    vectors = centers[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100000, help="corpus size (passages)")
+    parser.add_argument("--dim", type=int, default=1024, help="embedding dimension")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--modes", nargs="+", default=list(INDEX_MODES), choices=list(INDEX_MODES))
+    parser.add_argument("--metric", default="cosine", choices=list(METRICS))
+    parser.add_argument("--threads", type=int, default=0, help="OpenMP threads (0 = FAISS default)")
+    args = parser.parse_args()
+
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+
+    print(f"Generating {args.n} x {args.dim} corpus...")
+    vectors = synthetic_corpus(args.n, args.dim)
+    ids = np.arange(args.n, dtype="int64")
+    queries = synthetic_corpus(args.queries, args.dim, seed=1)
+
+    baseline = build_index(args.dim, {"mode": "flat"}, args.metric)
+    baseline.add_with_ids(vectors, ids)
+
+    print(f"{'mode':<12} {'param':<14} {'build s':>8} {'MB':>8} {'p50 ms':>8} {'p99 ms':>8} {'recall@' + str(args.k):>10}")
+    for mode in args.modes:
+        config = {**INDEX_CONFIG, "mode": mode}
+
+        start = time.perf_counter()
+        index = build_index(args.dim, config, args.metric)
+        if not index.is_trained:
+            train_index(index, vectors, max_points=config["nlist"] * 256)
+        index.add_with_ids(vectors, ids)
+        build_seconds = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+
+        for name, value in SWEEPS[mode]:
+            if value is not None:
+                apply_search_params(index, {name: value})
+            latencies = query_latencies(index, queries, args.k)
+            recall = recall_at_k(index, baseline, queries, args.k)
+            print(
+                f"{mode:<12} {name + '=' + str(value) if value else '-':<14} {build_seconds:>8.1f} {size_mb:>8.1f} "
+                f"{np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 99):>8.2f} {recall:>10.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
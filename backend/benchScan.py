@@ -0,0 +1,112 @@
+"""Benchmark /scan/match end to end with scan bookkeeping on and off the request path.
+
+Each mode runs in its own process against a throwaway database and activity
+log (the reference index from config.py is used as is). Run from the backend
+folder, e.g.:
+    python benchScan.py --requests 400 --concurrency 8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+MODES = {"sync": "0", "async": "1"}
+
+QUERY_TEXTS = [
+    "Machine learning models learn patterns from labelled examples.",
+    "The credit system limits each user to twenty scans per day.",
+    "Vector search finds the passages closest to a query embedding.",
+    "Documents are split into overlapping passages before indexing.",
+]
+
+
+def run_mode(count, concurrency):
+    """Fire count scans from concurrency logged-in clients and return latency stats (this process)."""
+    from app import app
+    from routes.match import embedding_service, load_reference_docs, get_reference_index
+    from utils.event_bus import get_event_bus
+
+    embedding_service.warm_up(background=False)
+    if get_reference_index().ntotal == 0:
+        load_reference_docs()
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def client_loop(worker):
+        client = app.test_client()
+        credentials = {"username": f"bench_{worker}", "password": "bench"}
+        client.post("/auth/register", json=credentials)
+        client.post("/auth/login", json=credentials)
+        for i in range(worker, count, concurrency):
+            start = time.perf_counter()
+            response = client.post("/scan/match", json={"text": QUERY_TEXTS[i % len(QUERY_TEXTS)]})
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                (latencies if response.status_code == 200 else errors).append(elapsed)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client_loop, args=(worker,)) for worker in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    bus = get_event_bus()
+    flush_start = time.perf_counter()
+    bus.flush()
+    events = bus.metrics()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_s": len(latencies) / wall if wall else 0.0,
+        "p50_ms": float(np.percentile(latencies, 50)) if latencies else None,
+        "p99_ms": float(np.percentile(latencies, 99)) if latencies else None,
+        "drain_s": time.perf_counter() - flush_start,
+        "mean_batch": events["processed"] / max(events["batch_size"]["count"], 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--json", action="store_true", help="run in this process (mode from EVENTS_ASYNC) and print JSON")
+    args = parser.parse_args()
+
+    if args.json:
+        print(json.dumps(run_mode(args.requests, args.concurrency)))
+        return
+
+    print(f"{args.requests} scans, {args.concurrency} concurrent clients")
+    print(f"{'mode':<6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'drain s':>8} {'batch':>6}")
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            env = dict(
+                os.environ,
+                EVENTS_ASYNC=MODES[mode],
+                DATABASE_PATH=os.path.join(tmp_dir, "bench.db"),
+                ACTIVITY_LOG_DIR=os.path.join(tmp_dir, "activity_logs")
+            )
+            command = [sys.executable, __file__, "--json", "--requests", str(args.requests), "--concurrency", str(args.concurrency)]
+            output = subprocess.run(command, capture_output=True, text=True, env=env)
+        if output.returncode != 0:
+            print(f"{mode:<6} ERROR: {output.stderr.strip().splitlines()[-1] if output.stderr.strip() else 'failed'}")
+            continue
+
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        print(
+            f"{mode:<6} {result['requests_per_s']:>8.1f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+            f"{result['errors']:>7} {result['drain_s']:>8.2f} {result['mean_batch']:>6.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
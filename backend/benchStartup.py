@@ -0,0 +1,64 @@
+"""Benchmark application startup: import time per blueprint, heavy libraries pulled in, and model load time.
+
+Every measurement runs in a fresh interpreter so earlier imports do not hide later costs.
+Run from the backend folder, e.g.:
+    python benchStartup.py --repeat 5
+"""
+import argparse
+import json
+import subprocess
+import sys
+import numpy as np
+
+MODULES = ["routes.auth", "routes.credits", "routes.admin", "routes.match", "routes.upload", "app"]
+
+# Libraries that should only be imported when a request needs them
+HEAVY_MODULES = ["torch", "sentence_transformers", "onnxruntime", "sklearn", "pdfplumber", "pytesseract", "fitz", "docx", "PIL"]
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+MODEL_PROBE = """
+import json, time
+start = time.perf_counter()
+from routes.match import embedding_service
+embedding_service.warm_up(background=False)
+print(json.dumps({"seconds": time.perf_counter() - start, "load_seconds": embedding_service.load_seconds}))
+"""
+
+
+def run_probe(code):
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr.strip().splitlines()[-1] if output.stderr.strip() else "probe failed")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per measurement (median is shown)")
+    parser.add_argument("--model", action="store_true", help="also time loading the embedding model and a first encode")
+    args = parser.parse_args()
+
+    print(f"{'module':<16} {'median s':>9} {'max s':>7}  heavy imports")
+    for module in MODULES:
+        try:
+            runs = [run_probe(IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{module:<16} ERROR: {e}")
+            continue
+        seconds = [run["seconds"] for run in runs]
+        print(f"{module:<16} {np.median(seconds):>9.3f} {max(seconds):>7.3f}  {', '.join(runs[-1]['heavy']) or '-'}")
+
+    if args.model:
+        result = run_probe(MODEL_PROBE)
+        print(f"Model ready in {result['seconds']:.1f}s (weights {result['load_seconds']:.1f}s, rest is the first encode)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Storage paths (relative to the backend folder, like the rest of the app)
+STORAGE_PATH = "./storage"
+REFERENCE_DOCS_DIR = os.path.join(STORAGE_PATH, "reference_docs")
+INDEX_DIR = os.getenv("INDEX_DIR", os.path.join(STORAGE_PATH, "faiss_index"))
+# SQLite database for users, credits, scans and analytics (imports the old JSON files on first use)
+DATABASE_PATH = os.getenv("DATABASE_PATH", os.path.join(STORAGE_PATH, "app.db"))
+
+# Append-only activity log: NDJSON segments rotated by size or age, old segments gzip-compressed
+ACTIVITY_LOG_DIR = os.getenv("ACTIVITY_LOG_DIR", os.path.join(STORAGE_PATH, "activity_logs"))
+ACTIVITY_LOG_MAX_BYTES = int(os.getenv("ACTIVITY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+ACTIVITY_LOG_ROTATE_SECONDS = int(os.getenv("ACTIVITY_LOG_ROTATE_SECONDS", "86400"))
+ACTIVITY_LOG_COMPRESS = os.getenv("ACTIVITY_LOG_COMPRESS", "1") == "1"
+
+# Embedding model used for reference documents and queries
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", "BAAI/bge-large-en-v1.5")
+ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", "32"))
+
+# Passage chunking for reference documents (bge-large truncates input at 512 tokens)
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+# How passage hits are pooled into a document score: "max" (best passage) or "topk" (mean of the best POOL_TOP_K)
+POOLING = os.getenv("POOLING", "max")
+POOL_TOP_K = int(os.getenv("POOL_TOP_K", "3"))
+
+# FAISS index layout: flat | flat_fp16 | flat_sq8 | ivf_flat | hnsw | ivf_pq | opq_ivf_pq (see utils/index_factory.py)
+INDEX_CONFIG = {
+    "mode": os.getenv("INDEX_MODE", "flat"),
+    "nlist": int(os.getenv("INDEX_NLIST", "1024")),  # IVF cells
+    "nprobe": int(os.getenv("INDEX_NPROBE", "16")),  # IVF cells visited per query
+    "hnsw_m": int(os.getenv("INDEX_HNSW_M", "32")),  # HNSW neighbours per node
+    "ef_construction": int(os.getenv("INDEX_EF_CONSTRUCTION", "200")),
+    "ef_search": int(os.getenv("INDEX_EF_SEARCH", "64")),  # HNSW candidate list size per query
+    "pq_m": int(os.getenv("INDEX_PQ_M", "64"))  # PQ bytes per vector
+}
+
+# Scoring: "cosine" (normalized embeddings, inner-product index) or "l2" (legacy raw L2 distance)
+SCORE_METRIC = os.getenv("SCORE_METRIC", "cosine")
+# Default minimum similarity (percent) and number of matches; both can be overridden per request.
+# With cosine scores unrelated texts still land around 10-30%, so the default only keeps documents that share
+# a topic or passages (40%+); lower it to see weaker matches
+SCORE_THRESHOLD = float(os.getenv("SCORE_THRESHOLD", "40"))
+DEFAULT_TOP_K = int(os.getenv("DEFAULT_TOP_K", "2"))
+MAX_TOP_K = int(os.getenv("MAX_TOP_K", "20"))
+
+# Retrieval mode per request: "dense" (embeddings), "lexical" (BM25) or "hybrid" (both, ranked by reciprocal-rank
+# fusion over the top RRF_DEPTH documents of each with constant RRF_K, scored and thresholded by dense similarity).
+# Dense and hybrid scans are served lexically while the embedding model is still loading. BM25 uses BM25_K1 and
+# BM25_B and the LEXICAL_MAX_QUERY_TERMS query terms with the highest idf, so long documents stay cheap to search
+MATCH_MODE = os.getenv("MATCH_MODE", "dense")
+RRF_K = int(os.getenv("RRF_K", "60"))
+RRF_DEPTH = int(os.getenv("RRF_DEPTH", "50"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+LEXICAL_MAX_QUERY_TERMS = int(os.getenv("LEXICAL_MAX_QUERY_TERMS", "256"))
+
+# Near-duplicate fast path: before any other matching, a scan's MinHash signature (MINHASH_PERMUTATIONS hashes of its
+# MINHASH_SHINGLE_WORDS-word shingles, split into MINHASH_BANDS LSH bands) is looked up among the reference documents.
+# Documents with an estimated Jaccard similarity of at least NEAR_DUPLICATE_THRESHOLD are returned without the model
+NEAR_DUPLICATE_CHECK = os.getenv("NEAR_DUPLICATE_CHECK", "1") == "1"
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9"))
+MINHASH_PERMUTATIONS = int(os.getenv("MINHASH_PERMUTATIONS", "128"))
+MINHASH_BANDS = int(os.getenv("MINHASH_BANDS", "16"))
+MINHASH_SHINGLE_WORDS = int(os.getenv("MINHASH_SHINGLE_WORDS", "5"))
+
+# Overlapping passages: every match lists up to MAX_OVERLAP_SPANS character spans it shares with the scan, found by
+# winnowing fingerprints (k-grams of WINNOW_KGRAM_CHARS letters and digits, one kept per WINNOW_WINDOW k-grams). Shared
+# runs of WINNOW_KGRAM_CHARS + WINNOW_WINDOW - 1 letters and digits are always found, shorter than WINNOW_KGRAM_CHARS never
+OVERLAP_SPANS = os.getenv("OVERLAP_SPANS", "1") == "1"
+MAX_OVERLAP_SPANS = int(os.getenv("MAX_OVERLAP_SPANS", "50"))
+WINNOW_KGRAM_CHARS = int(os.getenv("WINNOW_KGRAM_CHARS", "25"))
+WINNOW_WINDOW = int(os.getenv("WINNOW_WINDOW", "20"))
+
+# Long scans: with QUERY_PASSAGES on, dense and hybrid scans longer than one model window are split into passages like
+# the reference documents, embedded in one batch and searched together. Past MAX_QUERY_PASSAGES passages, that many
+# are taken evenly spread over the text, which bounds the cost of a scan
+QUERY_PASSAGES = os.getenv("QUERY_PASSAGES", "1") == "1"
+MAX_QUERY_PASSAGES = int(os.getenv("MAX_QUERY_PASSAGES", "32"))
+
+# Embedding worker: concurrent queries are coalesced into batches of up to ENCODE_BATCH_SIZE texts,
+# waiting at most EMBED_MAX_WAIT_MS for more requests to arrive
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+EMBED_QUEUE_SIZE = int(os.getenv("EMBED_QUEUE_SIZE", "1024"))
+
+# Embedding backend: torch (fp32) | torch_int8 | onnx | onnx_int8 (see utils/encoders.py).
+# Non-fp32 backends fall back to torch when their cosine agreement with fp32 is below EMBEDDING_PARITY_THRESHOLD
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_PARITY_THRESHOLD = float(os.getenv("EMBEDDING_PARITY_THRESHOLD", "0.99"))
+ONNX_DIR = os.getenv("ONNX_DIR", os.path.join(STORAGE_PATH, "onnx"))
+
+# Tesseract binary used for OCR of image uploads and reference documents
+TESSERACT_PATH = os.getenv("TESSERACT_PATH", "C:/Program Files/Tesseract-OCR/tesseract.exe")  # Update path for Windows if needed
+
+# Model warm-up when the app starts: "background" (load on a thread, serve meanwhile), "sync" (load before
+# serving) or "off" (load on the first scan). gunicorn.conf.py loads the weights in the master process instead
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "background")
+
+# Scan bookkeeping (history, analytics, activity log) runs on a background event worker in batches of up to
+# EVENT_BATCH_SIZE. A full queue makes callers wait up to EVENT_EMIT_TIMEOUT seconds, then handle the event themselves.
+# EVENTS_ASYNC=0 handles every event on the request thread
+EVENTS_ASYNC = os.getenv("EVENTS_ASYNC", "1") == "1"
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "256"))
+EVENT_MAX_WAIT_MS = float(os.getenv("EVENT_MAX_WAIT_MS", "20"))
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "10000"))
+EVENT_EMIT_TIMEOUT = float(os.getenv("EVENT_EMIT_TIMEOUT", "1"))
+
+# Text extraction runs on a process pool of EXTRACT_WORKERS processes (0 = one per available core). PDFs are split
+# into tasks of EXTRACT_PAGES_PER_TASK pages; a file that takes longer than EXTRACT_TIMEOUT seconds yields no text
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0"))
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "120"))
+EXTRACT_PAGES_PER_TASK = int(os.getenv("EXTRACT_PAGES_PER_TASK", "16"))
+
+# Extracted texts are cached by file hash under EXTRACT_CACHE_DIR (zlib-compressed, least recently used files evicted
+# past EXTRACT_CACHE_MAX_BYTES; 0 disables the cache) with the EXTRACT_CACHE_MEMORY_ITEMS most recent kept in memory
+EXTRACT_CACHE_DIR = os.getenv("EXTRACT_CACHE_DIR", os.path.join(STORAGE_PATH, "extract_cache"))
+EXTRACT_CACHE_MAX_BYTES = int(os.getenv("EXTRACT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+EXTRACT_CACHE_MEMORY_ITEMS = int(os.getenv("EXTRACT_CACHE_MEMORY_ITEMS", "128"))
+
+# Repeated scans: QUERY_CACHE_ITEMS query embeddings are kept for QUERY_CACHE_TTL seconds, and RESULT_CACHE_ITEMS
+# search results until the reference documents change (0 disables either level)
+QUERY_CACHE_ITEMS = int(os.getenv("QUERY_CACHE_ITEMS", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+RESULT_CACHE_ITEMS = int(os.getenv("RESULT_CACHE_ITEMS", "1024"))
+
+# Upload limits: request bodies over MAX_UPLOAD_BYTES get 413; each file type has its own byte cap and PDFs a page cap.
+# Scan text is cut at MAX_QUERY_CHARS (uploads stop extracting there, longer /scan/match texts get 413)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(32 * 1024 * 1024)))
+UPLOAD_LIMITS = {
+    "txt": int(os.getenv("UPLOAD_MAX_TXT_BYTES", str(5 * 1024 * 1024))),
+    "pdf": int(os.getenv("UPLOAD_MAX_PDF_BYTES", str(32 * 1024 * 1024))),
+    "docx": int(os.getenv("UPLOAD_MAX_DOCX_BYTES", str(16 * 1024 * 1024))),
+    "jpg": int(os.getenv("UPLOAD_MAX_IMAGE_BYTES", str(16 * 1024 * 1024))),
+    "png": int(os.getenv("UPLOAD_MAX_IMAGE_BYTES", str(16 * 1024 * 1024)))
+}
+UPLOAD_MAX_PDF_PAGES = int(os.getenv("UPLOAD_MAX_PDF_PAGES", "500"))
+MAX_QUERY_CHARS = int(os.getenv("MAX_QUERY_CHARS", "200000"))
+
+# /scan/batch: at most MAX_BATCH_ITEMS documents per request, embedded and searched SCAN_BATCH_CHUNK at a time
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "1000"))
+SCAN_BATCH_CHUNK = int(os.getenv("SCAN_BATCH_CHUNK", "256"))
+
+# Asynchronous scan jobs (scanWorker.py runs JOB_WORKERS worker processes). A failed attempt is retried after
+# JOB_RETRY_SECONDS (doubling each time) up to JOB_MAX_ATTEMPTS; a job whose worker is silent for JOB_LEASE_SECONDS
+# is handed to another worker. Each user may have JOB_MAX_PENDING_PER_USER unfinished jobs, JOB_MAX_RUNNING_PER_USER running
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_SECONDS = float(os.getenv("JOB_RETRY_SECONDS", "5"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_PENDING_PER_USER = int(os.getenv("JOB_MAX_PENDING_PER_USER", "10"))
+JOB_MAX_RUNNING_PER_USER = int(os.getenv("JOB_MAX_RUNNING_PER_USER", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+
+# Credit balances are cached for CREDIT_CACHE_TTL seconds after each read or write (CREDIT_CACHE_ITEMS users);
+# charges always go to the database, so the cache only delays balance reads of changes made by other processes
+CREDIT_CACHE_ITEMS = int(os.getenv("CREDIT_CACHE_ITEMS", "10000"))
+CREDIT_CACHE_TTL = float(os.getenv("CREDIT_CACHE_TTL", "5"))
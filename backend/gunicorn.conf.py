@@ -0,0 +1,29 @@
+# gunicorn settings, picked up automatically when started from the backend folder:
+#     gunicorn app:app
+import gc
+import os
+
+bind = os.getenv("BIND", "127.0.0.1:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# Threads let concurrent scans in one worker share embedding micro-batches
+worker_class = "gthread"
+threads = int(os.getenv("WORKER_THREADS", "4"))
+timeout = 120
+
+# Import the app and load the model weights once in the master; forked workers share them copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from routes.match import warm_up_models
+    warm_up_models("sync")
+    # Keep the garbage collector from touching (and so copying) every preloaded object in each worker
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    # Encode once and open the reference index in each worker before it takes traffic
+    from routes.match import warm_up_models
+    warm_up_models("background")
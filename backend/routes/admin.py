@@ -1,118 +1,28 @@
 import os
-import json
+import shutil
+import tempfile
 from flask import Blueprint, request, jsonify, session
-from utils.file_utils import load_json, save_json
-from sklearn.feature_extraction.text import TfidfVectorizer
-import re
+from utils.storage import (
+    get_analytics, get_credit_requests as load_credit_requests,
+    resolve_credit_request, get_keyword_stats, rebuild_keyword_stats, transaction
+)
+from utils.keyword_stats import top_keywords, exact_top_keywords
+from utils.activity_log import get_activity_log
+from utils.credit_ledger import get_credit_ledger
+
+# Page size limits for /admin/logs
+DEFAULT_LOG_PAGE = 100
+MAX_LOG_PAGE = 1000
 
 admin_bp = Blueprint("admin", __name__)
 
-CREDITS_FILE = "./storage/credits.json"
-USERS_FILE = "./storage/users.json"
-ANALYTICS_FILE = "./storage/analytics.json"
-ACTIVITY_LOG_FILE = "./storage/activity_logs.json"
-
-# Function to extract top keywords from a list of texts
-def extract_top_keywords(all_texts, top_n=10):
-    vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
-    tfidf_matrix = vectorizer.fit_transform(all_texts)
-    feature_names = vectorizer.get_feature_names_out()
-    tfidf_sum = tfidf_matrix.sum(axis=0)
-
-    keywords_scores = [(feature_names[i], tfidf_sum[0, i]) for i in range(len(feature_names))]
-    sorted_keywords = sorted(keywords_scores, key=lambda x: x[1], reverse=True)
-
-    return [word for word, _ in sorted_keywords[:top_n]]
-
 # Load analytics data
 def load_analytics():
-    if not os.path.exists(ANALYTICS_FILE) or os.stat(ANALYTICS_FILE).st_size == 0:
-        print("Analytics file is missing or empty. Initializing with default structure.")
-        return {"scans_per_user": {}}  # Ensure default structure
-
-    with open(ANALYTICS_FILE, "r", encoding="utf-8") as f:
-        try:
-            analytics = json.load(f)
-            # Ensure 'scans_per_user' exists
-            if "scans_per_user" not in analytics:
-                analytics["scans_per_user"] = {}
-            if "most_scanned_documents" not in analytics:
-                analytics["most_scanned_documents"] = {}
-            if "credit_usage" not in analytics:
-                analytics["credit_usage"] = {}
-            if "most_scanned_topics" not in analytics:
-                analytics["most_scanned_topics"] = []
-            if "document_texts" not in analytics:
-                analytics["document_texts"] = {}
-                
-            return analytics
-        except json.JSONDecodeError:
-            return {
-                "scans_per_user": {},
-                "most_scanned_documents": {},
-                "credit_usage": {}
-            }  # Return default structure
-
-# Save analytics data
-def save_analytics(data):
-    with open(ANALYTICS_FILE, "w") as f:
-        json.dump(data, f, indent=4)
-
-# Update Analytics after Scan
-def update_scan_analytics(username, query_text, document_name):
-    analytics = load_analytics()
-
-    # Ensure 'scans_per_user' exists
-    if "scans_per_user" not in analytics:
-        analytics["scans_per_user"] = {}
-        
-    # Ensure 'most_scanned_documents' exists    
-    if "most_scanned_documents" not in analytics:
-        analytics["most_scanned_documents"] = {}
-    
-    # Ensure 'credit_usage' exists
-    if "credit_usage" not in analytics:
-        analytics["credit_usage"] = {}
-        
-    if "most_scanned_topics" not in analytics:
-        analytics["most_scanned_topics"] = []
-
-    if "document_texts" not in analytics:
-        analytics["document_texts"] = {}
-
-    # Now update safely
-    analytics["scans_per_user"][username] = analytics["scans_per_user"].get(username, 0) + 1
-    
-    # Track Most Scanned Documents
-    analytics["most_scanned_documents"][document_name] = analytics["most_scanned_documents"].get(document_name, 0) + 1
-    
-    # Track Document Texts
-    analytics["document_texts"][document_name] = query_text
-    # Extract Top Keywords
-    all_texts = list(analytics["document_texts"].values())
-    analytics["most_scanned_topics"] = extract_top_keywords(all_texts)
-    
-
-    # Write back safely
-    with open(ANALYTICS_FILE, "w", encoding="utf-8") as f:
-        json.dump(analytics, f, indent=4)
-
-
-# Update Credit Usage
-def update_credit_usage(username, credit_used):
-    analytics = load_analytics()
-    
-    # Ensure 'credit_usage' exists
-    if "credit_usage" not in analytics:
-        analytics["credit_usage"] = {}
-        
-    # Track Credit Usage
-    analytics["credit_usage"][username] = analytics["credit_usage"].get(username, 0) + credit_used
-    
-    # Write back safely
-    with open(ANALYTICS_FILE, "w", encoding="utf-8") as f:
-        json.dump(analytics, f, indent=4)
-
+    analytics = get_analytics()
+    # Topics come from running keyword totals, kept up to date by each scan
+    n_docs, stats = get_keyword_stats()
+    analytics["most_scanned_topics"] = top_keywords(stats, n_docs)
+    return analytics
 
 # API: Get Analytics for Admin Panel
 @admin_bp.route("/admin/analytics", methods=["GET"])
@@ -121,6 +31,30 @@ def get_admin_analytics():
     return jsonify(analytics)
 
 
+# API: Compare the running keyword totals with a full TF-IDF refit (optionally rebuilding the totals first)
+@admin_bp.route("/admin/analytics/keywords/audit", methods=["POST"])
+def audit_keywords():
+    error = require_admin()
+    if error:
+        return error
+
+    top_n = request.args.get("top_n", 10, type=int)
+    if request.args.get("rebuild") == "1":
+        with transaction() as conn:
+            rebuild_keyword_stats(conn)
+
+    n_docs, stats = get_keyword_stats()
+    incremental = top_keywords(stats, n_docs, top_n)
+    texts = list(get_analytics()["document_texts"].values())
+    exact = exact_top_keywords(texts, top_n) if texts else []
+    return jsonify({
+        "documents": n_docs,
+        "incremental": incremental,
+        "exact": exact,
+        "overlap": len(set(incremental) & set(exact)) / len(exact) if exact else 1.0
+    }), 200
+
+
 # Approve credit request
 @admin_bp.route("/admin/approve_credit", methods=["POST"])
 def approve_credit():
@@ -128,23 +62,13 @@ def approve_credit():
     username = data.get("username")
     credits_to_add = data.get("credits")
 
-    users = load_json(USERS_FILE)
-    credit_requests = load_json(CREDITS_FILE)
-
-    # Find user
-    for user in users:
-        if user["username"] == username:
-            user["credits"] += credits_to_add
-            save_json(USERS_FILE, users)
-            break
-    else:
-        return jsonify({"error": "User not found"}), 404
-
-    # Remove approved request
-    credit_requests = [req for req in credit_requests if req["username"] != username]
-    save_json(CREDITS_FILE, credit_requests)
+    # Add the requested credits and remove the request together
+    req = resolve_credit_request(username, approve=True, credits=credits_to_add)
+    if not req:
+        return jsonify({"error": "Request not found"}), 404
+    get_credit_ledger().forget(username)
 
-    return jsonify({"message": f"Approved {credits_to_add} credits for {username}"}), 200
+    return jsonify({"message": f"Approved {req['credits']} credits for {username}"}), 200
 
 
 
@@ -154,30 +78,13 @@ def deny_credit():
     data = request.json
     username = data.get("username")
 
-    credit_requests = load_json(CREDITS_FILE)
-
     # Remove denied request
-    updated_requests = [req for req in credit_requests if req["username"] != username]
-    
-    if len(updated_requests) == len(credit_requests):
+    if not resolve_credit_request(username, approve=False):
         return jsonify({"error": "Request not found"}), 404
 
-    save_json(CREDITS_FILE, updated_requests)
     return jsonify({"message": f"Denied credit request for {username}"}), 200
 
 
-def load_credit_requests():
-    """Load credit requests from JSON."""
-    if not os.path.exists(CREDITS_FILE):
-        return {}
-    with open(CREDITS_FILE, "r") as file:
-        try:
-            return json.load(file)
-        except json.JSONDecodeError:
-            return {}  # Prevents crashes if JSON is corrupted
-
-
-
 @admin_bp.route("/admin/credits", methods=["GET"])
 def get_credit_requests():
     """Return all pending credit requests (Admin Only)."""
@@ -197,4 +104,135 @@ def get_credit_requests():
 
 @admin_bp.route("/admin/logs", methods=["GET"])
 def get_user_logs():
-    return jsonify(load_json(ACTIVITY_LOG_FILE))
+    """Return one page of activity logs, oldest first.
+
+    Optional filters: username, action, since and until (ISO timestamps).
+    Pass the returned next_cursor as cursor to fetch the following page.
+    """
+    try:
+        limit = max(1, min(int(request.args.get("limit", DEFAULT_LOG_PAGE)), MAX_LOG_PAGE))
+        logs, next_cursor = get_activity_log().read_page(
+            limit=limit,
+            username=request.args.get("username"),
+            action=request.args.get("action"),
+            since=request.args.get("since"),
+            until=request.args.get("until"),
+            cursor=request.args.get("cursor")
+        )
+    except ValueError:
+        return jsonify({"error": "limit and cursor must be valid"}), 400
+
+    return jsonify({"logs": logs, "next_cursor": next_cursor})
+
+
+def require_admin():
+    """Return an error response unless the session belongs to an admin."""
+    user = session.get("user")
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    if user["role"] != "admin":
+        return jsonify({"error": "Forbidden"}), 403
+    return None
+
+
+def ingest_uploaded_reference(file, name):
+    """Index an uploaded reference file, then move it into the reference folder."""
+    # Imported here because routes.match imports this module at load time
+    from routes.match import get_reference_index
+    reference_index = get_reference_index()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, name)
+        file.save(tmp_path)
+        try:
+            doc_id = reference_index.add_document(tmp_path, name=name)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        shutil.move(tmp_path, os.path.join(reference_index.docs_dir, name))
+
+    return jsonify({"message": f"Indexed {name}", "id": doc_id, "total_documents": reference_index.document_count}), 200
+
+
+def reference_name_from(filename):
+    """Reduce a client-supplied name to a bare file name inside the reference folder."""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    return name if name not in ("", ".", "..") else None
+
+
+# API: List reference documents
+@admin_bp.route("/admin/reference_docs", methods=["GET"])
+def list_reference_docs():
+    error = require_admin()
+    if error:
+        return error
+
+    from routes.match import get_reference_index
+    reference_index = get_reference_index()
+    return jsonify({"documents": sorted(reference_index.documents())}), 200
+
+
+# API: Reference index layout, size and measured recall
+@admin_bp.route("/admin/reference_index", methods=["GET"])
+def get_reference_index_stats():
+    error = require_admin()
+    if error:
+        return error
+
+    from routes.match import get_reference_index
+    reference_index = get_reference_index()
+    return jsonify(reference_index.stats()), 200
+
+
+# API: Add a new reference document
+@admin_bp.route("/admin/reference_docs", methods=["POST"])
+def add_reference_doc():
+    error = require_admin()
+    if error:
+        return error
+
+    file = request.files.get("file")
+    name = reference_name_from(file.filename if file else None)
+    if not name:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    from routes.match import get_reference_index
+    reference_index = get_reference_index()
+    if name in reference_index.documents():
+        return jsonify({"error": f"{name} already exists, use PUT to replace it"}), 409
+
+    return ingest_uploaded_reference(file, name)
+
+
+# API: Replace (or create) a reference document
+@admin_bp.route("/admin/reference_docs/<path:name>", methods=["PUT"])
+def replace_reference_doc(name):
+    error = require_admin()
+    if error:
+        return error
+
+    file = request.files.get("file")
+    name = reference_name_from(name)
+    if not file or not name:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    return ingest_uploaded_reference(file, name)
+
+
+# API: Remove a reference document
+@admin_bp.route("/admin/reference_docs/<path:name>", methods=["DELETE"])
+def delete_reference_doc(name):
+    error = require_admin()
+    if error:
+        return error
+
+    from routes.match import get_reference_index
+    reference_index = get_reference_index()
+    name = reference_name_from(name)
+    if not name or not reference_index.remove_document(name):
+        return jsonify({"error": "Document not found"}), 404
+
+    file_path = os.path.join(reference_index.docs_dir, name)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+    return jsonify({"message": f"Removed {name}", "total_documents": reference_index.document_count}), 200
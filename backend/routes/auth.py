@@ -1,17 +1,9 @@
 from flask import Blueprint, request, jsonify, session
-from utils.file_utils import load_json, save_json
+from utils.storage import get_user, create_user
 import bcrypt
 
 auth_bp = Blueprint("auth", __name__)
 
-# Load users from JSON
-def get_users():
-    return load_json("users.json").get("users", [])
-
-# Save user data
-def save_users(users):
-    save_json("users.json", {"users": users})
-
 # Register User
 @auth_bp.route("/auth/register", methods=["POST"])
 def register():
@@ -20,10 +12,8 @@ def register():
     password = data.get("password")
     role = data.get("role", "user")  # Default role: user
 
-    users = get_users()
-    
     # Check if username exists
-    if any(user["username"] == username for user in users):
+    if get_user(username):
         return jsonify({"error": "Username already exists"}), 400
 
     # Hash password
@@ -32,16 +22,9 @@ def register():
     # Assign credits based on role
     credits = 9999 if role == "admin" else 20
 
-    # Create user
-    new_user = {
-        "username": username,
-        "password": hashed_pw,
-        "role": role,
-        "credits": credits  # Assign correct credits
-    }
-
-    users.append(new_user)
-    save_users(users)
+    # Create user (the insert fails if another request registered the name meanwhile)
+    if not create_user(username, hashed_pw, role, credits):
+        return jsonify({"error": "Username already exists"}), 400
 
     return jsonify({"message": "User registered successfully"}), 201
 
@@ -52,9 +35,7 @@ def login():
     username = data.get("username")
     password = data.get("password")
 
-    # users = get_users()
-    users = load_json("users.json").get("users", [])
-    user = next((u for u in users if u["username"] == username), None)
+    user = get_user(username)
 
     if not user or not bcrypt.checkpw(password.encode("utf-8"), user["password"].encode()):
         return jsonify({"error": "Invalid username or password"}), 401
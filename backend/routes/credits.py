@@ -1,52 +1,13 @@
-import json
-import os
 from flask import Blueprint, request, jsonify, session
-from routes.admin import update_credit_usage
+from utils.storage import (
+    get_user, reset_credits, get_credit_requests as load_credit_requests, add_credit_request,
+    resolve_credit_request, get_credit_transactions
+)
+from utils.credit_ledger import get_credit_ledger, scan_key
 from apscheduler.schedulers.background import BackgroundScheduler
 
 credits_bp = Blueprint("credits", __name__)
 
-CREDITS_FILE = "./storage/credits.json"
-USERS_FILE = "./storage/users.json"
-ANALYTICS_FILE = "./storage/analytics.json"
-
-# Ensure storage folder exists
-os.makedirs("./storage", exist_ok=True)
-
-# Load users from JSON
-def load_users():
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "r") as f:
-            try:
-                data = json.load(f)
-                return data if isinstance(data, dict) and "users" in data else {"users": []}
-            except json.JSONDecodeError:
-                return {"users": []}
-    return {"users": []}
-
-# Save users to JSON
-def save_users(users):
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f, indent=4)
-
-# Load credit requests
-def load_credit_requests():
-    if os.path.exists(CREDITS_FILE):
-        with open(CREDITS_FILE, "r") as f:
-            try:
-                data = json.load(f)
-                return data if isinstance(data, list) else []
-            except json.JSONDecodeError:
-                return []
-    return []
-
-# Save credit requests
-def save_credit_requests(data):
-    with open(CREDITS_FILE, "w") as f:
-        json.dump(data, f, indent=4)
-
-
-
 @credits_bp.route("/credits/request", methods=["POST"])
 def request_credits():
     """ Allow users to request more credits. """
@@ -57,19 +18,10 @@ def request_credits():
     if not username or not isinstance(requested_credits, int) or requested_credits <= 0:
         return jsonify({"error": "Invalid request"}), 400
 
-    credit_requests = load_credit_requests()
-
     # Ensure the user doesn't have a pending request
-    if any(req["username"] == username for req in credit_requests):
+    if not add_credit_request(username, requested_credits):
         return jsonify({"error": "Credit request already pending"}), 400
 
-    credit_requests.append({
-        "username": username,
-        "credits": requested_credits,
-        "status": "pending"
-    })
-    save_credit_requests(credit_requests)
-
     return jsonify({"message": "Credit request submitted"}), 200
 
 
@@ -82,56 +34,42 @@ def approve_credits():
     username = data.get("username")
     approve = data.get("approve", False)
 
-    users = load_users()
-    credit_requests = load_credit_requests()
-
     # Check if the admin exists and is an admin
-    admin_found = next((u for u in users["users"] if u["username"] == admin_user and u["role"] == "admin"), None)
-    if not admin_found:
+    admin_found = get_user(admin_user)
+    if not admin_found or admin_found["role"] != "admin":
         return jsonify({"error": "Unauthorized"}), 403  # Return 403 only if truly unauthorized
 
-    # Process the request if found
-    for req in credit_requests:
-        if req["username"] == username:
-            user_found = next((u for u in users["users"] if u["username"] == username), None)
-            if user_found:
-                if approve:
-                    user_found["credits"] += req["credits"]
-                    save_users(users)
-                    message = f"Approved {req['credits']} credits for {username}"
-                else:
-                    message = f"Denied credit request for {username}"
+    # Process the request if found (credits are added and the request removed in one transaction)
+    req = resolve_credit_request(username, approve)
+    if not req:
+        return jsonify({"error": "No credit request found"}), 404
+    get_credit_ledger().forget(username)
 
-                # Remove the processed request
-                credit_requests = [r for r in credit_requests if r["username"] != username]
-                save_credit_requests(credit_requests)
-
-                return jsonify({"message": message}), 200
-
-    return jsonify({"error": "No credit request found"}), 404
+    if approve:
+        message = f"Approved {req['credits']} credits for {username}"
+    else:
+        message = f"Denied credit request for {username}"
+    return jsonify({"message": message}), 200
 
 
 
 @credits_bp.route("/credits/deduct", methods=["POST"])
 def deduct_credit():
-    """ Deduct 1 credit per scan """
+    """ Deduct 1 credit per scan (a repeated Idempotency-Key header or "scan_id" is only charged once) """
     data = request.json
     username = data.get("username")
+    client_key = request.headers.get("Idempotency-Key") or data.get("scan_id")
 
-    users = load_users()
-    user = next((u for u in users["users"] if u["username"] == username), None)
+    # Checked and decremented in one statement and logged in the ledger, so concurrent scans cannot overdraw
+    status = get_credit_ledger().charge(username, key=scan_key(username, client_key))
 
-    if not user:
+    if status == "not_found":
         return jsonify({"error": "User not found"}), 404
 
-    if user["credits"] > 0:
-        user["credits"] -= 1
-        save_users(users)
-        
-        # Track crdit usage
-        update_credit_usage(username, 1)
-        
+    if status == "ok":
         return jsonify({"message": "Credit deducted"}), 200
+    elif status == "duplicate":
+        return jsonify({"message": "Credit already deducted for this scan"}), 200
     else:
         return jsonify({"error": "Not enough credits"}), 403
 
@@ -141,11 +79,8 @@ def deduct_credit():
 def reset_daily_credits():
     """ Reset daily credits for regular users at midnight """
     print("⏳ Resetting credits at midnight...")
-    users = load_users()
-    for user in users["users"]:
-        if user["role"] == "user":  # Admins retain 9999 credits
-            user["credits"] = 20
-    save_users(users)
+    reset_credits("user", 20)  # Admins retain 9999 credits
+    get_credit_ledger().forget()
     return jsonify({"message": "Daily credits reset"}), 200
 
 # Schedule the daily credit reset
@@ -168,10 +103,28 @@ def get_credits():
     if not username:
         return jsonify({"error": "Username is required"}), 400
 
-    # Example credit lookup (adjust based on your database)
-    users = load_users()
-    user = next((u for u in users["users"] if u["username"] == username), None)
-    user_credits = user["credits"] if user else 0
+    user_credits = get_credit_ledger().balance(username)
     
-    return jsonify({"credits": user_credits})
+    return jsonify({"credits": user_credits or 0})
+
+
+
+@credits_bp.route("/credits/transactions", methods=["GET"])
+def get_credit_history():
+    """ A user's credit ledger, newest first, paged with ?before=<smallest id seen> """
+    user = session.get("user")
+    if not user:
+        return jsonify({"error": "User not logged in"}), 401
+    username = request.args.get("username") if user.get("role") == "admin" else None
+    username = username or user["username"]
+
+    try:
+        limit = max(1, min(int(request.args.get("limit", 50)), 500))
+        before = int(request.args["before"]) if "before" in request.args else None
+    except ValueError:
+        return jsonify({"error": "limit and before must be integers"}), 400
+
+    transactions = get_credit_transactions(username, limit, before)
+    next_before = transactions[-1]["id"] if len(transactions) == limit else None
+    return jsonify({"username": username, "transactions": transactions, "next_before": next_before}), 200
 
@@ -0,0 +1,147 @@
+import json
+import time
+from flask import Blueprint, Response, request, jsonify, session
+from routes.match import read_match_options
+from routes.upload import save_upload, remove_upload
+from utils.scan_jobs import submit_scan_job, job_status
+from utils.storage import get_job, cancel_job, JOB_FINISHED
+from config import MAX_QUERY_CHARS, JOB_POLL_SECONDS
+
+jobs_bp = Blueprint("jobs", __name__)
+
+# Server-Sent Events: a comment line keeps idle proxies from closing the stream; the stream ends after SSE_MAX_SECONDS
+SSE_KEEPALIVE_SECONDS = 15
+SSE_MAX_SECONDS = 600
+
+
+def session_username():
+    user = session.get("user")
+    return user.get("username") if user else None
+
+
+def owned_job(job_id, username):
+    """The job if it belongs to username (admins see every job), else None."""
+    job = get_job(job_id)
+    if job and (job["username"] == username or session["user"].get("role") == "admin"):
+        return job
+    return None
+
+
+# Route: Queue a scan to run in the background
+@jobs_bp.route("/scan/jobs", methods=["POST"])
+def submit_job():
+    """Queue a scan of a text (JSON "text") or an uploaded "file" for one credit; returns 202 with the job ID.
+
+    Resending with the same Idempotency-Key header returns the job already queued instead of charging again.
+    """
+    username = session_username()
+    if not username:
+        return jsonify({"error": "User not logged in"}), 401
+
+    file_path = None
+    if "file" in request.files:
+        data = request.form
+        file = request.files["file"]
+        file_path, file_ext, sha256 = save_upload(file)
+        if not file_path:
+            return jsonify({"error": file_ext}), 400
+        payload = {"path": file_path, "sha256": sha256, "filename": file.filename}
+    else:
+        data = request.json or {}
+        text = (data.get("text") or "").strip()
+        if not text:
+            return jsonify({"error": "No text provided"}), 400
+        if len(text) > MAX_QUERY_CHARS:
+            return jsonify({"error": f"Text is longer than {MAX_QUERY_CHARS} characters"}), 413
+        payload = {"text": text}
+
+    options = read_match_options(data)
+    if not options:
+        status = "invalid"
+    else:
+        payload["top_k"], payload["min_score"] = options
+        status, job_id = submit_scan_job(username, payload, request.headers.get("Idempotency-Key"))
+
+    if status == "duplicate":
+        # A retried submission: report the job the first one queued
+        if file_path:
+            remove_upload(file_path)
+        job = get_job(job_id)
+        return jsonify(job_status(job) if job else {"job_id": job_id}), 200
+
+    if status != "ok":
+        if file_path:
+            remove_upload(file_path)
+        if status == "invalid":
+            return jsonify({"error": "top_k and min_score must be numbers"}), 400
+        if status == "conflict":
+            return jsonify({"error": "Idempotency-Key was already used for another request"}), 409
+        if status == "too_many":
+            return jsonify({"error": "Too many unfinished scan jobs, wait for one to finish"}), 429
+        if status == "not_found":
+            return jsonify({"error": "User not found"}), 404
+        return jsonify({"error": "Not enough credits"}), 403
+
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+
+# Route: Poll a job
+@jobs_bp.route("/scan/jobs/<job_id>", methods=["GET"])
+def get_job_status(job_id):
+    """Status of a job, with its matches once it is done."""
+    username = session_username()
+    if not username:
+        return jsonify({"error": "User not logged in"}), 401
+    job = owned_job(job_id, username)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_status(job)), 200
+
+
+# Route: Cancel a job
+@jobs_bp.route("/scan/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_scan_job(job_id):
+    """Cancel a queued or running job; its credit is refunded."""
+    username = session_username()
+    if not username:
+        return jsonify({"error": "User not logged in"}), 401
+    job = owned_job(job_id, username)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    status = cancel_job(job_id)
+    if status != "ok":
+        return jsonify({"error": f"Job already {status}"}), 409
+    if job["status"] == "queued" and job["payload"].get("path"):
+        remove_upload(job["payload"]["path"])  # A running job's upload is removed by its worker
+    return jsonify({"job_id": job_id, "status": "cancelled"}), 200
+
+
+# Route: Follow a job with Server-Sent Events
+@jobs_bp.route("/scan/jobs/<job_id>/events", methods=["GET"])
+def stream_job_events(job_id):
+    """Send a "status" event whenever the job changes, ending with its final state."""
+    username = session_username()
+    if not username:
+        return jsonify({"error": "User not logged in"}), 401
+    if not owned_job(job_id, username):
+        return jsonify({"error": "Job not found"}), 404
+
+    def generate():
+        started = last_sent = time.monotonic()
+        last_update = None
+        while time.monotonic() - started < SSE_MAX_SECONDS:
+            job = get_job(job_id)
+            if job is None:
+                return
+            if job["updated_at"] != last_update or job["status"] in JOB_FINISHED:
+                last_update, last_sent = job["updated_at"], time.monotonic()
+                yield f"event: status\ndata: {json.dumps(job_status(job))}\n\n"
+                if job["status"] in JOB_FINISHED:
+                    return
+            elif time.monotonic() - last_sent > SSE_KEEPALIVE_SECONDS:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(JOB_POLL_SECONDS)
+
+    return Response(generate(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,271 +1,510 @@
-from datetime import datetime
-from flask import Blueprint, request, jsonify, session
-import os
 import json
-import pdfplumber
-import pytesseract
-import mimetypes
-import fitz
-from PIL import Image
-from docx import Document
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from flask import Blueprint, Response, request, jsonify, session
+import threading
 import numpy as np
 from dotenv import load_dotenv
-import torch
-import faiss
-from sentence_transformers import SentenceTransformer, util
-from routes.admin import update_scan_analytics
+from utils.reference_index import ReferenceIndex
+from utils.embedding_service import EmbeddingService
+from utils.encoders import load_encoder
+from utils.extraction import get_extractor
+from utils.index_store import cached_dimension
+from utils.text_processing import chunk_spans
+from routes.upload import save_upload, remove_upload, save_extracted_text, extract_text
+from utils.storage import get_user_scans, get_scan, record_scans
+from utils.credit_ledger import get_credit_ledger, scan_key
+from utils.activity_log import get_activity_log
+from utils.event_bus import get_event_bus
+from utils.query_cache import QueryCache
+from config import (
+    MODEL_NAME, REFERENCE_DOCS_DIR, INDEX_DIR, ENCODE_BATCH_SIZE,
+    CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, POOLING, POOL_TOP_K, INDEX_CONFIG,
+    SCORE_METRIC, SCORE_THRESHOLD, DEFAULT_TOP_K, MAX_TOP_K,
+    MATCH_MODE, RRF_K, RRF_DEPTH, BM25_K1, BM25_B, LEXICAL_MAX_QUERY_TERMS,
+    NEAR_DUPLICATE_CHECK, NEAR_DUPLICATE_THRESHOLD, MINHASH_PERMUTATIONS, MINHASH_BANDS, MINHASH_SHINGLE_WORDS,
+    OVERLAP_SPANS, MAX_OVERLAP_SPANS, WINNOW_KGRAM_CHARS, WINNOW_WINDOW, QUERY_PASSAGES, MAX_QUERY_PASSAGES,
+    EMBED_MAX_WAIT_MS, EMBED_QUEUE_SIZE, EMBEDDING_BACKEND, EMBEDDING_PARITY_THRESHOLD, ONNX_DIR,
+    QUERY_CACHE_ITEMS, QUERY_CACHE_TTL, RESULT_CACHE_ITEMS, MAX_QUERY_CHARS, MAX_BATCH_ITEMS, SCAN_BATCH_CHUNK
+)
 
 match_bp = Blueprint("match", __name__)
 
-# Constants
-ACTIVITY_LOG_FILE = "./storage/activity_logs.json"
+# Page size limits for /scan/history
+DEFAULT_HISTORY_PAGE = 50
+MAX_HISTORY_PAGE = 500
 
 # Load environment variables
 load_dotenv()
 
 
-# Load Model (Moves to GPU if Available)
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model = SentenceTransformer("BAAI/bge-large-en-v1.5").to(device)
-
-# Define FAISS index
-embedding_dim = model.get_sentence_embedding_dimension()
-index = faiss.IndexFlatL2(embedding_dim)  # L2 distance (Euclidean)
-
-# Store document metadata
-doc_names = []
-doc_texts = []
-
-
-def extract_text_from_pdf(pdf_path):
-    """Extract text from a PDF file using pdfplumber and PyMuPDF."""
-    text = ""
-
-    # Try pdfplumber first
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = "\n".join([page.extract_text() for page in pdf.pages if page.extract_text()])
-    except Exception as e:
-        print(f"WARNING: pdfplumber failed for {pdf_path}, trying PyMuPDF... ({e})")
-
-    # If pdfplumber fails, try PyMuPDF
-    if not text:
-        try:
-            doc = fitz.open(pdf_path)
-            text = "\n".join([page.get_text("text") for page in doc])
-        except Exception as e:
-            print(f"ERROR: Failed to extract text from {pdf_path} using PyMuPDF! ({e})")
-
-    return text.strip()
-
-# Extract text from a plain text file
-def extract_text_from_txt(txt_path):
-    """Extract text from a plain text file."""
-    try:
-        with open(txt_path, "r", encoding="utf-8") as f:
-            return f.read().strip()
-    except Exception as e:
-        print(f"ERROR: Failed to read text file {txt_path}! ({e})")
-        return ""
-
-# Extract text from a Word document (.docx)
-def extract_text_from_docx(docx_path):
-    """Extract text from a Word document (.docx)."""
-    try:
-        doc = Document(docx_path)
-        return "\n".join([para.text for para in doc.paragraphs]).strip()
-    except Exception as e:
-        print(f"ERROR: Failed to extract text from {docx_path}! ({e})")
-        return ""
-
-# Extract text from an image using Tesseract OCR
-def extract_text_from_image(img_path):
-    """Extract text from an image using Tesseract OCR."""
-    try:
-        img = Image.open(img_path)
-        return pytesseract.image_to_string(img).strip()
-    except Exception as e:
-        print(f"ERROR: Failed to extract text from {img_path}! ({e})")
-        return ""
+# Embedding model (EMBEDDING_BACKEND) behind a micro-batching worker; cosine scoring needs unit-length vectors.
+# Nothing is loaded here: the model loads on first use or through warm_up_models()
+embedding_service = EmbeddingService(
+    load_model=lambda: load_encoder(MODEL_NAME, EMBEDDING_BACKEND, ONNX_DIR, EMBEDDING_PARITY_THRESHOLD),
+    max_batch_size=ENCODE_BATCH_SIZE,
+    max_wait_ms=EMBED_MAX_WAIT_MS,
+    normalize=SCORE_METRIC == "cosine",
+    queue_size=EMBED_QUEUE_SIZE
+)
+
+
+# Extract text from reference documents on the shared extraction process pool
+def extract_reference_text(file_path):
+    """Extract text from a reference document (PDF, text, Word or image)."""
+    return get_extractor().extract(file_path)
+
+def extract_reference_texts(file_paths):
+    """Yield (path, text) for many reference documents, extracted in parallel."""
+    return get_extractor().extract_many(file_paths)
+
+# Query embeddings and search hits of recent scans
+query_cache = QueryCache(embedding_items=QUERY_CACHE_ITEMS, embedding_ttl=QUERY_CACHE_TTL, result_items=RESULT_CACHE_ITEMS)
+
+# Split text into overlapping passages that fit the model's input window
+def token_offsets(text):
+    """Character offsets of the model tokenizer's tokens in text."""
+    encoding = embedding_service.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+    return encoding["offset_mapping"]
+
+def chunk_passages(text):
+    """Split text into overlapping token-bounded passages, returned as (start, end) spans."""
+    return chunk_spans(text, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, token_offsets=token_offsets)
+
+# Encode texts through the shared embedding worker
+def encode_texts(texts):
+    """Embed a list of texts (or a single string) with the configured normalization."""
+    return embedding_service.encode(texts)
+
+# Reference passages in an ID-mapped FAISS index (metric SCORE_METRIC, layout INDEX_CONFIG), persisted under INDEX_DIR
+reference_index = None
+reference_index_lock = threading.Lock()
+
+def get_reference_index():
+    """Create the reference index on first use.
+
+    Its dimension is read from the saved index when one exists for
+    MODEL_NAME, so opening a cached index does not wait for the model.
+    """
+    global reference_index
+    if reference_index is None:
+        with reference_index_lock:
+            if reference_index is None:
+                reference_index = ReferenceIndex(
+                    encode=encode_texts,
+                    extract=extract_reference_text,
+                    extract_many=extract_reference_texts,
+                    chunk=chunk_passages,
+                    dim=cached_dimension(INDEX_DIR, MODEL_NAME) or embedding_service.dimension,
+                    model_name=MODEL_NAME,
+                    docs_dir=REFERENCE_DOCS_DIR,
+                    index_dir=INDEX_DIR,
+                    index_config=INDEX_CONFIG,
+                    metric=SCORE_METRIC,
+                    lexical_params={"k1": BM25_K1, "b": BM25_B, "max_query_terms": LEXICAL_MAX_QUERY_TERMS},
+                    minhash_params={"num_perm": MINHASH_PERMUTATIONS, "bands": MINHASH_BANDS, "shingle_words": MINHASH_SHINGLE_WORDS},
+                    fingerprint_params={"k": WINNOW_KGRAM_CHARS, "window": WINNOW_WINDOW}
+                )
+    return reference_index
 
 # Load stored reference documents
 def load_reference_docs():
-    """Load and store reference document embeddings in FAISS."""
-    global index, doc_names, doc_texts
-
-    storage_dir = "./storage/reference_docs"
-    docs = {}
-    
-    if not os.path.exists(storage_dir):
-        print(f"ERROR: Reference documents folder {storage_dir} not found!")
-        return {}
-
-    for filename in os.listdir(storage_dir):
-        file_path = os.path.join(storage_dir, filename)
-        mime_type, _ = mimetypes.guess_type(file_path) # Get MIME type
-        text = ""
-        if mime_type:
-            if mime_type == "application/pdf":
-                text = extract_text_from_pdf(file_path)
-            elif mime_type == "text/plain":
-                text = extract_text_from_txt(file_path)
-            elif mime_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                text = extract_text_from_docx(file_path)
-            elif mime_type.startswith("image/"):
-                text = extract_text_from_image(file_path)
-        else:
-            print(f"WARNING: Unknown file type for {filename}, skipping...")
-        
-        if text:
-            docs[filename] = text
-            print(f"Extracted text from {filename}!")
-        else:
-            print(f"ERROR: Failed to extract text from {filename}!")
-    if not docs:
-        print("ERROR: No reference documents loaded!")
-        return {}
-    
-    doc_names = list(docs.keys())
-    doc_texts = list(docs.values())
-    
-    print(f"Generating embeddings for {len(doc_texts)} documents...")
-    doc_embeddings = model.encode(doc_texts, convert_to_tensor=False)
-    index.add(np.array(doc_embeddings))
-    
-    print(f"SUCCESS: Loaded {len(doc_texts)} documents into FAISS")
-    return docs
-
+    """Sync the reference index with storage/reference_docs and return {name: text}."""
+    return get_reference_index().sync()
+
+# Load the model and reference index before the first scan needs them
+def warm_up_models(mode="background"):
+    """Warm up according to mode: "background", "sync" or "off" (see MODEL_WARMUP in config.py).
+
+    "sync" only loads the model weights: it runs in the gunicorn master before
+    workers fork, where running inference first would leave torch's thread
+    pool unusable in the children.
+    """
+    if mode == "sync":
+        embedding_service.warm_up(background=False, sample=None)
+    elif mode == "background":
+        def run():
+            # A current index cache loads without the model, so lexical scans can be served while it loads
+            try:
+                load_reference_docs()
+            except Exception as e:
+                print(f"ERROR: Failed to load reference documents during warm-up! ({e})")
+            embedding_service.warm_up(background=False)
+        threading.Thread(target=run, name="warm-up", daemon=True).start()
+
+
+# Convert an index score into the percentage shown to users
+def similarity_percent(score):
+    if SCORE_METRIC == "cosine":
+        return score * 100  # Cosine similarity
+    return (1 + score) * 100  # Legacy: score is the negated L2 distance, shown as (1 - distance)
+
+# Read per-request matching options
+MATCH_MODES = ("dense", "lexical", "hybrid")
+
+def read_match_mode(data):
+    """Return the retrieval mode of a request body, or None if it is unknown."""
+    mode = data.get("mode") or MATCH_MODE
+    return mode if mode in MATCH_MODES else None
+
+def read_match_options(data):
+    """Return (top_k, min_score) from a request body, or None if they are invalid."""
+    try:
+        top_k = int(data.get("top_k", DEFAULT_TOP_K))
+        min_score = float(data.get("min_score", SCORE_THRESHOLD))
+    except (TypeError, ValueError):
+        return None
+    return max(1, min(top_k, MAX_TOP_K)), min_score
+
+
+# Merge ranked hit lists
+def fuse_rankings(rankings, top_k, k=RRF_K):
+    """Reciprocal-rank fusion: a document scores the sum of 1 / (k + rank) over the lists it is in.
+
+    The first list decides which documents can be returned and their
+    "score": each fused hit is the document's hit from that list, with the
+    fused score added as "rrf_score". The other lists only change the order.
+    """
+    fused = {hit["document"]["name"]: [0.0, hit] for hit in rankings[0]}
+    for hits in rankings:
+        for rank, hit in enumerate(hits, 1):
+            entry = fused.get(hit["document"]["name"])
+            if entry is not None:
+                entry[0] += 1 / (k + rank)
+    ranked = sorted(fused.values(), key=lambda entry: entry[0], reverse=True)
+    return [{**hit, "rrf_score": rrf_score} for rrf_score, hit in ranked[:top_k]]
+
+# Time the stages of a scan for its response
+@contextmanager
+def timed(timings, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0) + (time.perf_counter() - start) * 1000
+
+def query_passages(query_text):
+    """Return (spans, total): the query's passages, at most MAX_QUERY_PASSAGES spread evenly over it, and how many it has."""
+    spans = chunk_passages(query_text)
+    total = len(spans)
+    if total > MAX_QUERY_PASSAGES:
+        spans = [spans[n] for n in np.linspace(0, total - 1, MAX_QUERY_PASSAGES).round().astype(int).tolist()]
+    return spans, total
+
+def embed_query(query_text, report):
+    """Embeddings of a query, one row per passage; stage timings go to report["timings_ms"].
+
+    With QUERY_PASSAGES on, a query longer than one model window is split
+    into passages that are embedded in one batch, and report["query_passages"]
+    says how many were used. Otherwise the query is a single row.
+    """
+    timings = report["timings_ms"]
+    if QUERY_PASSAGES:
+        with timed(timings, "chunk"):
+            spans, total = query_passages(query_text)
+        if len(spans) > 1:
+            report["query_passages"] = {"used": len(spans), "total": total}
+            with timed(timings, "encode"):
+                return query_cache.embed_many([query_text[start:end] for start, end in spans], encode_texts)
+
+    # Repeated scans of the same text skip the forward pass
+    with timed(timings, "encode"):
+        return query_cache.embedding(query_text, encode_texts).reshape(1, -1)
+
+def dense_hits(query_embeddings, top_k, report, doc_ids=None):
+    """Dense hits for embed_query()'s embeddings, searched as passages when there are several.
+
+    doc_ids limits the search to those documents and scores each of them.
+    """
+    reference_index = get_reference_index()
+    timings = report["timings_ms"]
+    if len(query_embeddings) > 1:
+        return reference_index.search_passages(query_embeddings, top_k, pooling=POOLING, pool_k=POOL_TOP_K, timings=timings, doc_ids=doc_ids)
+
+    with timed(timings, "search"):
+        if doc_ids is not None:
+            return reference_index.search(query_embeddings, top_k, pooling=POOLING, pool_k=POOL_TOP_K, doc_ids=doc_ids)[0]
+        # The search is cached too while the corpus is unchanged
+        return query_cache.hits(
+            query_embeddings,
+            reference_index.version,
+            (top_k, POOLING, POOL_TOP_K),
+            lambda: reference_index.search(query_embeddings, top_k, pooling=POOLING, pool_k=POOL_TOP_K)[0]
+        )
+
+def lexical_hits(query_text, top_k):
+    return get_reference_index().search_lexical([query_text], top_k, pooling=POOLING, pool_k=POOL_TOP_K)[0]
+
+def as_percent(hits, to_percent):
+    return [{**hit, "score": to_percent(hit["score"])} for hit in hits]
 
 #  Match Query Text Against Reference Documents
-def match_with_faiss(query_text, top_k=3):
-    if not doc_names:
+def match_with_faiss(query_text, top_k=3, min_score=SCORE_THRESHOLD, mode=MATCH_MODE):
+    """Match a text in mode "dense", "lexical" or "hybrid" (see MATCH_MODE in config.py).
+
+    Returns {"matches", "mode"} where mode is the one actually used, plus
+    "fallback": True when a dense or hybrid scan ran lexically because the
+    embedding model is still loading. Hybrid scans rank documents by
+    reciprocal-rank fusion but score every one by its dense similarity,
+    which min_score applies to; the fused score is given as "rrf_score".
+
+    Copies of reference documents are caught first by their MinHash
+    signature: if any document's estimated Jaccard similarity reaches
+    NEAR_DUPLICATE_THRESHOLD, only those documents are returned, in mode
+    "near_duplicate" with the estimate as "jaccard", and the model is not used.
+
+    "timings_ms" gives the milliseconds spent in each stage that ran.
+    """
+    reference_index = get_reference_index()
+    reference_index.refresh()  # Pick up documents another worker added or removed (also moves the cache version on)
+    if reference_index.ntotal == 0:
         print("DEBUG: No reference documents loaded!")  # Debug log
         return {"matches": [], "error": "No reference documents available."}
 
-    query_embedding = model.encode(query_text, convert_to_tensor=False).reshape(1, -1)
-    distances, indices = index.search(query_embedding, top_k)
+    started = time.perf_counter()
+    result = {"matches": [], "mode": mode, "timings_ms": {}}
+    timings = result["timings_ms"]
+
+    if NEAR_DUPLICATE_CHECK:
+        with timed(timings, "near_duplicate"):
+            duplicates = reference_index.find_near_duplicates(query_text, NEAR_DUPLICATE_THRESHOLD, top_k)
+        duplicates = [hit for hit in as_percent(duplicates, lambda score: score * 100) if hit["score"] >= min_score]
+        if duplicates:
+            with timed(timings, "format"):
+                results = format_matches(duplicates, min_score, to_percent=lambda score: score, query_text=query_text)
+            for match, hit in zip(results, duplicates):
+                match["jaccard"] = round(hit["score"] / 100, 4)
+            result.update(matches=results, mode="near_duplicate")
+            return finish_timings(result, started)
+
+    fallback = mode != "lexical" and not embedding_service.ready
+    if fallback:
+        if embedding_service.state == "cold":
+            embedding_service.warm_up()
+        mode = "lexical"
+
+    lexical_percent = lambda score: score * 100
+    if mode == "lexical":
+        with timed(timings, "lexical"):
+            hits = as_percent(lexical_hits(query_text, top_k), lexical_percent)
+    elif mode == "dense":
+        hits = as_percent(dense_hits(embed_query(query_text, result), top_k, result), similarity_percent)
+    else:
+        depth = max(top_k, RRF_DEPTH)
+        query_embeddings = embed_query(query_text, result)
+        dense = dense_hits(query_embeddings, depth, result)
+        with timed(timings, "lexical"):
+            lexical = lexical_hits(query_text, depth)
+        # Documents only BM25 found are scored densely too, so every fused hit has a similarity on the same scale
+        found = {hit["document"]["name"] for hit in dense}
+        missing = [reference_index.ids_by_name.get(hit["document"]["name"]) for hit in lexical if hit["document"]["name"] not in found]
+        missing = [doc_id for doc_id in missing if doc_id is not None]
+        if missing:
+            dense += dense_hits(query_embeddings, len(missing), result, doc_ids=missing)
+        with timed(timings, "fuse"):
+            hits = fuse_rankings([as_percent(dense, similarity_percent), lexical], top_k)
+
+    with timed(timings, "format"):
+        results = format_matches(hits, min_score, to_percent=lambda score: score, query_text=query_text)
+    if not results:
+        print(f"DEBUG: No significant matches for '{query_text}'")  # Debug log
 
+    result.update(matches=results, mode=mode)
+    if fallback:
+        result["fallback"] = True
+    return finish_timings(result, started)
+
+def finish_timings(result, started):
+    """Add the total time to a result's timings_ms and round them all."""
+    timings = result["timings_ms"]
+    timings["total"] = (time.perf_counter() - started) * 1000
+    result["timings_ms"] = {stage: round(ms, 3) for stage, ms in timings.items()}
+    return result
+
+# Turn index hits into the match entries returned to clients
+def format_matches(hits, min_score, to_percent=similarity_percent, query_text=None):
+    """Build match entries from hits scoring at least min_score percent.
+
+    With query_text (and OVERLAP_SPANS on) each entry also gets "overlaps",
+    the character spans the query shares with the document (at most
+    MAX_OVERLAP_SPANS, longest first, shown in query order), and "coverage"
+    and "reference_coverage", the share of each text inside those spans.
+    Hits of a query searched as passages add "passage_coverage" and
+    "matched_passages" (see ReferenceIndex.search_passages).
+    """
     results = []
-    for i, idx in enumerate(indices[0]):
-        similarity_score = (1 - distances[0][i]) * 100
+    kept = []
+    for hit in hits:
+        similarity_score = to_percent(hit["score"])
 
-        if similarity_score < 2:
+        if similarity_score < min_score:
             continue  # Skip low-matching results
 
+        doc_name = hit["document"]["name"]
+        kept.append(hit)
         results.append({
-            "document_name": doc_names[idx],
+            "document_name": doc_name,
             "similarity_score": f"{similarity_score:.2f}%",
-            "document_excerpt": doc_texts[idx][:200] + "..." if len(doc_texts[idx]) > 200 else doc_texts[idx],
-            "insight": f"The document '{doc_names[idx]}' is {similarity_score:.2f}% similar to the query text."
+            "document_excerpt": hit["passage"],  # The passage that matched best
+            "insight": f"The document '{doc_name}' is {similarity_score:.2f}% similar to the query text."
         })
+        if "rrf_score" in hit:
+            results[-1]["rrf_score"] = round(hit["rrf_score"], 6)
+        if "coverage" in hit:
+            results[-1]["passage_coverage"] = round(hit["coverage"], 4)
+            results[-1]["matched_passages"] = hit["matched"]
+
+    if query_text and OVERLAP_SPANS and kept:
+        overlaps = get_reference_index().find_overlaps(query_text, [hit["document"] for hit in kept])
+        for match, overlap in zip(results, overlaps):
+            spans = sorted(overlap["spans"], key=lambda span: span[1] - span[0], reverse=True)[:MAX_OVERLAP_SPANS]
+            match["overlaps"] = [
+                {"query_start": q_start, "query_end": q_end, "reference_start": r_start, "reference_end": r_end}
+                for q_start, q_end, r_start, r_end in sorted(spans)
+            ]
+            match["coverage"] = round(overlap["coverage"], 4)
+            match["reference_coverage"] = round(overlap["reference_coverage"], 4)
+    return results
+
+#  Match many query texts at once
+def match_batch(query_texts, top_k=3, min_score=SCORE_THRESHOLD):
+    """Match a list of texts: embeddings in model-sized batches, then one multi-query search.
+
+    Returns one {"matches": [...]} per text, in order.
+    """
+    reference_index = get_reference_index()
+    reference_index.refresh()  # Pick up documents another worker added or removed (also moves the cache version on)
+    if reference_index.ntotal == 0:
+        print("DEBUG: No reference documents loaded!")  # Debug log
+        return [{"matches": [], "error": "No reference documents available."} for _ in query_texts]
 
-    if not results:
-        print(f"DEBUG: No significant matches for '{query_text}'")  # Debug log
-
-    return {"matches": results}
-
-
-
-
-
-
-
-import uuid
-def store_match_result(username, result):
-    """Save match results in a dictionary for future reference."""
-    storage_file = "./storage/scans.json"
+    query_embeddings = query_cache.embed_many(query_texts, encode_texts)
+    hits = reference_index.search(query_embeddings, top_k, pooling=POOLING, pool_k=POOL_TOP_K)
+    return [{"matches": format_matches(row, min_score, query_text=text)} for text, row in zip(query_texts, hits)]
 
-    # Ensure file exists with an empty dictionary if not present
-    if not os.path.exists(storage_file):
-        with open(storage_file, "w") as f:
-            json.dump({}, f)
 
-    # Load existing scan results
-    with open(storage_file, "r") as f:
-        try:
-            scans = json.load(f)  # Expecting a dictionary
-        except json.JSONDecodeError:
-            scans = {}  # Reset if JSON file is corrupted
-    
-    # Generate a unique key (UUID) for each entry
-    scan_id = str(uuid.uuid4())
-    scans[scan_id] = {
-        "username": username,
-        "result": result
-    }
-    
-    # Save back to the file
-    with open(storage_file, "w") as f:
-        json.dump(scans, f, indent=4)
+def persist_scan_events(events):
+    """Write a batch of completed scans: history and analytics in one transaction, then one log write."""
+    record_scans([
+        {
+            "id": event["scan_id"],
+            "username": event["username"],
+            "document_name": event["document_name"],
+            "query_text": event["query_text"],
+            "result": event["result"],
+            "created_at": event["timestamp"]
+        }
+        for event in events
+    ])
+    get_activity_log().append_many(
+        {"username": event["username"], "action": "Scanned Document", "details": event["document_name"], "timestamp": event["timestamp"]}
+        for event in events
+    )
 
 
+get_event_bus().subscribe("scan_completed", persist_scan_events)
 
 
-def get_stored_match_results(username):
-    """Fetch stored match results for a given user."""
-    storage_file = "./storage/scans.json"
 
-    try:
-        with open(storage_file, "r") as file:
-            scans = json.load(file)
-
-        # Filter entries that match the username
-        user_matches = [
-            entry["result"].get("matches", [])
-            for entry in scans.values()
-            if entry.get("username") == username
-        ]
-
-        # Flatten list of lists (if multiple scans exist)
-        return [match for sublist in user_matches for match in sublist]
-
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
-
-# Ensure storage directory and activity log file exist
-def ensure_storage():
-    """Ensure that the storage directory and activity log file exist."""
-    os.makedirs("./storage", exist_ok=True)  # Ensure the storage folder exists
-    if not os.path.exists(ACTIVITY_LOG_FILE):  # Ensure the log file exists
-        with open(ACTIVITY_LOG_FILE, "w") as f:
-            json.dump([], f, indent=4)  # Initialize as an empty JSON array
-
-def load_json(filepath):
-    """Loads a JSON file and returns its content."""
-    ensure_storage()  # Ensure directory and file exist before opening
-
-    with open(filepath, "r", encoding="utf-8") as f:
-        try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return []  # Return empty list if file is corrupted
-
-def save_json(filepath, data):
-    """Saves data to a JSON file."""
-    ensure_storage()  # Ensure directory and file exist before saving
+# Match a query and queue its bookkeeping
+def run_scan(username, query_text, top_k, min_score, mode=MATCH_MODE):
+    """Match query_text for a user and queue the scan's history, analytics and log entry; returns the result."""
+    # Ensure FAISS has reference documents loaded before matching
+    if get_reference_index().ntotal == 0:
+        print("DEBUG: FAISS index is empty! Reloading reference documents...")
+        load_reference_docs()
 
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4)
+    result = match_with_faiss(query_text, top_k=top_k, min_score=min_score, mode=mode)
+    queue_scan_event(username, query_text, result)
+    return result
 
-def log_user_activity(username, action, details=""):
-    """Log user actions like scans and credit requests."""
-    logs = load_json(ACTIVITY_LOG_FILE)
+def queue_scan_event(username, query_text, result):
+    """Hand a finished scan to the event worker, which writes history, analytics and the activity log."""
+    # Extract document name from the first match (if exists)
+    matches = result.get("matches", [])
+    document_name = matches[0].get("document_name", "Unknown Document") if matches else "Unknown Document"
 
-    logs.append({
+    get_event_bus().emit("scan_completed", {
+        "scan_id": str(uuid.uuid4()),
         "username": username,
-        "action": action,
-        "details": details,
+        "query_text": query_text,
+        "document_name": document_name,
+        "result": result,
         "timestamp": datetime.now().isoformat()
     })
 
-    save_json(ACTIVITY_LOG_FILE, logs)  # Save updated logs
+# Batch scans (Python API behind /scan/batch)
+def scan_batch(username, items, top_k=DEFAULT_TOP_K, min_score=SCORE_THRESHOLD, chunk_size=SCAN_BATCH_CHUNK, key=None):
+    """Scan many documents for a user, one credit each.
+
+    items are dicts with a "text", or a "path" (plus optional "sha256") of a
+    file to extract, and an optional "id" echoed back. All credits are taken
+    in one statement before anything runs; items that fail are refunded
+    together at the end. key is the batch's idempotency key (see
+    utils/credit_ledger.py). Returns (status, results): status is "ok",
+    "duplicate", "insufficient" or "not_found", and results (None unless "ok") is a
+    generator yielding {"index", "id", "matches"} or {"index", "id", "error"}
+    per item in order, then {"done": True, "scanned", "failed", "credits"}.
+    Items are processed chunk_size at a time: files in a chunk are extracted
+    in parallel, their texts embedded in model-sized batches and searched
+    with one multi-query search.
+    """
+    items = list(items)
+    key = key or scan_key(username)
+    ledger = get_credit_ledger()
+    status = ledger.charge(username, len(items), key) if items else "ok"
+    if status != "ok":
+        return status, None
+
+    def results():
+        if items and get_reference_index().ntotal == 0:
+            load_reference_docs()
+
+        scanned = failed = 0
+        try:
+            for first in range(0, len(items), chunk_size):
+                chunk = items[first:first + chunk_size]
+                texts = [(item.get("text") or "").strip()[:MAX_QUERY_CHARS] for item in chunk]
+
+                files = [position for position, item in enumerate(chunk) if item.get("path")]
+                extracted = get_extractor().extract_many(
+                    [chunk[position]["path"] for position in files],
+                    [chunk[position].get("sha256") for position in files]
+                )
+                for position, (_, text) in zip(files, extracted):
+                    texts[position] = text[:MAX_QUERY_CHARS]
+
+                valid = [position for position, text in enumerate(texts) if text]
+                matched = dict(zip(valid, match_batch([texts[position] for position in valid], top_k, min_score))) if valid else {}
+
+                for position, item in enumerate(chunk):
+                    entry = {"index": first + position, "id": item.get("id")}
+                    if position in matched:
+                        queue_scan_event(username, texts[position], matched[position])
+                        entry["matches"] = matched[position]["matches"]
+                        scanned += 1
+                    else:
+                        entry["error"] = item.get("error") or ("Failed to extract text" if item.get("path") else "No text provided")
+                        failed += 1
+                    yield entry
+        finally:
+            # Everything not scanned, including items never reached when the client went away, is refunded
+            unscanned = len(items) - scanned
+            if unscanned:
+                ledger.refund(username, unscanned, key)
+
+        yield {"done": True, "scanned": scanned, "failed": failed, "credits": ledger.balance(username)}
+
+    return status, results()
 
 
 
 # Route: Match extracted text with stored documents
 @match_bp.route("/scan/match", methods=["POST"])
 def match_text():
-    """Matches extracted text against stored reference documents."""
+    """Matches extracted text against stored reference documents ("mode": dense, lexical or hybrid)."""
     data = request.json
     query_text = data.get("text", "").strip()
 
@@ -277,60 +516,237 @@ def match_text():
 
     if not query_text:
         return jsonify({"error": "No text provided"}), 400
+    if len(query_text) > MAX_QUERY_CHARS:
+        return jsonify({"error": f"Text is longer than {MAX_QUERY_CHARS} characters"}), 413
+
+    options = read_match_options(data)
+    if not options:
+        return jsonify({"error": "top_k and min_score must be numbers"}), 400
+    top_k, min_score = options
+    mode = read_match_mode(data)
+    if not mode:
+        return jsonify({"error": f"mode must be one of {', '.join(MATCH_MODES)}"}), 400
+
+    # Only this scan's matches: earlier scans are paged through /scan/history
+    result = run_scan(username, query_text, top_k, min_score, mode)
+
+    response = {"matches": result.get("matches", []), "mode": result.get("mode", mode)}
+    for field in ("fallback", "query_passages", "timings_ms"):
+        if result.get(field):
+            response[field] = result[field]
+    return jsonify(response)
+
+
+
+# Route: Upload, extract, match and charge in one request
+@match_bp.route("/scan/file", methods=["POST"])
+def scan_file():
+    """Scan an uploaded file for one credit, streaming progress as NDJSON lines.
+
+    Lines carry a "stage": "uploaded", "extracted", then "matched" (with the
+    matches and remaining credits) or "error". The credit is taken before the
+    scan starts and given back if extraction or matching fails.
+    """
+    user_data = session.get("user")
+    if not user_data:
+        return jsonify({"error": "User not logged in"}), 401
+    username = user_data.get("username", "guest_user")
+
+    if "file" not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    options = read_match_options(request.form)
+    if not options:
+        return jsonify({"error": "top_k and min_score must be numbers"}), 400
+    top_k, min_score = options
+
+    file = request.files["file"]
+    file_path, file_ext, sha256 = save_upload(file)
+    if not file_path:
+        return jsonify({"error": file_ext}), 400
+
+    # Checked and decremented in one statement, so concurrent scans cannot overdraw; a retried request
+    # with the same Idempotency-Key header is not charged twice
+    ledger = get_credit_ledger()
+    key = scan_key(username, request.headers.get("Idempotency-Key"))
+    status = ledger.charge(username, key=key)
+    if status != "ok":
+        remove_upload(file_path)
+        if status == "not_found":
+            return jsonify({"error": "User not found"}), 404
+        if status == "duplicate":
+            return jsonify({"error": "This scan was already submitted"}), 409
+        return jsonify({"error": "Not enough credits"}), 403
+
+    filename = file.filename
+
+    def generate():
+        yield json.dumps({"stage": "uploaded", "filename": filename}) + "\n"
+        try:
+            # Extraction stops (cancelling the remaining pages) at MAX_QUERY_CHARS, so a long file is never
+            # extracted or held whole; the capped text is then chunked into passages like any query
+            try:
+                extracted_text = extract_text(file_path, sha256=sha256, max_chars=MAX_QUERY_CHARS)
+            finally:
+                remove_upload(file_path)
+            if not extracted_text:
+                raise ValueError("Failed to extract text")
+            save_extracted_text(filename, extracted_text)
+            yield json.dumps({"stage": "extracted", "characters": len(extracted_text), "preview": extracted_text[:500]}) + "\n"
+
+            result = run_scan(username, extracted_text, top_k, min_score)
+        except Exception as e:
+            ledger.refund(username, 1, key)  # The scan did not happen
+            print(f"ERROR: Scanning {filename} for {username} failed! ({e})")
+            yield json.dumps({"stage": "error", "error": str(e)}) + "\n"
+            return
+
+        matched = {"stage": "matched", "matches": result.get("matches", []), "credits": ledger.balance(username)}
+        for field in ("mode", "query_passages", "timings_ms"):
+            if result.get(field):
+                matched[field] = result[field]
+        yield json.dumps(matched) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+
+# Route: Scan many texts or files in one request
+@match_bp.route("/scan/batch", methods=["POST"])
+def scan_batch_route():
+    """Scan up to MAX_BATCH_ITEMS documents for one credit each, streaming one NDJSON line per item.
+
+    Send JSON {"texts": [...]} or {"items": [{"id", "text"}]}, or a
+    multipart form with several "files". The last line is a summary with
+    the number scanned and the remaining credits.
+    """
+    user_data = session.get("user")
+    if not user_data:
+        return jsonify({"error": "User not logged in"}), 401
+    username = user_data.get("username", "guest_user")
+
+    if request.files:
+        data = request.form
+        uploads = request.files.getlist("files")
+        if len(uploads) > MAX_BATCH_ITEMS:
+            return jsonify({"error": f"At most {MAX_BATCH_ITEMS} items per batch"}), 400
+        items = []
+        for file in uploads:
+            file_path, file_ext, sha256 = save_upload(file)
+            if file_path:
+                items.append({"id": file.filename, "path": file_path, "sha256": sha256})
+            else:
+                items.append({"id": file.filename, "error": file_ext})  # Reported (and refunded) in its result line
+    else:
+        data = request.json or {}
+        items = data.get("items")
+        if items is None:
+            items = [{"text": text} for text in data.get("texts") or []]
+        if not isinstance(items, list) or not all(isinstance(item, dict) and isinstance(item.get("text", ""), str) for item in items):
+            return jsonify({"error": "items must be a list of {\"id\", \"text\"} objects"}), 400
+        items = [{"id": item.get("id"), "text": item.get("text", "")} for item in items]
+        if len(items) > MAX_BATCH_ITEMS:
+            return jsonify({"error": f"At most {MAX_BATCH_ITEMS} items per batch"}), 400
+
+    uploaded = [item["path"] for item in items if item.get("path")]
+    if not items:
+        return jsonify({"error": "No texts or files provided"}), 400
+
+    options = read_match_options(data)
+    key = scan_key(username, request.headers.get("Idempotency-Key"))
+    status, results = scan_batch(username, items, *options, key=key) if options else ("invalid", None)
+    if status != "ok":
+        for file_path in uploaded:
+            remove_upload(file_path)
+        if status == "invalid":
+            return jsonify({"error": "top_k and min_score must be numbers"}), 400
+        if status == "not_found":
+            return jsonify({"error": "User not found"}), 404
+        if status == "duplicate":
+            return jsonify({"error": "This batch was already submitted"}), 409
+        return jsonify({"error": f"Not enough credits for {len(items)} scans"}), 403
+
+    def generate():
+        try:
+            for entry in results:
+                yield json.dumps(entry) + "\n"
+        finally:
+            results.close()  # Refunds whatever was not scanned if the client went away
+            for file_path in uploaded:
+                remove_upload(file_path)
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+
+@match_bp.route("/scan/metrics", methods=["GET"])
+def get_scan_metrics():
+    """Expose embedding throughput, latency histograms, event queue, extraction and query cache counters."""
+    return jsonify({
+        "embedding": embedding_service.metrics(),
+        "events": get_event_bus().metrics(),
+        "extraction": get_extractor().metrics(),
+        "query_cache": query_cache.metrics()
+    })
 
-     # Ensure FAISS has reference documents loaded before matching
-    if index.ntotal == 0:
-        print("DEBUG: FAISS index is empty! Reloading reference documents...")
-        load_reference_docs()
-    
-    # reference_docs = load_reference_docs()
-    result = match_with_faiss(query_text, top_k=2)
-    
-    # Extract document name from the first match (if exists)
-    best_match = result.get("matches", [{}])[0]
-    document_name = best_match.get("document_name", "Unknown Document")
-    
-    # Update Analytics
-    update_scan_analytics(username, query_text, document_name)
-    
-    # Log a document scan
-    log_user_activity(username, "Scanned Document", document_name)  
-    
-    store_match_result(username, result)
-    stored_results = get_stored_match_results(username)
 
-    return jsonify({"matches": stored_results})
+
+@match_bp.route("/scan/ready", methods=["GET"])
+def get_readiness():
+    """Readiness probe: 200 once the embedding model is loaded, 503 while it is still loading."""
+    status = embedding_service.status()
+    status["reference_documents"] = reference_index.document_count if reference_index else None
+    return jsonify(status), 200 if status["ready"] else 503
 
 
 
 @match_bp.route("/scan/history", methods=["GET"])
 def get_scan_history():
-    """Fetch past scan history for the logged-in user."""
+    """Fetch past scan history for the logged-in user, newest first, one page at a time.
+
+    ?limit= sets the page size (up to MAX_HISTORY_PAGE), ?cursor= takes the
+    "next_cursor" of the previous page and ?view=summary returns match counts
+    and best scores instead of full results.
+    """
     username = request.args.get("username", "")
 
     if not username:
         return jsonify({"error": "Username is required"}), 400
 
-    storage_file = "./storage/scans.json"
-    if not os.path.exists(storage_file):
-        return jsonify({"history": []})
-
-    with open(storage_file, "r") as f:
-        scans = json.load(f)
+    summary = request.args.get("view") == "summary"
+    try:
+        limit = max(1, min(int(request.args.get("limit", DEFAULT_HISTORY_PAGE)), MAX_HISTORY_PAGE))
+        scans, next_cursor = get_user_scans(username, limit, request.args.get("cursor"), summary)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer and cursor one returned by this endpoint"}), 400
 
     user_scans = []
-    for scan_id, scan_data in scans.items():
-        if scan_data.get("username") == username:
-            matches = scan_data.get("result", {}).get("matches", [])
-            
-            # Extract document name from the first match (if exists)
-            document_name = matches[0].get("document_name", "Unknown Document") if matches else "Unknown Document"
-            
-            user_scans.append({
-                "id": scan_id,
-                "document_name": document_name,  # Use extracted document_name
-                "result": scan_data.get("result", "No match found")
-            })
-
-    return jsonify({"history": user_scans})
+    for scan in scans:
+        entry = {
+            "id": scan["id"],
+            "document_name": scan["document_name"] or "Unknown Document",
+            "created_at": scan["created_at"]
+        }
+        if summary:
+            entry.update(match_count=scan["match_count"], top_score=scan["top_score"])
+        else:
+            entry["result"] = scan["result"]
+        user_scans.append(entry)
+
+    return jsonify({"history": user_scans, "next_cursor": next_cursor})
+
+
+
+@match_bp.route("/scan/history/<scan_id>", methods=["GET"])
+def get_scan_details(scan_id):
+    """Fetch one of the logged-in user's past scans with its full result."""
+    user_data = session.get("user")
+    if not user_data:
+        return jsonify({"error": "User not logged in"}), 401
+
+    scan = get_scan(scan_id)
+    # Another user's scan is reported as missing, so scan ids cannot be probed
+    if not scan or scan["username"] != user_data.get("username"):
+        return jsonify({"error": "Scan not found"}), 404
+    return jsonify(scan)
 
@@ -1,18 +1,17 @@
 import os
 import json
-import pdfplumber
-import pytesseract
-from docx import Document
-from PIL import Image
+import hashlib
+import tempfile
 from flask import Blueprint, request, jsonify
+from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
+from utils.extraction import get_extractor, pdf_page_count
+from config import UPLOAD_LIMITS, UPLOAD_MAX_PDF_PAGES, MAX_QUERY_CHARS
 
 upload_bp = Blueprint("upload", __name__)
 
 # Load environment variables
 load_dotenv()
-TESSERACT_PATH = os.getenv("TESSERACT_PATH", "C:/Program Files/Tesseract-OCR/tesseract.exe")  # Update path for Windows if needed
-pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
 
 # Define storage paths
 UPLOAD_DIR = "./storage/uploads/"
@@ -23,31 +22,79 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(TEXT_STORAGE_DIR, exist_ok=True)
 
 # Function to extract text from different file types
-def extract_text(file_path, file_ext):
-    """Extracts text from .txt, .pdf, .docx, and image files."""
-    extracted_text = ""
+def extract_text(file_path, file_ext=None, sha256=None, max_chars=None):
+    """Extracts text from .txt, .pdf, .docx, and image files (on the extraction process pool).
+
+    With max_chars, extraction stops (and the remaining pages are cancelled)
+    once that many characters are in.
+    """
+    if max_chars:
+        pieces = get_extractor().iter_text(file_path, sha256, max_chars=max_chars)
+        extracted_text = "\n".join(pieces).strip()[:max_chars]  # The joining newlines count too
+    else:
+        extracted_text = get_extractor().extract(file_path, sha256)
+    return extracted_text or None
+
+# Supported upload types and their size limits
+ALLOWED_TYPES = set(UPLOAD_LIMITS)
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+def save_upload(file):
+    """Stream an upload to a temp file in chunks, hashing it on the way.
+
+    Returns (file_path, file_ext, sha256), or (None, error message, None)
+    when the file is missing, of an unsupported type or over its type's
+    size or page limit. The caller removes the file once it is extracted.
+    """
+    if file.filename == "":
+        return None, "Empty filename", None
 
+    # Get file extension
+    file_ext = file.filename.rsplit(".", 1)[-1].lower()
+    if file_ext not in ALLOWED_TYPES:
+        return None, f"Unsupported file type: {file_ext}", None
+
+    # Never write to a path built from the client's filename
+    limit = UPLOAD_LIMITS[file_ext]
+    digest = hashlib.sha256()
+    size = 0
+    fd, file_path = tempfile.mkstemp(suffix="." + file_ext, dir=UPLOAD_DIR)
+    with os.fdopen(fd, "wb") as f:
+        for block in iter(lambda: file.stream.read(UPLOAD_CHUNK_BYTES), b""):
+            size += len(block)
+            if size > limit:
+                break
+            digest.update(block)
+            f.write(block)
+
+    error = None
+    if size > limit:
+        error = f"File too large: {file_ext} uploads are limited to {limit // (1024 * 1024)} MB"
+    elif file_ext == "pdf":
+        try:
+            pages = pdf_page_count(file_path)
+        except Exception:
+            pages = 0  # Unreadable by PyMuPDF: extraction will try pdfplumber
+        if pages > UPLOAD_MAX_PDF_PAGES:
+            error = f"PDF has {pages} pages, the limit is {UPLOAD_MAX_PDF_PAGES}"
+
+    if error:
+        remove_upload(file_path)
+        return None, error, None
+    return file_path, file_ext, digest.hexdigest()
+
+def remove_upload(file_path):
     try:
-        if file_ext == "txt":
-            with open(file_path, "r", encoding="utf-8") as f:
-                extracted_text = f.read()
-
-        elif file_ext == "pdf":
-            with pdfplumber.open(file_path) as pdf:
-                extracted_text = "\n".join(page.extract_text() or "" for page in pdf.pages)
-
-        elif file_ext == "docx":
-            doc = Document(file_path)
-            extracted_text = "\n".join(para.text for para in doc.paragraphs)
+        os.remove(file_path)
+    except OSError:
+        pass
 
-        elif file_ext in ["jpg", "png"]:
-            extracted_text = pytesseract.image_to_string(Image.open(file_path))
-
-        return extracted_text.strip() if extracted_text else None
-
-    except Exception as e:
-        print(f"Error extracting text from {file_path}: {e}")
-        return None
+def save_extracted_text(filename, extracted_text):
+    """Save extracted text to storage and return its path."""
+    text_file_path = os.path.join(TEXT_STORAGE_DIR, secure_filename(filename) + ".txt")
+    with open(text_file_path, "w", encoding="utf-8") as f:
+        f.write(extracted_text)
+    return text_file_path
 
 # Route: Handle file uploads
 @upload_bp.route("/upload", methods=["POST"])
@@ -57,29 +104,20 @@ def upload_file():
         return jsonify({"error": "No file uploaded"}), 400
 
     file = request.files["file"]
-    if file.filename == "":
-        return jsonify({"error": "Empty filename"}), 400
-
-    # Get file extension
-    file_ext = file.filename.rsplit(".", 1)[-1].lower()
-    allowed_types = {"txt", "pdf", "docx", "jpg", "png"}
-
-    if file_ext not in allowed_types:
-        return jsonify({"error": f"Unsupported file type: {file_ext}"}), 400
+    file_path, file_ext, sha256 = save_upload(file)
+    if not file_path:
+        return jsonify({"error": file_ext}), 400
 
-    # Save file temporarily
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    file.save(file_path)
-
-    # Extract text
-    extracted_text = extract_text(file_path, file_ext)
+    # Extract text (served from the extraction cache when the same bytes were uploaded before),
+    # no more than a scan would read
+    try:
+        extracted_text = extract_text(file_path, file_ext, sha256, max_chars=MAX_QUERY_CHARS)
+    finally:
+        remove_upload(file_path)
     if not extracted_text:
         return jsonify({"error": "Failed to extract text"}), 400
 
-    # Save extracted text to storage
-    text_file_path = os.path.join(TEXT_STORAGE_DIR, file.filename + ".txt")
-    with open(text_file_path, "w", encoding="utf-8") as f:
-        f.write(extracted_text)
+    text_file_path = save_extracted_text(file.filename, extracted_text)
 
     return jsonify({
         "message": "File uploaded successfully",
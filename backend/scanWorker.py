@@ -0,0 +1,34 @@
+"""Run the scan job workers: processes that take queued /scan/jobs from the database and match them.
+
+The model is loaded once here and shared copy-on-write by the forked
+workers. Run from the backend folder next to the web server, e.g.:
+    python scanWorker.py --workers 4
+"""
+import argparse
+import signal
+from config import JOB_WORKERS
+from routes.match import warm_up_models
+from utils.scan_jobs import start_workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS)
+    args = parser.parse_args()
+
+    # Weights only, no inference before fork (see warm_up_models)
+    warm_up_models("sync")
+    processes, stop = start_workers(args.workers)
+
+    def shutdown(signum, frame):
+        print("Stopping scan workers after their current jobs...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+# Tests import modules the way the app does (from the backend folder) and use throwaway storage.
+# The paths must be set before config.py is first imported.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_storage = tempfile.mkdtemp(prefix="docmatch-tests-")
+os.environ["DATABASE_PATH"] = os.path.join(_storage, "app.db")
+os.environ["ACTIVITY_LOG_DIR"] = os.path.join(_storage, "activity_logs")
+os.environ["EXTRACT_CACHE_DIR"] = os.path.join(_storage, "extract_cache")
+os.environ["INDEX_DIR"] = os.path.join(_storage, "faiss_index")
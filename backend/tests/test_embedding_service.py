@@ -0,0 +1,37 @@
+import numpy as np
+from utils.embedding_service import EmbeddingService
+
+DIM = 4
+
+
+class FakeModel:
+    def __init__(self):
+        self.batches = []
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+    def encode(self, texts, batch_size, convert_to_tensor, normalize_embeddings):
+        self.batches.append(len(texts))
+        return np.array([[float(text), 0, 0, 0] for text in texts], dtype="float32")
+
+
+def test_batches_never_exceed_max_batch_size():
+    model = FakeModel()
+    service = EmbeddingService(lambda: model, max_batch_size=32, max_wait_ms=200)
+    requests = [[str(n) for n in range(first, first + size)] for first, size in ((0, 20), (20, 20), (40, 5))]
+    futures = [service.submit(texts) for texts in requests]
+
+    for texts, future in zip(requests, futures):
+        assert future.result(timeout=5)[:, 0].tolist() == [float(text) for text in texts]
+    assert model.batches == [20, 25]  # The second request did not fit the first batch and led the next
+
+
+def test_encoding_nothing_does_not_load_the_model():
+    loads = []
+    service = EmbeddingService(lambda: loads.append(1) or FakeModel())
+    assert service.encode([]).shape[0] == 0
+    assert not loads and not service.ready
+
+    service.warm_up(background=False, sample=None)
+    assert service.encode([]).shape == (0, DIM)
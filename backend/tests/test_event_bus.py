@@ -0,0 +1,48 @@
+from utils.event_bus import EventBus
+
+
+def test_failed_batch_is_retried():
+    seen, calls = [], []
+
+    def flaky(payloads):
+        calls.append(list(payloads))
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        seen.extend(payloads)
+
+    bus = EventBus(run_async=False)
+    bus.subscribe("scan_completed", flaky)
+    bus._dispatch([("scan_completed", 1), ("scan_completed", 2)])
+
+    assert seen == [1, 2]
+    assert bus.metrics()["handler_retries"] == 1
+    assert bus.metrics()["handler_errors"] == 0
+
+
+def test_bad_event_does_not_drop_the_rest():
+    seen = []
+
+    def handler(payloads):
+        if "bad" in payloads:
+            raise ValueError("cannot store this one")
+        seen.extend(payloads)
+
+    bus = EventBus(run_async=False)
+    bus.subscribe("scan_completed", handler)
+    bus._dispatch([("scan_completed", payload) for payload in ("a", "bad", "b")])
+
+    assert seen == ["a", "b"]
+    assert bus.metrics()["handler_errors"] == 1
+    assert bus.metrics()["processed"] == 3
+
+
+def test_queued_events_are_handled_in_batches():
+    batches = []
+    bus = EventBus(max_batch=4, max_wait_ms=50)
+    bus.subscribe("scan_completed", batches.append)
+    for payload in range(10):
+        bus.emit("scan_completed", payload)
+    bus.close()
+
+    assert sorted(payload for batch in batches for payload in batch) == list(range(10))
+    assert max(len(batch) for batch in batches) <= 4
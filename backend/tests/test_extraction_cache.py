@@ -0,0 +1,13 @@
+from utils.extraction_cache import ExtractionCache
+
+
+def test_rewriting_a_key_counts_its_bytes_once(tmp_path):
+    cache = ExtractionCache(str(tmp_path), version=1)
+    cache.put("a" * 64, "first text")
+    cache.put("b" * 64, "other text")
+    for _ in range(5):
+        cache.put("a" * 64, "first text, extracted again and a little longer")
+
+    on_disk = sum(size for _, size, _ in cache._entries())
+    assert cache.metrics()["disk_bytes"] == on_disk
+    assert cache.get("a" * 64) == "first text, extracted again and a little longer"
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+from utils.index_factory import INDEX_MODES, min_training_points
+from utils.reference_index import ReferenceIndex, PASSAGE_ID_BITS
+
+DIM = 8
+PASSAGE_CHARS = 20
+
+# Small enough that every trainable layout gets trained on a few documents
+CONFIG = {"nlist": 2, "nprobe": 2, "hnsw_m": 8, "ef_construction": 40, "ef_search": 16, "pq_m": 2}
+
+
+def encode(texts):
+    vectors = np.random.default_rng(len(texts)).standard_normal((len(texts), DIM)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def chunk(text):
+    return [(start, min(start + PASSAGE_CHARS, len(text))) for start in range(0, len(text), PASSAGE_CHARS)]
+
+
+def make_index(tmp_path, mode):
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir(exist_ok=True)
+    return ReferenceIndex(
+        encode=encode,
+        extract=lambda path: open(path, encoding="utf-8").read(),
+        chunk=chunk,
+        dim=DIM,
+        model_name="test-model",
+        docs_dir=str(docs_dir),
+        index_dir=str(tmp_path / "index"),
+        index_config={**CONFIG, "mode": mode}
+    )
+
+
+def add_documents(index, tmp_path, count, passages):
+    for number in range(count):
+        path = tmp_path / "docs" / f"doc{number}.txt"
+        path.write_text(f"doc{number:03d} text " * (passages * PASSAGE_CHARS // 12), encoding="utf-8")
+        index.add_document(str(path))
+
+
+@pytest.mark.parametrize("mode", sorted(INDEX_MODES))
+def test_remove_several_documents(tmp_path, mode):
+    index = make_index(tmp_path, mode)
+    count = 6
+    # Enough passages for the layout to be trained before the removals
+    passages = max(50, min_training_points(index.index_config) // count + 1)
+    add_documents(index, tmp_path, count, passages)
+    assert index.layout == index.target_layout
+
+    for number in range(3):
+        assert index.remove_document(f"doc{number}.txt")
+    assert not index.remove_document("doc0.txt")
+
+    left = {f"doc{number}.txt" for number in range(3, count)}
+    assert set(index.documents()) == left
+    found = {hit["document"]["name"] for hit in index.search(encode(["query"]), top_k=count)[0]}
+    assert found <= left
+
+    vectors, ids = index._live_vectors()
+    assert len(vectors) == len(ids) == index.ntotal
+    assert set((ids >> PASSAGE_ID_BITS).tolist()) == {index.ids_by_name[name] for name in left}
+
+
+@pytest.mark.parametrize("mode", ["flat", "ivf_flat", "hnsw"])
+def test_remove_after_reload(tmp_path, mode):
+    index = make_index(tmp_path, mode)
+    add_documents(index, tmp_path, 4, max(50, min_training_points(index.index_config) // 4 + 1))
+
+    reloaded = make_index(tmp_path, mode)
+    reloaded._load_cache()
+    reloaded.remove_document("doc1.txt")
+    reloaded.remove_document("doc2.txt")
+    assert set(reloaded.documents()) == {"doc0.txt", "doc3.txt"}
+
+
+
+def test_instances_sharing_a_cache_see_each_others_changes(tmp_path):
+    # Two gunicorn workers: each keeps its own index over one index_dir
+    first, second = make_index(tmp_path, "flat"), make_index(tmp_path, "flat")
+    add_documents(first, tmp_path, 2, passages=3)
+    assert set(second.documents()) == {"doc0.txt", "doc1.txt"}
+
+    version = second.version
+    assert second.remove_document("doc0.txt")
+    assert second.version > version
+    path = tmp_path / "docs" / "late.txt"
+    path.write_text("late arrival " * 10, encoding="utf-8")
+    first.add_document(str(path))  # Must build on the removal, not overwrite it
+
+    for index in (first, second, make_index(tmp_path, "flat")):
+        assert set(index.documents()) == {"doc1.txt", "late.txt"}
+        found = {hit["document"]["name"] for hit in index.search(encode(["query"]), top_k=5)[0]}
+        assert found == {"doc1.txt", "late.txt"}
+    assert not second.refresh()  # Nothing new since
+
+
+def test_cache_with_a_wordless_document_loads_without_rebuilding(tmp_path):
+    index = make_index(tmp_path, "flat")
+    add_documents(index, tmp_path, 1, passages=3)
+    path = tmp_path / "docs" / "symbols.txt"
+    path.write_text("!?* -- " * 20, encoding="utf-8")  # Passages, but no word to shingle
+    index.add_document(str(path))
+
+    reloaded = make_index(tmp_path, "flat")
+    assert reloaded._load_cache() is False
+    assert reloaded.minhash.doc_ids() == set(reloaded.docs)
+    (tmp_path / "empty").mkdir()
+    assert make_index(tmp_path / "empty", "flat")._load_cache() is False  # Nothing saved there
@@ -0,0 +1,53 @@
+import uuid
+import pytest
+from flask import Flask
+from routes.match import match_bp
+from utils.storage import record_scans
+
+
+@pytest.fixture
+def client():
+    # The scan blueprint alone, on Flask's signed-cookie sessions
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.register_blueprint(match_bp)
+    return app.test_client()
+
+
+def log_in(client, username):
+    with client.session_transaction() as session:
+        session["user"] = {"username": username, "role": "user"}
+
+
+@pytest.fixture
+def scan():
+    scan = {
+        "id": str(uuid.uuid4()),
+        "username": f"owner-{uuid.uuid4().hex[:12]}",
+        "document_name": "doc.txt",
+        "query_text": "some text",
+        "result": {"matches": [{"document_name": "doc.txt", "similarity_score": "90.00%"}]},
+        "created_at": "2026-01-01T00:00:00"
+    }
+    record_scans([scan])
+    return scan
+
+
+def test_owner_reads_their_scan(client, scan):
+    log_in(client, scan["username"])
+    response = client.get(f"/scan/history/{scan['id']}")
+    assert response.status_code == 200
+    assert response.json["result"] == scan["result"]
+
+
+def test_other_user_cannot_read_the_scan(client, scan):
+    log_in(client, "someone-else")
+    # Naming the owner in the query string must not help
+    response = client.get(f"/scan/history/{scan['id']}?username={scan['username']}")
+    assert response.status_code == 404
+    assert "result" not in response.json
+
+
+def test_anonymous_request_is_refused(client, scan):
+    response = client.get(f"/scan/history/{scan['id']}?username={scan['username']}")
+    assert response.status_code == 401
@@ -0,0 +1,32 @@
+import threading
+import uuid
+from utils import event_bus, scan_jobs
+from utils.event_bus import EventBus
+from utils.storage import create_user, get_job, get_user_scans
+
+
+def test_job_finished_before_shutdown_keeps_its_history(monkeypatch):
+    from routes.match import persist_scan_events
+
+    # A bus that holds events back long after the worker stops, as a busy one would
+    bus = EventBus(max_wait_ms=60000)
+    bus.subscribe("scan_completed", persist_scan_events)
+    monkeypatch.setattr(event_bus, "_event_bus", bus)
+
+    username = f"test-{uuid.uuid4().hex[:12]}"
+    create_user(username, "hash", "user", 3)
+    status, job_id = scan_jobs.submit_scan_job(username, {"text": "some text", "top_k": 2, "min_score": 0})
+    assert status == "ok"
+
+    stop = threading.Event()
+
+    def run_job(job):
+        stop.set()  # Shutdown is requested while the job runs
+        return "some text", {"matches": [{"document_name": "doc.txt", "similarity_score": "90.00%"}]}
+
+    monkeypatch.setattr(scan_jobs, "run_job", run_job)
+    scan_jobs.run_worker(stop, worker="test-worker")
+
+    assert get_job(job_id)["status"] == "done"
+    scans, _ = get_user_scans(username)
+    assert [scan["document_name"] for scan in scans] == ["doc.txt"]
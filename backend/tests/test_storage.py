@@ -0,0 +1,146 @@
+import uuid
+import pytest
+from utils.credit_ledger import CreditLedger, scan_key, job_key
+from utils.storage import (
+    create_user, get_user, create_job, claim_job, complete_job, fail_job, cancel_job, get_job, record_scans,
+    get_user_scans
+)
+
+
+@pytest.fixture
+def username():
+    name = f"test-{uuid.uuid4().hex[:12]}"
+    assert create_user(name, "hash", "user", 3)
+    return name
+
+
+def credits(username):
+    return get_user(username)["credits"]
+
+
+# Credits
+def test_charge_and_refund_are_applied_once_per_key(username):
+    ledger = CreditLedger()
+    key = scan_key(username, "retry-me")
+
+    assert ledger.charge(username, key=key) == "ok"
+    assert ledger.charge(username, key=key) == "duplicate"
+    assert credits(username) == 2
+
+    assert ledger.refund(username, 1, key) == "ok"
+    assert ledger.refund(username, 1, key) == "duplicate"
+    assert credits(username) == 3
+    assert ledger.balance(username) == 3
+
+
+def test_charge_never_overdraws(username):
+    ledger = CreditLedger()
+    statuses = [ledger.charge(username, key=scan_key(username)) for _ in range(5)]
+
+    assert statuses == ["ok"] * 3 + ["insufficient"] * 2
+    assert credits(username) == 0
+    assert ledger.charge("nobody-" + username, key=scan_key(username)) == "not_found"
+
+
+# Scan jobs
+def queue(username, key=None, max_attempts=2):
+    return create_job(username, {"text": "some text"}, max_pending=10, max_attempts=max_attempts, key=key)
+
+
+def test_job_key_returns_the_queued_job(username):
+    status, job_id = queue(username, job_key(username, "once"))
+    assert status == "ok"
+    assert queue(username, job_key(username, "once")) == ("duplicate", job_id)
+    assert credits(username) == 2
+    cancel_job(job_id)
+
+
+def test_job_key_used_for_another_charge_conflicts(username):
+    key = job_key(username, "shared")
+    assert CreditLedger().charge(username, key=key) == "ok"  # e.g. a scan charged before job keys had their own prefix
+    assert queue(username, key) == ("conflict", None)
+    assert credits(username) == 2
+
+
+def test_claim_and_complete(username):
+    _, job_id = queue(username)
+    job = claim_job("worker-1", lease_seconds=60, max_running_per_user=5)
+
+    assert job["id"] == job_id and job["status"] == "running" and job["attempts"] == 1
+    assert claim_job("worker-2", lease_seconds=60, max_running_per_user=5) is None  # Leased to worker-1
+    assert complete_job(job_id, "worker-1", {"matches": []})
+    assert get_job(job_id)["status"] == "done"
+    assert credits(username) == 2
+
+
+def test_expired_lease_is_taken_over(username):
+    _, job_id = queue(username)
+    claim_job("worker-1", lease_seconds=-1, max_running_per_user=5)  # worker-1 dies: its lease is already over
+
+    job = claim_job("worker-2", lease_seconds=60, max_running_per_user=5)
+    assert job["id"] == job_id and job["worker"] == "worker-2" and job["attempts"] == 2
+    assert not complete_job(job_id, "worker-1", {"matches": []})  # No longer worker-1's
+    assert fail_job(job_id, "worker-1", "late") is None
+    assert complete_job(job_id, "worker-2", {"matches": []})
+
+
+def test_expired_lease_on_last_attempt_fails_and_refunds(username):
+    _, job_id = queue(username, max_attempts=1)
+    claim_job("worker-1", lease_seconds=-1, max_running_per_user=5)
+    assert credits(username) == 2
+
+    assert claim_job("worker-2", lease_seconds=60, max_running_per_user=5) is None
+    job = get_job(job_id)
+    assert job["status"] == "failed" and job["error"] == "Worker stopped responding"
+    assert credits(username) == 3
+
+
+def test_failed_attempt_is_requeued_then_refunded(username):
+    _, job_id = queue(username)
+    claim_job("worker-1", lease_seconds=60, max_running_per_user=5)
+    assert fail_job(job_id, "worker-1", "timed out", retry_seconds=0) == "queued"
+
+    claim_job("worker-1", lease_seconds=60, max_running_per_user=5)
+    assert fail_job(job_id, "worker-1", "timed out", retry_seconds=0) == "failed"
+    assert credits(username) == 3
+
+
+# Scan history
+def test_history_pages_with_cursor(username):
+    # Equal timestamps too, so pages must break ties by insertion order
+    record_scans([
+        {
+            "id": str(uuid.uuid4()),
+            "username": username,
+            "document_name": f"doc{number}.txt",
+            "query_text": "some text",
+            "result": {"matches": []},
+            "created_at": f"2026-01-0{1 + number // 2}T00:00:00"
+        }
+        for number in range(7)
+    ])
+
+    names, cursor, pages = [], None, 0
+    while True:
+        scans, cursor = get_user_scans(username, limit=3, cursor=cursor, summary=True)
+        names.extend(scan["document_name"] for scan in scans)
+        pages += 1
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert names == [f"doc{number}.txt" for number in reversed(range(7))]
+    with pytest.raises(ValueError):
+        get_user_scans(username, cursor="not a cursor")
+
+
+def test_recording_a_batch_again_stores_nothing_twice(username):
+    scan = {
+        "id": str(uuid.uuid4()), "username": username, "document_name": "again.txt",
+        "query_text": "some text", "result": {"matches": []}, "created_at": "2026-01-01T00:00:00"
+    }
+    record_scans([scan])
+    record_scans([scan])
+
+    scans, _ = get_user_scans(username)
+    assert [item["id"] for item in scans] == [scan["id"]]
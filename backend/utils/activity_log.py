@@ -0,0 +1,233 @@
+import gzip
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl  # Coordinates rotation between worker processes (POSIX only)
+except ImportError:
+    fcntl = None
+
+CURRENT_FILE = "activity.ndjson"
+LOCK_FILE = "activity.lock"
+SEGMENT_PREFIX = "activity-"
+HEADER_KEY = "segment"
+
+
+def segment_id(when=None):
+    """Sortable id for a segment started at `when` (default now)."""
+    return f"{when or datetime.now():%Y%m%dT%H%M%S%f}"
+
+
+class ActivityLog:
+    """Append-only activity log stored as newline-delimited JSON segments.
+
+    Entries are appended to activity.ndjson, one line each, so logging costs
+    the same however long the log is. The file is rotated once it reaches
+    max_bytes or is older than rotate_seconds; rotated segments are renamed to
+    activity-<segment id>.ndjson and optionally gzip-compressed. Every
+    segment starts with a header line carrying its id, which keeps read
+    cursors valid across rotation and compression.
+    """
+
+    def __init__(self, log_dir, max_bytes=10 * 1024 * 1024, rotate_seconds=86400, compress=True):
+        self.log_dir = log_dir
+        self.path = os.path.join(log_dir, CURRENT_FILE)
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compress = compress
+        self.lock = threading.Lock()
+        self.current = (None, None)  # (inode, start time) of the segment being written
+        os.makedirs(log_dir, exist_ok=True)
+
+    @contextmanager
+    def _file_lock(self, mode):
+        """Shared lock for appends, exclusive for rotation (no-op without fcntl)."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.log_dir, LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Writing
+    def _segment_start(self, stat):
+        inode, started = self.current
+        if inode != stat.st_ino:
+            header = read_header(self.path)
+            started = datetime.strptime(header, "%Y%m%dT%H%M%S%f").timestamp() if header else stat.st_mtime
+            self.current = (stat.st_ino, started)
+        return started
+
+    def _needs_rotation(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        if stat.st_size >= self.max_bytes:
+            return True
+        return self.rotate_seconds and time.time() - self._segment_start(stat) >= self.rotate_seconds
+
+    def _rotate(self):
+        with self._file_lock(fcntl.LOCK_EX if fcntl else None):
+            if not self._needs_rotation():
+                return  # Another process rotated first
+
+            rotated = None
+            if os.path.exists(self.path):
+                rotated = os.path.join(self.log_dir, f"{SEGMENT_PREFIX}{read_header(self.path) or segment_id()}.ndjson")
+                os.replace(self.path, rotated)
+
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({HEADER_KEY: segment_id()}) + "\n")
+            os.replace(tmp_path, self.path)
+
+        # No writer can still hold the rotated file: they append under the shared lock
+        if rotated and self.compress:
+            threading.Thread(target=compress_segment, args=(rotated,), name="log-compress", daemon=True).start()
+
+    def append(self, entry):
+        """Append one entry (a JSON-serializable dict)."""
+        self.append_many([entry])
+
+    def append_many(self, entries):
+        """Append entries with a single write; returns how many were written."""
+        lines = b"".join((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8") for entry in entries)
+        if not lines:
+            return 0
+        with self.lock:
+            if self._needs_rotation():
+                self._rotate()
+            with self._file_lock(fcntl.LOCK_SH if fcntl else None):
+                # O_APPEND writes land whole at the end of the file, never interleaved with other processes
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, lines)
+                finally:
+                    os.close(fd)
+        return lines.count(b"\n")
+
+    # Reading
+    def segments(self):
+        """Return [(segment id, path)] oldest first, the current segment last."""
+        found = {}
+        for filename in sorted(os.listdir(self.log_dir)):
+            if filename.startswith(SEGMENT_PREFIX) and filename.endswith((".ndjson", ".ndjson.gz")):
+                # While a segment is being compressed both copies may exist; they hold the same lines
+                found[filename[len(SEGMENT_PREFIX):].split(".", 1)[0]] = os.path.join(self.log_dir, filename)
+        found = sorted(found.items())
+        if os.path.exists(self.path):
+            found.append((read_header(self.path) or "", self.path))
+        return found
+
+    def read(self, username=None, action=None, since=None, until=None, cursor=None):
+        """Yield (entry, cursor after it) for matching entries, oldest first.
+
+        since/until are ISO timestamps compared with each entry's timestamp.
+        The file being read is streamed line by line, so memory does not grow
+        with history; segments last written before `since` are skipped.
+        """
+        start_segment, start_offset = parse_cursor(cursor)
+        for segment, path in self.segments():
+            if start_segment and segment < start_segment:
+                continue
+            try:
+                if since and datetime.fromtimestamp(os.path.getmtime(path)).isoformat() < since:
+                    continue
+                opener = gzip.open if path.endswith(".gz") else open
+                with opener(path, "rb") as f:
+                    if segment == start_segment and start_offset:
+                        f.seek(start_offset)
+                    while True:
+                        raw = f.readline()
+                        if not raw:
+                            break
+                        try:
+                            entry = json.loads(raw)
+                        except ValueError:
+                            continue  # Partial line from a crash
+                        if HEADER_KEY in entry:
+                            continue
+                        if username and entry.get("username") != username:
+                            continue
+                        if action and entry.get("action") != action:
+                            continue
+                        timestamp = entry.get("timestamp", "")
+                        if (since and timestamp < since) or (until and timestamp > until):
+                            continue
+                        yield entry, f"{segment}:{f.tell()}"
+            except FileNotFoundError:
+                continue  # Compressed (renamed) while we were listing
+
+    def read_page(self, limit=100, **filters):
+        """Return (entries, next cursor or None) for one page of read()."""
+        entries, cursor = [], None
+        for entry, position in self.read(**filters):
+            if len(entries) == limit:
+                return entries, cursor
+            entries.append(entry)
+            cursor = position
+        return entries, None
+
+
+def read_header(path):
+    """Segment id from a segment's first line, or None."""
+    try:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as f:
+            return json.loads(f.readline()).get(HEADER_KEY)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def parse_cursor(cursor):
+    """Split a "segment:offset" cursor; raises ValueError if malformed."""
+    if not cursor:
+        return None, 0
+    segment, _, offset = cursor.rpartition(":")
+    return segment, int(offset)
+
+
+def compress_segment(path):
+    """Gzip a rotated segment, keeping its modification time."""
+    mtime = os.path.getmtime(path)
+    tmp_path = path + ".gz.tmp"
+    try:
+        with open(path, "rb") as src, gzip.open(tmp_path, "wb") as dst:
+            while True:
+                block = src.read(1024 * 1024)
+                if not block:
+                    break
+                dst.write(block)
+        os.utime(tmp_path, (mtime, mtime))
+        os.replace(tmp_path, path + ".gz")
+        os.remove(path)
+    except OSError as e:
+        print(f"WARNING: Failed to compress activity log segment {path}! ({e})")
+
+
+_activity_log = None
+_activity_log_lock = threading.Lock()
+
+
+def get_activity_log():
+    """The process-wide activity log configured in config.py."""
+    global _activity_log
+    if _activity_log is None:
+        with _activity_log_lock:
+            if _activity_log is None:
+                from config import ACTIVITY_LOG_DIR, ACTIVITY_LOG_MAX_BYTES, ACTIVITY_LOG_ROTATE_SECONDS, ACTIVITY_LOG_COMPRESS
+                _activity_log = ActivityLog(
+                    ACTIVITY_LOG_DIR,
+                    max_bytes=ACTIVITY_LOG_MAX_BYTES,
+                    rotate_seconds=ACTIVITY_LOG_ROTATE_SECONDS,
+                    compress=ACTIVITY_LOG_COMPRESS
+                )
+    return _activity_log
@@ -0,0 +1,84 @@
+import threading
+import uuid
+from config import CREDIT_CACHE_ITEMS, CREDIT_CACHE_TTL
+from utils.query_cache import LRUCache
+from utils.storage import change_credits, get_user
+
+
+class CreditLedger:
+    """Credit balances with the credit_transactions ledger behind them.
+
+    Every change is one SQLite transaction: a compare-and-decrement UPDATE
+    of users.credits plus the ledger row, so concurrent charges from any
+    thread or process can neither overdraw a balance nor be lost. Charges
+    carry an idempotency key (one per scan); a key seen before makes the
+    call a no-op, so a retried request is charged once and a refund is
+    paid once.
+
+    The balance each write returns is cached (write-through), so balance
+    reads skip the database. Writes made by other processes show up once
+    the cached entry is ttl seconds old; charges never rely on the cache.
+    """
+
+    def __init__(self, max_items=10000, ttl=5):
+        self.balances = LRUCache(max_items, ttl)
+
+    def _apply(self, username, amount, kind, key, reference):
+        status, balance = change_credits(username, amount, kind, key, reference)
+        if balance is not None:
+            self.balances.put(username, balance)
+        return status
+
+    def charge(self, username, amount=1, key=None, reference=None):
+        """Take credits for a scan; returns "ok", "duplicate" (key already charged), "insufficient" or "not_found"."""
+        return self._apply(username, -amount, "scan", key, reference)
+
+    def refund(self, username, amount, key=None, reference=None):
+        """Give back credits for scans that did not happen; pass the charge's key so it is refunded once."""
+        return self._apply(username, amount, "refund", f"refund:{key}" if key else None, reference)
+
+    def grant(self, username, amount, kind="grant", reference=None):
+        return self._apply(username, amount, kind, None, reference)
+
+    def balance(self, username):
+        """A user's credits (None for an unknown user), from the cache when fresh."""
+        balance = self.balances.get(username)
+        if balance is None:
+            user = get_user(username)
+            balance = user["credits"] if user else None
+            if balance is not None:
+                self.balances.put(username, balance)
+        return balance
+
+    def forget(self, username=None):
+        """Drop a cached balance (every balance if username is None) after a change made outside the ledger."""
+        if username is None:
+            self.balances.clear()
+        else:
+            self.balances.discard(username)
+
+    def metrics(self):
+        return self.balances.metrics()
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_credit_ledger():
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = CreditLedger(CREDIT_CACHE_ITEMS, CREDIT_CACHE_TTL)
+    return _ledger
+
+
+def scan_key(username, client_key=None):
+    """Idempotency key of one scan: the client's Idempotency-Key (scoped to the user), else a fresh one."""
+    return f"scan:{username}:{client_key or uuid.uuid4()}"
+
+
+def job_key(username, client_key):
+    """Idempotency key of one queued scan job, kept apart from scan_key so a key reused across endpoints cannot match."""
+    return f"job:{username}:{client_key}"
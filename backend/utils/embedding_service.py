@@ -0,0 +1,223 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from utils.metrics import Histogram
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class EmbeddingRequest:
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class EmbeddingService:
+    """Owns the embedding model and runs it on a single worker thread.
+
+    Concurrent encode() calls are queued and coalesced into micro-batches:
+    the worker takes the first waiting request, then keeps collecting more
+    until max_batch_size texts are gathered or max_wait_ms has passed, runs
+    one forward pass and resolves each caller's future with its own rows.
+    A request that would take a batch past max_batch_size starts the next
+    one instead, so a forward pass never sees more texts than that (unless
+    a single request submit()ted directly is larger on its own).
+
+    The model is loaded on first use, or ahead of time with warm_up(). The
+    worker thread is started lazily too and restarted in forked children,
+    so a service created before a pre-fork server forks keeps working in
+    every worker while sharing the parent's model weights copy-on-write.
+    """
+
+    def __init__(self, load_model, max_batch_size=32, max_wait_ms=5, normalize=True, queue_size=1024):
+        self.load_model = load_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.normalize = normalize
+        self.queue_size = queue_size
+
+        self._model = None
+        self.state = "cold"  # cold -> loading -> ready, or failed
+        self.load_error = None
+        self.load_seconds = None
+
+        self.started_at = time.time()
+        self.texts_encoded = 0
+        self.batches = 0
+        self.latency_ms = Histogram()  # Queue wait + forward pass, per request
+        self.compute_ms = Histogram()  # Forward pass, per batch
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+
+        self._reset_worker()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_worker)
+
+    def _reset_worker(self):
+        # Threads do not survive fork, and locks copied mid-use would stay held: start from scratch
+        self.load_lock = threading.Lock()
+        self.worker_lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=self.queue_size)  # put() blocks when full: back-pressure on callers
+        self.worker = None
+        self.carried = None  # Request taken from the queue that did not fit the last batch
+        if self._model is None:
+            self.state = "cold"  # A load running in the parent did not come along
+
+    @property
+    def model(self):
+        """The embedding model, loaded on first access."""
+        if self._model is None:
+            with self.load_lock:
+                if self._model is None:
+                    self.state = "loading"
+                    start = time.perf_counter()
+                    try:
+                        model = self.load_model()
+                    except Exception as e:
+                        self.state, self.load_error = "failed", str(e)
+                        print(f"ERROR: Failed to load the embedding model! ({e})")
+                        raise
+                    self.load_seconds = time.perf_counter() - start
+                    self._model, self.state, self.load_error = model, "ready", None
+                    print(f"SUCCESS: Embedding model loaded in {self.load_seconds:.1f}s")
+        return self._model
+
+    @property
+    def ready(self):
+        return self._model is not None
+
+    def warm_up(self, background=True, sample="warm-up"):
+        """Load the model ahead of the first request, then encode sample once (skipped if None)."""
+        def run():
+            try:
+                self.model
+                if sample:
+                    self.encode([sample])
+            except Exception as e:
+                print(f"ERROR: Embedding model warm-up failed! ({e})")
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name="embedding-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        """Model loading state for readiness checks."""
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "load_seconds": self.load_seconds,
+            "error": self.load_error
+        }
+
+    @property
+    def dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    @property
+    def tokenizer(self):
+        return self.model.tokenizer
+
+    def submit(self, texts):
+        """Queue a list of texts and return a Future resolving to their (n, dim) embeddings."""
+        request = EmbeddingRequest(list(texts))
+        self._ensure_worker()
+        self.queue.put(request)
+        return request.future
+
+    def encode(self, texts):
+        """Embed a list of texts, or a single string (returns a 1-D vector)."""
+        if isinstance(texts, str):
+            return self.encode([texts])[0]
+
+        texts = list(texts)
+        if not texts:
+            # Nothing to embed is no reason to load the model just for its dimension
+            return np.empty((0, self.dimension if self.ready else 0), dtype="float32")
+
+        # Split large requests so bulk ingestion interleaves with interactive queries
+        futures = [
+            self.submit(texts[start:start + self.max_batch_size])
+            for start in range(0, len(texts), self.max_batch_size)
+        ]
+        return np.vstack([future.result() for future in futures])
+
+    def _ensure_worker(self):
+        if self.worker is None:
+            with self.worker_lock:
+                if self.worker is None:
+                    worker = threading.Thread(target=self._run, name="embedding-worker", daemon=True)
+                    worker.start()
+                    self.worker = worker
+
+    def _collect_batch(self):
+        first, self.carried = self.carried, None
+        batch = [first or self.queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.perf_counter() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + len(request.texts) > self.max_batch_size:
+                self.carried = request  # Leads the next batch
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            texts = [text for request in batch for text in request.texts]
+
+            start = time.perf_counter()
+            try:
+                embeddings = self.model.encode(
+                    texts,
+                    batch_size=len(texts),
+                    convert_to_tensor=False,
+                    normalize_embeddings=self.normalize
+                )
+            except Exception as e:
+                print(f"ERROR: Embedding batch of {len(texts)} texts failed! ({e})")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+
+            offset = 0
+            for request in batch:
+                rows = np.asarray(embeddings[offset:offset + len(request.texts)], dtype="float32")
+                offset += len(request.texts)
+                request.future.set_result(rows)
+                self.latency_ms.observe((finished - request.enqueued_at) * 1000)
+
+            self.batches += 1
+            self.texts_encoded += len(texts)
+            self.compute_ms.observe((finished - start) * 1000)
+            self.batch_sizes.observe(len(texts))
+
+    def metrics(self):
+        """Throughput counters and latency / batch-size histograms."""
+        uptime = time.time() - self.started_at
+        return {
+            "model": self.status(),
+            "queue_depth": self.queue.qsize(),
+            "batches": self.batches,
+            "texts_encoded": self.texts_encoded,
+            "texts_per_second": self.texts_encoded / uptime if uptime else 0.0,
+            "request_latency_ms": self.latency_ms.snapshot(),
+            "batch_compute_ms": self.compute_ms.snapshot(),
+            "batch_size": self.batch_sizes.snapshot()
+        }
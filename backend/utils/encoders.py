@@ -0,0 +1,193 @@
+import inspect
+import os
+import re
+import numpy as np
+
+# Encoder backends selectable through EMBEDDING_BACKEND
+ENCODER_BACKENDS = ("torch", "torch_int8", "onnx", "onnx_int8")
+
+# Sentences used to compare a faster backend against the fp32 model at load time
+PARITY_TEXTS = [
+    "Blockchain is a decentralized ledger that records transactions across many computers.",
+    "Machine learning models learn patterns from data to make predictions.",
+    "Firewalls monitor and filter incoming and outgoing network traffic.",
+    "The recitation covers virtual memory, caches and linking.",
+    "Supervised learning uses labelled examples, unsupervised learning does not.",
+    "Proof of Stake chooses validators based on the amount of cryptocurrency they hold.",
+    "Phishing emails trick users into revealing passwords.",
+    "Gradient descent updates parameters in the direction that reduces the loss."
+]
+
+
+def load_sentence_transformer(model_name, device=None):
+    """Load a SentenceTransformer model (moves to GPU if available unless a device is given)."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    return SentenceTransformer(model_name).to(device)
+
+
+def pooling_mode(st_model):
+    """Return "cls" or "mean" for a SentenceTransformer's pooling layer."""
+    config = st_model[1].get_config_dict()
+    mode = config.get("pooling_mode")
+    if mode is None:
+        # sentence-transformers 2.x stores one flag per mode
+        mode = "cls" if config.get("pooling_mode_cls_token") else "mean" if config.get("pooling_mode_mean_tokens") else None
+    if mode not in ("cls", "mean"):
+        raise ValueError(f"Unsupported pooling mode {mode} for the ONNX backend")
+    return mode
+
+
+def quantize_torch(st_model):
+    """Dynamic int8 quantization of every Linear layer (CPU only)."""
+    import torch
+    return torch.ao.quantization.quantize_dynamic(st_model.cpu(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def export_onnx(st_model, onnx_path, quantize=False):
+    """Export the model's transformer to ONNX, optionally with int8 dynamic quantization."""
+    import torch
+
+    class HiddenStates(torch.nn.Module):
+        """Calls the transformer by keyword (positional order differs across transformers releases)."""
+
+        def __init__(self, model, input_names):
+            super().__init__()
+            self.model = model
+            self.input_names = input_names
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(self.input_names, inputs))).last_hidden_state
+
+    os.makedirs(os.path.dirname(onnx_path) or ".", exist_ok=True)
+    sample = st_model.tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    transformer = HiddenStates(st_model[0].auto_model.cpu().eval(), input_names)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+
+    # Newer torch releases default to the dynamo exporter; keep the TorchScript one everywhere
+    extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    fp32_path = onnx_path + ".fp32.tmp" if quantize else onnx_path + ".tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+            **extra
+        )
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, onnx_path + ".tmp", weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+    os.replace(onnx_path + ".tmp", onnx_path)
+
+
+class OnnxEncoder:
+    """SentenceTransformer-compatible encoder that runs the transformer in ONNX Runtime."""
+
+    def __init__(self, st_model, onnx_path, quantize=False):
+        import onnxruntime as ort
+
+        if not os.path.exists(onnx_path):
+            print(f"Exporting embedding model to {onnx_path}...")
+            export_onnx(st_model, onnx_path, quantize=quantize)
+
+        self.tokenizer = st_model.tokenizer
+        self.max_seq_length = st_model.max_seq_length
+        self.pooling = pooling_mode(st_model)
+        self.dimension = st_model.get_sentence_embedding_dimension()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, batch_size=32, convert_to_tensor=False, normalize_embeddings=False, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            features = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            inputs = {name: features[name].astype("int64") for name in self.input_names}
+            hidden = self.session.run(None, inputs)[0]
+
+            if self.pooling == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = features["attention_mask"][..., None].astype("float32")
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(pooled.astype("float32"))
+
+        embeddings = np.vstack(batches) if batches else np.empty((0, self.dimension), dtype="float32")
+        if normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+
+def parity_check(reference, candidate, texts=PARITY_TEXTS, threshold=0.99):
+    """Compare two encoders on texts by per-text cosine similarity of their embeddings."""
+    expected = reference.encode(texts, convert_to_tensor=False, normalize_embeddings=True)
+    actual = candidate.encode(texts, convert_to_tensor=False, normalize_embeddings=True)
+    cosines = (np.asarray(expected) * np.asarray(actual)).sum(axis=1)
+    return {
+        "passed": bool(cosines.min() >= threshold),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "threshold": threshold
+    }
+
+
+def onnx_model_path(onnx_dir, model_name, quantize=False):
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+    return os.path.join(onnx_dir, f"{safe_name}{'_int8' if quantize else ''}.onnx")
+
+
+def load_encoder(model_name, backend="torch", onnx_dir="./storage/onnx", parity_threshold=0.99):
+    """Load the embedding model with the requested backend.
+
+    Non-fp32 backends are checked against the fp32 model on PARITY_TEXTS;
+    if their cosine agreement falls below parity_threshold the fp32 model
+    is used instead.
+    """
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {ENCODER_BACKENDS}")
+
+    if backend == "torch":
+        return load_sentence_transformer(model_name)
+
+    # Quantized and ONNX backends are CPU-only
+    model = load_sentence_transformer(model_name, device="cpu")
+    try:
+        if backend == "torch_int8":
+            encoder = quantize_torch(model)
+        else:
+            quantize = backend == "onnx_int8"
+            encoder = OnnxEncoder(model, onnx_model_path(onnx_dir, model_name, quantize), quantize=quantize)
+    except (ImportError, RuntimeError, ValueError) as e:
+        print(f"WARNING: Failed to load {backend} embedding backend, using torch fp32 ({e})")
+        return model
+
+    parity = parity_check(model, encoder, threshold=parity_threshold)
+    if not parity["passed"]:
+        print(f"WARNING: {backend} backend fails parity ({parity['min_cosine']:.4f} < {parity_threshold}), using torch fp32")
+        return model
+
+    print(f"SUCCESS: Loaded {backend} embedding backend (min cosine vs fp32 {parity['min_cosine']:.4f})")
+    return encoder
@@ -0,0 +1,192 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from utils.metrics import Histogram
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+_STOP = object()
+
+
+class EventBus:
+    """In-process event bus drained by one background worker thread.
+
+    emit() queues an event and returns; the worker takes whatever is
+    waiting (up to max_batch events, waiting at most max_wait_ms for more)
+    and hands each subscriber its events as one list, so handlers can write
+    a whole batch in a single transaction. The queue is bounded: when it is
+    full emit() blocks for up to emit_timeout seconds, then handles the
+    event on the caller's thread rather than dropping it. A batch whose
+    handler raises is retried once, then handed over one event at a time,
+    so one bad event only loses itself; handlers should therefore write a
+    batch all-or-nothing. close() (run at exit) stops intake and flushes
+    everything still queued.
+    """
+
+    def __init__(self, max_batch=256, max_wait_ms=20, queue_size=10000, emit_timeout=1.0, run_async=True):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue_size = queue_size
+        self.emit_timeout = emit_timeout
+        self.run_async = run_async
+        self.handlers = defaultdict(list)  # event type -> [handler(list of payloads)]
+
+        self.counter_lock = threading.Lock()
+        self.emitted = 0
+        self.processed = 0
+        self.inline = 0  # Events handled on the caller's thread (queue full, closed or synchronous mode)
+        self.errors = 0  # Events a handler failed on even when given alone
+        self.retries = 0  # Batches handed to a handler again after it raised
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.handle_ms = Histogram()
+
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Worker threads do not survive fork; a child starts with an empty queue and no worker
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.worker = None
+        self.worker_lock = threading.Lock()
+        self.closed = False
+
+    def subscribe(self, event_type, handler):
+        """Register handler(payloads) for a type of event; it receives a list of payloads per batch."""
+        self.handlers[event_type].append(handler)
+
+    def emit(self, event_type, payload):
+        """Queue an event for the background worker (or handle it now if that is not possible)."""
+        with self.counter_lock:
+            self.emitted += 1
+        if self.run_async and not self.closed:
+            self._ensure_worker()
+            try:
+                self.queue.put((event_type, payload), timeout=self.emit_timeout)
+                return
+            except queue.Full:
+                print(f"WARNING: Event queue is full, handling {event_type} inline")
+        with self.counter_lock:
+            self.inline += 1
+        self._dispatch([(event_type, payload)])
+
+    def _ensure_worker(self):
+        if self.worker is None:
+            with self.worker_lock:
+                if self.worker is None:
+                    worker = threading.Thread(target=self._run, name="event-bus", daemon=True)
+                    worker.start()
+                    self.worker = worker
+
+    def _collect_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch and batch[-1] is not _STOP:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            stop = batch[-1] is _STOP
+            events = batch[:-1] if stop else batch
+            if events:
+                self._dispatch(events)
+            if stop:
+                return
+
+    def _dispatch(self, events):
+        start = time.perf_counter()
+        by_type = defaultdict(list)
+        for event_type, payload in events:
+            by_type[event_type].append(payload)
+
+        for event_type, payloads in by_type.items():
+            for handler in self.handlers[event_type]:
+                self._deliver(event_type, handler, payloads)
+
+        with self.counter_lock:
+            self.processed += len(events)
+        self.batch_sizes.observe(len(events))
+        self.handle_ms.observe((time.perf_counter() - start) * 1000)
+
+    def _handle(self, event_type, handler, payloads):
+        """Give a handler its payloads, retrying once; False if it raised both times."""
+        for attempt in (1, 2):
+            try:
+                handler(payloads)
+                return True
+            except Exception as e:
+                print(f"WARNING: Handling {len(payloads)} {event_type} events failed on attempt {attempt}! ({e})")
+                if attempt == 1:
+                    with self.counter_lock:
+                        self.retries += 1
+        return False
+
+    def _deliver(self, event_type, handler, payloads):
+        if self._handle(event_type, handler, payloads):
+            return
+        # The batch keeps failing: hand its events over one at a time so only the bad ones are lost
+        failed = payloads
+        if len(payloads) > 1:
+            failed = [payload for payload in payloads if not self._handle(event_type, handler, [payload])]
+        if failed:
+            with self.counter_lock:
+                self.errors += len(failed)
+            print(f"ERROR: Dropped {len(failed)} {event_type} events their handler kept failing on!")
+
+    def close(self, timeout=30):
+        """Stop accepting events and wait for the worker to flush the queue."""
+        if self.closed:
+            return
+        self.closed = True
+        if self.worker is not None and self.worker.is_alive():
+            self.queue.put(_STOP)
+            self.worker.join(timeout)
+
+    def flush(self, timeout=30):
+        """Wait until every queued event has been handled (for tests and benchmarks)."""
+        deadline = time.time() + timeout
+        while self.processed < self.emitted and time.time() < deadline:
+            time.sleep(0.005)
+
+    def metrics(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "emitted": self.emitted,
+            "processed": self.processed,
+            "handled_inline": self.inline,
+            "handler_errors": self.errors,
+            "handler_retries": self.retries,
+            "batch_size": self.batch_sizes.snapshot(),
+            "batch_handle_ms": self.handle_ms.snapshot()
+        }
+
+
+_event_bus = None
+_event_bus_lock = threading.Lock()
+
+
+def get_event_bus():
+    """The process-wide event bus configured in config.py; flushed when the process exits."""
+    global _event_bus
+    if _event_bus is None:
+        with _event_bus_lock:
+            if _event_bus is None:
+                from config import EVENT_BATCH_SIZE, EVENT_MAX_WAIT_MS, EVENT_QUEUE_SIZE, EVENT_EMIT_TIMEOUT, EVENTS_ASYNC
+                _event_bus = EventBus(
+                    max_batch=EVENT_BATCH_SIZE,
+                    max_wait_ms=EVENT_MAX_WAIT_MS,
+                    queue_size=EVENT_QUEUE_SIZE,
+                    emit_timeout=EVENT_EMIT_TIMEOUT,
+                    run_async=EVENTS_ASYNC
+                )
+                atexit.register(_event_bus.close)
+    return _event_bus
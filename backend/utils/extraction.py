@@ -0,0 +1,363 @@
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+# Bump when extraction output changes, so cached texts are not reused across versions
+EXTRACTOR_VERSION = "2"
+
+FILE_TYPES = {
+    "txt": "text",
+    "pdf": "pdf",
+    "docx": "docx",
+    "jpg": "image",
+    "jpeg": "image",
+    "png": "image",
+    "tif": "image",
+    "tiff": "image",
+    "bmp": "image",
+}
+
+
+def file_type(path):
+    """Extraction type of a file from its extension ("text", "pdf", "docx", "image"), or None."""
+    return FILE_TYPES.get(path.rsplit(".", 1)[-1].lower())
+
+
+# Worker functions: module-level so they can be sent to pool processes
+def pdf_page_count(path):
+    import fitz  # PyMuPDF
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def extract_pdf_pages(path, start=0, stop=None):
+    """Texts of pages [start, stop) of a PDF, in page order.
+
+    PyMuPDF reads the text layer; pages it returns nothing for, or the
+    whole range if it cannot open the file, are retried with pdfplumber.
+    """
+    texts = {}
+    try:
+        import fitz
+        with fitz.open(path) as doc:
+            stop = doc.page_count if stop is None else min(stop, doc.page_count)
+            for number in range(start, stop):
+                texts[number] = doc[number].get_text("text")
+    except Exception as e:
+        print(f"WARNING: PyMuPDF failed for {path}, trying pdfplumber... ({e})")
+
+    missing = [number for number, text in texts.items() if not text.strip()] if texts else None
+    if missing is None or missing:
+        try:
+            import pdfplumber
+            with pdfplumber.open(path) as pdf:
+                stop = len(pdf.pages) if stop is None else min(stop, len(pdf.pages))
+                for number in (range(start, stop) if missing is None else missing):
+                    texts[number] = pdf.pages[number].extract_text() or ""
+        except Exception as e:
+            print(f"ERROR: Failed to extract text from {path} using pdfplumber! ({e})")
+
+    return [texts[number] for number in sorted(texts)]
+
+
+def extract_docx(path):
+    from docx import Document
+    return "\n".join(para.text for para in Document(path).paragraphs)
+
+
+def extract_image(path, tesseract_path=None):
+    import pytesseract
+    from PIL import Image
+    if tesseract_path:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_path
+    with Image.open(path) as img:
+        return pytesseract.image_to_string(img)
+
+
+def extract_plain_text(path):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+def extract_serial(path, tesseract_path=None):
+    """Extract a file in this process (no pool, no timeout); returns stripped text or ""."""
+    kind = file_type(path)
+    try:
+        if kind == "pdf":
+            return "\n".join(text for text in extract_pdf_pages(path) if text.strip()).strip()
+        if kind == "docx":
+            return extract_docx(path).strip()
+        if kind == "image":
+            return extract_image(path, tesseract_path).strip()
+        if kind == "text":
+            return extract_plain_text(path).strip()
+    except Exception as e:
+        print(f"ERROR: Failed to extract text from {path}! ({e})")
+    return ""
+
+
+class Extractor:
+    """Extracts text from uploaded and reference files on a process pool.
+
+    PDFs are split into runs of pages_per_task pages so the pages of one
+    large file and the files of a batch are read in parallel; page texts are
+    joined back in page order. Each file gets `timeout` seconds from when the
+    caller starts waiting for it; on timeout its text is "" and the pool is
+    recycled so a stuck worker (e.g. OCR on a huge image) does not linger.
+    Plain text files are read inline, they are not worth a round trip.
+    Given an ExtractionCache, files whose bytes were extracted before are
+    not extracted again.
+    """
+
+    def __init__(self, workers=0, timeout=120, pages_per_task=16, tesseract_path=None, cache=None):
+        self.workers = workers or available_cores()
+        self.cache = cache  # ExtractionCache, or None to always extract
+        self.timeout = timeout
+        self.pages_per_task = pages_per_task
+        self.tesseract_path = tesseract_path
+        self.lock = threading.Lock()
+        self.files = 0
+        self.pages = 0
+        self.timeouts = 0
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # A pool belongs to the process that started it; a forked child starts its own
+        self.pool = None
+        self.pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        if self.pool is None:
+            with self.pool_lock:
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=pool_context())
+        return self.pool
+
+    def _recycle_pool(self, pool):
+        """Replace a pool that has a stuck or dead worker."""
+        with self.pool_lock:
+            if self.pool is pool:
+                self.pool = None
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def _submit(self, pool, path):
+        """Queue a file's tasks; returns (kind, futures or inline text)."""
+        kind = file_type(path)
+        if kind == "text":
+            return kind, extract_serial(path)
+        if kind == "docx":
+            return kind, [pool.submit(extract_docx, path)]
+        if kind == "image":
+            return kind, [pool.submit(extract_image, path, self.tesseract_path)]
+        if kind == "pdf":
+            try:
+                pages = pdf_page_count(path)
+            except Exception:
+                pages = None  # Let the worker's pdfplumber fallback deal with it
+            if not pages:
+                return kind, [pool.submit(extract_pdf_pages, path)]
+            return kind, [
+                pool.submit(extract_pdf_pages, path, start, start + self.pages_per_task)
+                for start in range(0, pages, self.pages_per_task)
+            ]
+        print(f"WARNING: Unknown file type for {os.path.basename(path)}, skipping...")
+        return kind, ""
+
+    def _iter_parts(self, pool, path, kind, pending, retry=True):
+        """Yield a file's non-empty texts in order (pages for PDFs) as its tasks finish.
+
+        Stops quietly on timeout or failure; closing the generator early
+        cancels the tasks that have not started yet.
+        """
+        if isinstance(pending, str):
+            self._count(1, 1 if pending else 0)
+            if pending:
+                yield pending
+            return
+
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        pages = yielded = 0
+        try:
+            for future in pending:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                result = future.result(timeout=remaining)
+                for part in (result if kind == "pdf" else [result]):
+                    pages += 1
+                    if part.strip():
+                        yielded += 1
+                        yield part
+        except FutureTimeout:
+            with self.lock:
+                self.timeouts += 1
+            print(f"ERROR: Extracting {os.path.basename(path)} timed out after {self.timeout}s!")
+            self._recycle_pool(pool)
+            return
+        except (BrokenProcessPool, CancelledError) as e:
+            # Also raised for files queued on a pool recycled because another file timed out
+            self._recycle_pool(pool)
+            if retry:
+                pool = self._get_pool()
+                retried = self._iter_parts(pool, path, *self._submit(pool, path), retry=False)
+                yield from itertools.islice(retried, yielded, None)  # Skip what was already handed out
+                return
+            print(f"ERROR: Extraction worker died on {os.path.basename(path)}! ({e})")
+            return
+        except Exception as e:
+            print(f"ERROR: Failed to extract text from {path}! ({e})")
+            return
+        finally:
+            for future in pending:
+                future.cancel()
+
+        self._count(1, pages)
+
+    def _collect(self, pool, path, kind, pending):
+        return "\n".join(self._iter_parts(pool, path, kind, pending)).strip()
+
+    def _count(self, files, pages):
+        with self.lock:
+            self.files += files
+            self.pages += pages
+
+    def extract(self, path, sha256=None):
+        """Extract one file; returns stripped text, or "" if nothing could be extracted."""
+        return next(self.extract_many([path], [sha256]))[1]
+
+    def iter_text(self, path, sha256=None, max_chars=None):
+        """Yield a file's text piece by piece (page by page for PDFs), at most max_chars characters in all.
+
+        Pieces are handed out as soon as their pages are extracted, so a
+        caller that only needs the start of a long document never holds the
+        rest; once max_chars is reached the remaining pages are cancelled.
+        Only fully extracted files are added to the cache.
+        """
+        from utils.index_store import file_sha256
+
+        if self.cache:
+            sha256 = sha256 or file_sha256(path)
+            text = self.cache.get(sha256)
+            if text is not None:
+                yield text[:max_chars] if max_chars else text
+                return
+
+        pool = self._get_pool()
+        parts = self._iter_parts(pool, path, *self._submit(pool, path))
+        kept, size = [], 0
+        try:
+            for part in parts:
+                if max_chars and size + len(part) >= max_chars:
+                    yield part[:max_chars - size]
+                    return
+                size += len(part)
+                if self.cache:
+                    kept.append(part)
+                yield part
+        finally:
+            parts.close()
+
+        text = "\n".join(kept).strip()
+        if text and self.cache:
+            self.cache.put(sha256, text)
+
+    def extract_many(self, paths, digests=None):
+        """Yield (path, text) in input order while every file's pages are extracted in parallel.
+
+        With a cache, files are looked up by the SHA-256 of their bytes
+        (taken from digests where given) and only misses are extracted.
+        """
+        from utils.index_store import file_sha256  # Not at module level: pool workers never need faiss
+
+        paths = list(paths)
+        digests = list(digests or [None] * len(paths))
+        if self.cache:
+            digests = [digest or file_sha256(path) for path, digest in zip(paths, digests)]
+        cached = [self.cache.get(digest) if self.cache else None for digest in digests]
+
+        def submit_all(pool):
+            return [self._submit(pool, path) if text is None else (None, text) for path, text in zip(paths, cached)]
+
+        pool = self._get_pool()
+        try:
+            submitted = submit_all(pool)
+        except BrokenProcessPool:
+            self._recycle_pool(pool)
+            pool = self._get_pool()
+            submitted = submit_all(pool)
+
+        for path, digest, text, (kind, pending) in zip(paths, digests, cached, submitted):
+            if text is None:
+                text = self._collect(pool, path, kind, pending)
+                if text and self.cache:
+                    self.cache.put(digest, text)  # Empty results (timeouts included) are retried next time
+            yield path, text
+
+    def metrics(self):
+        return {
+            "workers": self.workers,
+            "files": self.files,
+            "pages": self.pages,
+            "timeouts": self.timeouts,
+            "cache": self.cache.metrics() if self.cache else None
+        }
+
+
+def available_cores():
+    """CPUs this process may run on (respects affinity masks and container CPU sets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def pool_context():
+    """Start pool workers from a clean fork server where available.
+
+    Forking the web process directly would copy its model weights and
+    threads; the fork server preloads only this module.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+
+def get_extractor():
+    """The process-wide extractor configured in config.py."""
+    global _extractor
+    if _extractor is None:
+        with _extractor_lock:
+            if _extractor is None:
+                from config import (
+                    EXTRACT_WORKERS, EXTRACT_TIMEOUT, EXTRACT_PAGES_PER_TASK, TESSERACT_PATH,
+                    EXTRACT_CACHE_DIR, EXTRACT_CACHE_MAX_BYTES, EXTRACT_CACHE_MEMORY_ITEMS
+                )
+                from utils.extraction_cache import ExtractionCache
+                cache = None
+                if EXTRACT_CACHE_MAX_BYTES > 0:
+                    cache = ExtractionCache(
+                        EXTRACT_CACHE_DIR,
+                        EXTRACTOR_VERSION,
+                        max_bytes=EXTRACT_CACHE_MAX_BYTES,
+                        memory_items=EXTRACT_CACHE_MEMORY_ITEMS
+                    )
+                _extractor = Extractor(
+                    workers=EXTRACT_WORKERS,
+                    timeout=EXTRACT_TIMEOUT,
+                    pages_per_task=EXTRACT_PAGES_PER_TASK,
+                    tesseract_path=TESSERACT_PATH,
+                    cache=cache
+                )
+    return _extractor
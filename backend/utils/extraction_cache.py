@@ -0,0 +1,142 @@
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+
+class ExtractionCache:
+    """Extracted text keyed by the SHA-256 of the file's bytes and the extractor version.
+
+    Texts are stored zlib-compressed under cache_dir (one file per key, so
+    every worker process shares them) with an LRU of the memory_items most
+    recently used texts in front. Reads refresh a file's modification time;
+    when the folder grows past max_bytes the least recently used files are
+    deleted until it is back under 90% of the limit.
+    """
+
+    def __init__(self, cache_dir, version, max_bytes=256 * 1024 * 1024, memory_items=128):
+        self.cache_dir = cache_dir
+        self.version = version
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.memory = OrderedDict()  # key -> text, most recently used last
+        self.lock = threading.Lock()
+        self.disk_bytes = None  # Counted on first write
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, sha256):
+        return f"{sha256}-v{self.version}"
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".txt.z")
+
+    def _remember(self, key, text):
+        with self.lock:
+            self.memory[key] = text
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_items:
+                self.memory.popitem(last=False)
+
+    def get(self, sha256):
+        """Cached text for a file hash, or None."""
+        key = self._key(sha256)
+        with self.lock:
+            text = self.memory.get(key)
+            if text is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return text
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                text = zlib.decompress(f.read()).decode("utf-8")
+            os.utime(path)  # Mark as recently used for eviction
+        except (OSError, zlib.error, UnicodeDecodeError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.disk_hits += 1
+        self._remember(key, text)
+        return text
+
+    def put(self, sha256, text):
+        """Store the text extracted from a file with this hash."""
+        key = self._key(sha256)
+        self._remember(key, text)
+
+        path = self._path(key)
+        data = zlib.compress(text.encode("utf-8"), 6)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            try:
+                replaced = os.path.getsize(path)  # Rewriting a key frees its old file
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"WARNING: Failed to write extraction cache entry {key}! ({e})")
+            return
+
+        with self.lock:
+            if self.disk_bytes is None:
+                self.disk_bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self.disk_bytes += len(data) - replaced
+            over = self.disk_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def _entries(self):
+        """(mtime, size, path) of every cached file."""
+        entries = []
+        for root, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith(".txt.z"):
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Delete least recently used files until the cache is under 90% of max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        with self.lock:
+            self.disk_bytes = total
+            self.evictions += evicted
+
+    def metrics(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else None,
+            "memory_items": len(self.memory),
+            "disk_bytes": self.disk_bytes,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,126 @@
+import time
+import numpy as np
+import faiss
+
+# Index layouts selectable through INDEX_MODE, as faiss.index_factory descriptions
+INDEX_MODES = {
+    "flat": "Flat",
+    "flat_fp16": "SQfp16",  # Exact scan over float16 vectors, half the memory
+    "flat_sq8": "SQ8",  # Exact scan over int8 scalar-quantized vectors, a quarter of the memory
+    "ivf_flat": "IVF{nlist},Flat",
+    "hnsw": "HNSW{hnsw_m}",
+    "ivf_pq": "IVF{nlist},PQ{pq_m}",
+    "opq_ivf_pq": "OPQ{pq_m},IVF{nlist},PQ{pq_m}",
+}
+
+# k-means wants ~39 points per centroid; PQ trains 256 centroids per sub-quantizer
+POINTS_PER_CENTROID = 39
+PQ_CENTROIDS = 256
+SQ_MIN_TRAINING_POINTS = 1000  # Enough to estimate per-dimension value ranges for SQ8
+
+# Scoring metrics: "cosine" is inner product over L2-normalized embeddings
+METRICS = {
+    "cosine": faiss.METRIC_INNER_PRODUCT,
+    "l2": faiss.METRIC_L2,
+}
+
+
+def index_description(config):
+    """Return the faiss.index_factory string for an index config."""
+    mode = config["mode"]
+    if mode not in INDEX_MODES:
+        raise ValueError(f"Unknown index mode '{mode}', expected one of {sorted(INDEX_MODES)}")
+    return INDEX_MODES[mode].format(**config)
+
+
+def build_index(dim, config, metric="l2"):
+    """Create an empty index for the configured mode and metric that accepts add_with_ids.
+
+    IVF layouts keep IDs in their inverted lists and are returned as they
+    are: wrapped in IndexIDMap2, their remove_ids reorders the stored
+    vectors and breaks the ID map. Every other layout is wrapped in
+    IndexIDMap2.
+    """
+    index = faiss.index_factory(dim, index_description(config), METRICS[metric])
+    if config["mode"] == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = config["ef_construction"]
+    if faiss.try_extract_index_ivf(index) is not None:
+        return index
+    return faiss.IndexIDMap2(index)
+
+
+def min_training_points(config):
+    """Number of vectors needed before the configured index can be trained (0 if it needs none)."""
+    mode = config["mode"]
+    if mode in ("flat", "flat_fp16", "hnsw"):
+        return 0
+    if mode == "flat_sq8":
+        return SQ_MIN_TRAINING_POINTS
+    points = POINTS_PER_CENTROID * config["nlist"]
+    if "pq" in mode:
+        points = max(points, POINTS_PER_CENTROID * PQ_CENTROIDS)
+    return points
+
+
+def apply_search_params(index, config):
+    """Set nprobe / efSearch on whichever part of the index understands them."""
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", config.get("nprobe")), ("efSearch", config.get("ef_search"))):
+        if value is None:
+            continue
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # Parameter does not apply to this index type
+
+
+def selector_params(index, selector, k):
+    """SearchParameters that restrict a search of index to the IDs selector accepts.
+
+    IVF layouts visit every cell and HNSW keeps k candidates, so the k best
+    selected vectors are found even when they are far from the query.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nlist)
+        if isinstance(index, faiss.IndexPreTransform):
+            return faiss.SearchParametersPreTransform(index_params=params)
+        return params
+    if isinstance(index, faiss.IndexIDMap2) and isinstance(faiss.downcast_index(index.index), faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=max(k, 16))
+    return faiss.SearchParameters(sel=selector)
+
+
+def train_index(index, vectors, max_points=None, seed=1234):
+    """Train index on vectors, subsampling to max_points if given."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    if max_points and len(vectors) > max_points:
+        rows = np.random.default_rng(seed).choice(len(vectors), max_points, replace=False)
+        vectors = vectors[np.sort(rows)]
+    index.train(vectors)
+
+
+def recall_at_k(index, baseline, queries, k):
+    """Fraction of the exact top-k IDs (from baseline) that index also returns."""
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    _, expected = baseline.search(queries, k)
+    _, found = index.search(queries, k)
+
+    hits = 0
+    total = 0
+    for expected_row, found_row in zip(expected, found):
+        expected_ids = set(expected_row[expected_row != -1].tolist())
+        hits += len(expected_ids & set(found_row.tolist()))
+        total += len(expected_ids)
+    return hits / total if total else 1.0
+
+
+def query_latencies(index, queries, k):
+    """Search one query at a time and return per-query latencies in milliseconds."""
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    latencies = []
+    for row in range(len(queries)):
+        start = time.perf_counter()
+        index.search(queries[row:row + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+import numpy as np
+import faiss
+
+try:
+    import fcntl  # Serializes cache updates between worker processes (POSIX only)
+except ImportError:
+    fcntl = None
+
+INDEX_FILE = "index.faiss"
+DOCS_FILE = "docs.json"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "index.lock"
+
+# Bump when the on-disk layout changes so old caches are rebuilt instead of misread
+FORMAT_VERSION = 3
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """Hash a file's bytes without reading it into memory all at once."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_atomic(path, write_fn):
+    """Write to a temp file first, then swap it in so readers never see a half-written file."""
+    tmp_path = path + ".tmp"
+    write_fn(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_npy(path, array):
+    # Saving through a file object stops np.save from appending ".npy" to the temp name
+    with open(path, "wb") as f:
+        np.save(f, array)
+
+
+def read_index_file(index_dir, mmap=False):
+    """Read the saved FAISS index, memory-mapped (read-only) or fully into RAM."""
+    return faiss.read_index(os.path.join(index_dir, INDEX_FILE), faiss.IO_FLAG_MMAP if mmap else 0)
+
+
+def cached_dimension(index_dir, model_name):
+    """Embedding dimension recorded in a current-format manifest for model_name, else None."""
+    try:
+        with open(os.path.join(index_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if manifest.get("format") != FORMAT_VERSION or manifest.get("model") != model_name:
+        return None
+    return manifest.get("dim")
+
+
+@contextmanager
+def cache_lock(index_dir, shared=False, blocking=True):
+    """Hold the cache's file lock: shared to load it, exclusive to update and save it.
+
+    Yields False (holding nothing) if blocking is False and another process
+    has the lock; without fcntl there is no lock and it always yields True.
+    """
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, LOCK_FILE), "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def manifest_stat(index_dir):
+    """(inode, mtime, size) of the manifest, or None; every save swaps in a new manifest file, so this changes."""
+    try:
+        stat = os.stat(os.path.join(index_dir, MANIFEST_FILE))
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def cache_revision(index_dir):
+    """Revision of the saved cache ("" if saved before revisions existed), or None if nothing is saved."""
+    try:
+        with open(os.path.join(index_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f).get("revision", "")
+    except FileNotFoundError:
+        return None
+    except (OSError, json.JSONDecodeError):
+        return ""
+
+
+def load_index_cache(index_dir, model_name):
+    """Load a saved FAISS index, document metadata and manifest.
+
+    Returns (index, docs, manifest, arrays) or None when nothing usable is
+    cached. The index and the extra numpy arrays are memory-mapped so startup
+    does not copy them into RAM.
+    """
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    index_path = os.path.join(index_dir, INDEX_FILE)
+    docs_path = os.path.join(index_dir, DOCS_FILE)
+
+    if not all(os.path.exists(p) for p in (manifest_path, index_path, docs_path)):
+        return None
+
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        with open(docs_path, "r", encoding="utf-8") as f:
+            docs = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"WARNING: Index cache in {index_dir} is unreadable, rebuilding... ({e})")
+        return None
+
+    if manifest.get("format") != FORMAT_VERSION:
+        print(f"Index cache format {manifest.get('format')} is outdated, rebuilding...")
+        return None
+
+    if manifest.get("model") != model_name:
+        print(f"Index cache was built with {manifest.get('model')}, rebuilding for {model_name}...")
+        return None
+
+    try:
+        index = read_index_file(index_dir, mmap=True)
+    except RuntimeError as e:
+        print(f"WARNING: Failed to read FAISS index from {index_path}! ({e})")
+        return None
+
+    arrays = {}
+    for name in manifest.get("arrays", []):
+        try:
+            arrays[name] = np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+        except (OSError, ValueError) as e:
+            print(f"WARNING: Failed to read {name}.npy from {index_dir}! ({e})")
+            return None
+
+    return index, docs, manifest, arrays
+
+
+def save_index_cache(index_dir, index, docs, manifest, arrays=None):
+    """Persist the FAISS index, document metadata, extra numpy arrays and manifest to disk."""
+    os.makedirs(index_dir, exist_ok=True)
+    arrays = arrays or {}
+    manifest = {**manifest, "format": FORMAT_VERSION, "arrays": sorted(arrays)}
+
+    def write_docs(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(docs, f)
+
+    def write_manifest(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=4)
+
+    _write_atomic(os.path.join(index_dir, INDEX_FILE), lambda path: faiss.write_index(index, path))
+    _write_atomic(os.path.join(index_dir, DOCS_FILE), write_docs)
+    for name, array in arrays.items():
+        _write_atomic(os.path.join(index_dir, f"{name}.npy"), lambda path, array=array: _write_npy(path, array))
+    # The manifest goes last: it is only valid once the files it describes are in place
+    _write_atomic(os.path.join(index_dir, MANIFEST_FILE), write_manifest)
@@ -0,0 +1,47 @@
+import heapq
+import math
+from collections import Counter
+from utils.text_processing import keyword_terms
+
+
+def term_weights(text):
+    """L2-normalized term counts of text as {term: weight}, its contribution to the keyword totals."""
+    counts = Counter(keyword_terms(text))
+    norm = math.sqrt(sum(count * count for count in counts.values()))
+    return {term: count / norm for term, count in counts.items()} if norm else {}
+
+
+def weight_deltas(old_text, new_text):
+    """Per-term (df change, weight change) when a document's text goes from old_text to new_text."""
+    deltas = {}
+    for text, sign in ((old_text, -1), (new_text, 1)):
+        for term, weight in term_weights(text or "").items():
+            df, total = deltas.get(term, (0, 0.0))
+            deltas[term] = (df + sign, total + sign * weight)
+    return {term: (df, weight) for term, (df, weight) in deltas.items() if df or abs(weight) > 1e-12}
+
+
+def idf(df, n_docs):
+    """scikit-learn's smoothed inverse document frequency."""
+    return math.log((1 + n_docs) / (1 + df)) + 1
+
+
+def top_keywords(stats, n_docs, top_n=10):
+    """Top terms by summed weight x idf from streamed (term, df, weight) rows, kept in a top_n-sized heap."""
+    scored = ((weight * idf(df, n_docs), term) for term, df, weight in stats)
+    return [term for _, term in heapq.nlargest(top_n, scored)]
+
+
+def exact_top_keywords(all_texts, top_n=10):
+    """Refit TF-IDF on every text and rank terms by their summed score (slow; used for audits)."""
+    from sklearn.feature_extraction.text import TfidfVectorizer  # Imported on first use: scikit-learn is slow to load
+
+    vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
+    tfidf_matrix = vectorizer.fit_transform(all_texts)
+    feature_names = vectorizer.get_feature_names_out()
+    tfidf_sum = tfidf_matrix.sum(axis=0)
+
+    keywords_scores = [(feature_names[i], tfidf_sum[0, i]) for i in range(len(feature_names))]
+    sorted_keywords = sorted(keywords_scores, key=lambda x: x[1], reverse=True)
+
+    return [word for word, _ in sorted_keywords[:top_n]]
@@ -0,0 +1,267 @@
+from array import array
+from collections import Counter
+import numpy as np
+from utils.text_processing import tokenize
+
+MAX_TF = np.iinfo(np.uint16).max
+
+# Arrays saved next to the FAISS index (see ReferenceIndex.save)
+ARRAY_NAMES = ("bm25_vocab", "bm25_vocab_offsets", "bm25_offsets", "bm25_rows", "bm25_tfs", "bm25_docs", "bm25_passages", "bm25_lengths")
+
+
+def encode_vocabulary(terms):
+    """Terms as one UTF-8 byte array plus the offsets where each starts (and the last ends)."""
+    encoded = [term.encode("utf-8") for term in terms]
+    offsets = np.zeros(len(encoded) + 1, dtype="int64")
+    np.cumsum([len(term) for term in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype="uint8"), offsets
+
+
+class LexicalIndex:
+    """BM25 over the reference passages, held as an inverted index.
+
+    Every passage is a row; the index maps each term to the rows containing
+    it (int32) and its frequency there (uint16). Postings live in two
+    segments: a base segment in CSR form (offsets into one rows array and
+    one tfs array), which is saved with the FAISS index and memory-mapped
+    on load, and a small appendable segment that collects documents added
+    since. Removing a document only marks its rows dead. compact() merges
+    both segments into a new base without the dead rows; it runs on every
+    save.
+
+    As in Lucene, document frequencies and the average passage length count
+    dead rows until the next compaction. Scores are normalized by the score
+    the query's own text would get, so 1.0 means the passage contains the
+    query's terms at least as often as the query does.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, max_query_terms=256):
+        self.k1 = k1
+        self.b = b
+        self.max_query_terms = max_query_terms
+        self._set_base({})
+
+    def _set_base(self, arrays):
+        empty = {
+            "bm25_vocab": np.empty(0, dtype="uint8"), "bm25_vocab_offsets": np.zeros(1, dtype="int64"),
+            "bm25_offsets": np.zeros(1, dtype="int64"), "bm25_rows": np.empty(0, dtype="int32"),
+            "bm25_tfs": np.empty(0, dtype="uint16"), "bm25_docs": np.empty(0, dtype="int64"),
+            "bm25_passages": np.empty(0, dtype="int32"), "bm25_lengths": np.empty(0, dtype="int32")
+        }
+        arrays = {**empty, **arrays}
+        blob, bounds = bytes(arrays["bm25_vocab"]), arrays["bm25_vocab_offsets"]
+        self.terms = {blob[bounds[n]:bounds[n + 1]].decode("utf-8"): n for n in range(len(bounds) - 1)}
+        self.offsets = arrays["bm25_offsets"]
+        self.rows = arrays["bm25_rows"]
+        self.tfs = arrays["bm25_tfs"]
+
+        # Rows: document ID, passage number within the document and length in terms
+        self.base_rows = len(arrays["bm25_docs"])
+        self.docs = arrays["bm25_docs"]
+        self.passages = arrays["bm25_passages"]
+        self.lengths = arrays["bm25_lengths"]
+        self.new_docs, self.new_passages, self.new_lengths = array("q"), array("i"), array("i")
+        self.new_postings = {}  # term -> (array of rows, array of tfs)
+
+        self.alive = bytearray(b"\x01") * self.base_rows
+        self.doc_rows = {}  # doc id -> (first row, row count)
+        if self.base_rows:
+            doc_ids, first, counts = np.unique(self.docs, return_index=True, return_counts=True)
+            self.doc_rows = {doc_id: (start, count) for doc_id, start, count in zip(doc_ids.tolist(), first.tolist(), counts.tolist())}
+        self.total_length = int(np.sum(self.lengths, dtype="int64"))
+        self.dead = 0
+        self._norms = None
+
+    @property
+    def row_count(self):
+        return self.base_rows + len(self.new_docs)
+
+    @property
+    def live_rows(self):
+        return self.row_count - self.dead
+
+    def __contains__(self, doc_id):
+        return doc_id in self.doc_rows
+
+    # Updates (the owner serializes them with searches)
+    def add(self, doc_id, passages):
+        """Index a document's passages, given as their term lists from tokenize() in passage order."""
+        self.remove(doc_id)
+        first = self.row_count
+        for number, terms in enumerate(passages):
+            row = first + number
+            for term, tf in Counter(terms).items():
+                rows, tfs = self.new_postings.setdefault(term, (array("i"), array("H")))
+                rows.append(row)
+                tfs.append(min(tf, MAX_TF))
+            self.new_docs.append(doc_id)
+            self.new_passages.append(number)
+            self.new_lengths.append(len(terms))
+            self.total_length += len(terms)
+        self.alive.extend(b"\x01" * len(passages))
+        self.doc_rows[doc_id] = (first, len(passages))
+        self._norms = None
+
+    def remove(self, doc_id):
+        first, count = self.doc_rows.pop(doc_id, (0, 0))
+        self.alive[first:first + count] = bytes(count)
+        self.dead += count
+
+    def _all(self, base, new, dtype):
+        return np.concatenate([base, np.frombuffer(new, dtype=dtype)]) if len(new) else np.asarray(base)
+
+    def compact(self):
+        """Merge the new segment into the base and drop dead rows."""
+        if not self.dead and not self.new_docs:
+            return
+        alive = np.frombuffer(bytes(self.alive), dtype="bool")
+        new_row = np.cumsum(alive, dtype="int64") - 1  # Row numbers after dropping dead rows
+
+        # Every posting as (term, row, tf): the base expanded from CSR, then the new segment
+        vocabulary = list(self.terms)
+        term_ids = {term: n for n, term in enumerate(vocabulary)}
+        parts = [(np.repeat(np.arange(len(vocabulary), dtype="int64"), np.diff(self.offsets)), np.asarray(self.rows), np.asarray(self.tfs))]
+        for term, (rows, tfs) in self.new_postings.items():
+            term_id = term_ids.get(term)
+            if term_id is None:
+                term_id = term_ids[term] = len(vocabulary)
+                vocabulary.append(term)
+            parts.append((np.full(len(rows), term_id, dtype="int64"), np.frombuffer(rows, dtype="int32"), np.frombuffer(tfs, dtype="uint16")))
+        terms = np.concatenate([part[0] for part in parts])
+        rows = np.concatenate([part[1] for part in parts])
+        tfs = np.concatenate([part[2] for part in parts])
+
+        keep = alive[rows]
+        terms, rows, tfs = terms[keep], new_row[rows[keep]].astype("int32"), tfs[keep]
+        order = np.lexsort((rows, terms))
+        terms, rows, tfs = terms[order], rows[order], tfs[order]
+
+        # Drop terms left without postings and renumber the rest
+        counts = np.bincount(terms, minlength=len(vocabulary))
+        used = np.flatnonzero(counts)
+        offsets = np.concatenate([[0], np.cumsum(counts[used])]).astype("int64")
+        vocab, vocab_offsets = encode_vocabulary([vocabulary[n] for n in used.tolist()])
+
+        self._set_base({
+            "bm25_vocab": vocab,
+            "bm25_vocab_offsets": vocab_offsets,
+            "bm25_offsets": offsets,
+            "bm25_rows": rows,
+            "bm25_tfs": tfs,
+            "bm25_docs": self._all(self.docs, self.new_docs, "int64")[alive],
+            "bm25_passages": self._all(self.passages, self.new_passages, "int32")[alive],
+            "bm25_lengths": self._all(self.lengths, self.new_lengths, "int32")[alive]
+        })
+
+    def arrays(self):
+        """The index as numpy arrays for saving (compacted first)."""
+        self.compact()
+        vocab, vocab_offsets = encode_vocabulary(self.terms)
+        return {
+            "bm25_vocab": vocab,
+            "bm25_vocab_offsets": vocab_offsets,
+            "bm25_offsets": np.asarray(self.offsets),
+            "bm25_rows": np.asarray(self.rows),
+            "bm25_tfs": np.asarray(self.tfs),
+            "bm25_docs": np.asarray(self.docs),
+            "bm25_passages": np.asarray(self.passages),
+            "bm25_lengths": np.asarray(self.lengths)
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, **params):
+        """An index over saved arrays, or None if any is missing."""
+        if not all(name in arrays for name in ARRAY_NAMES):
+            return None
+        index = cls(**params)
+        index._set_base({name: arrays[name] for name in ARRAY_NAMES})
+        return index
+
+    # Search
+    def _postings(self, term):
+        """(rows, tfs) pairs of a term, one per segment that has it."""
+        postings = []
+        term_id = self.terms.get(term)
+        if term_id is not None:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            postings.append((self.rows[start:end], self.tfs[start:end]))
+        if term in self.new_postings:
+            rows, tfs = self.new_postings[term]
+            postings.append((np.frombuffer(rows, dtype="int32"), np.frombuffer(tfs, dtype="uint16")))
+        return postings
+
+    def _idf(self, df):
+        n = self.row_count
+        return np.log1p((n - df + 0.5) / (df + 0.5))
+
+    def _norm(self):
+        # k1 * (1 - b + b * length / average length) per row, recomputed after updates
+        if self._norms is None:
+            lengths = self._all(self.lengths, self.new_lengths, "int32").astype("float32")
+            average = self.total_length / self.row_count if self.row_count else 1.0
+            self._norms = self.k1 * (1 - self.b + self.b * lengths / max(average, 1e-9))
+        return self._norms
+
+    def search(self, text, top_k, candidates_per_doc=10, pooling="max", pool_k=3):
+        """Top documents for a query text as [(doc id, score, passage number)], best first.
+
+        Scores are BM25 of the best passage ("max" pooling) or the mean of
+        the best pool_k passages ("topk"), normalized to [0, 1] as described
+        above. Only the max_query_terms query terms with the highest
+        weight x idf count, which keeps whole-document queries cheap.
+        """
+        if not self.live_rows:
+            return []
+        query = Counter(tokenize(text))
+        postings = {term: self._postings(term) for term in query}
+        postings = {term: lists for term, lists in postings.items() if lists}
+        if not postings:
+            return []
+
+        k1 = self.k1
+        terms = list(postings)
+        df = np.array([sum(len(rows) for rows, _ in postings[term]) for term in terms], dtype="float64")
+        qtf = np.array([query[term] for term in terms], dtype="float64")
+        weights = qtf * (k1 + 1) / (qtf + k1) * self._idf(df)  # Query term frequency saturates like a passage's
+        chosen = np.argsort(-weights)[:self.max_query_terms]
+
+        norms = self._norm()
+        scores = np.zeros(self.row_count, dtype="float32")
+        for n in chosen.tolist():
+            for rows, tfs in postings[terms[n]]:
+                tf = tfs.astype("float32")
+                scores[rows] += weights[n] * tf * (k1 + 1) / (tf + norms[rows])
+        scores *= np.frombuffer(self.alive, dtype="bool")
+
+        # The query's own score: its terms at their query frequency in a passage as long as the query
+        average = self.total_length / self.row_count
+        own_norm = k1 * (1 - self.b + self.b * sum(query.values()) / max(average, 1e-9))
+        own = float(np.sum(weights[chosen] * qtf[chosen] * (k1 + 1) / (qtf[chosen] + own_norm)))
+
+        matched = np.flatnonzero(scores)
+        limit = top_k * candidates_per_doc
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+
+        docs = self._all(self.docs, self.new_docs, "int64")
+        passages = self._all(self.passages, self.new_passages, "int32")
+        hits = {}  # doc id -> [(score, passage number)], best first
+        for row in matched.tolist():
+            hits.setdefault(int(docs[row]), []).append((float(scores[row]), int(passages[row])))
+
+        ranked = []
+        for doc_id, doc_hits in hits.items():
+            pooled = doc_hits[:pool_k] if pooling == "topk" else doc_hits[:1]
+            score = sum(score for score, _ in pooled) / len(pooled)
+            ranked.append((doc_id, min(score / own, 1.0) if own > 0 else 0.0, doc_hits[0][1]))
+        ranked.sort(key=lambda hit: hit[1], reverse=True)
+        return ranked[:top_k]
+
+    def stats(self):
+        return {
+            "terms": len(self.terms) + sum(term not in self.terms for term in self.new_postings),
+            "passages": self.live_rows,
+            "dead_passages": self.dead,
+            "postings": len(self.rows) + sum(len(rows) for rows, _ in self.new_postings.values())
+        }
@@ -0,0 +1,51 @@
+import bisect
+import threading
+
+# Default buckets for request latencies, in milliseconds
+LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Fixed-bucket histogram that can be updated from several threads."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[slot] += 1
+            self.count += 1
+            self.total += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile ("+Inf" past the last bucket, None when empty)."""
+        with self.lock:
+            if not self.count:
+                return None
+            target = q * self.count
+            seen = 0
+            for slot, count in enumerate(self.counts):
+                seen += count
+                if seen >= target:
+                    return self.buckets[slot] if slot < len(self.buckets) else "+Inf"
+        return None
+
+    def snapshot(self):
+        """Return counts per bucket plus count, sum, mean, p50 and p99."""
+        with self.lock:
+            counts = list(self.counts)
+            count, total = self.count, self.total
+        labels = [f"<={bucket:g}" for bucket in self.buckets] + ["+Inf"]
+        return {
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else None,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip(labels, counts))
+        }
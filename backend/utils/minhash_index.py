@@ -0,0 +1,133 @@
+import numpy as np
+from utils.text_processing import shingle_hashes
+
+HASH_SHIFT = np.uint64(32)
+MAX_HASH = np.uint64((1 << 32) - 1)
+HASH_CHUNK = 4096  # Shingles permuted at a time, bounding the (shingles x permutations) matrix
+
+# Arrays saved next to the FAISS index (see ReferenceIndex.save)
+ARRAY_NAMES = ("minhash_docs", "minhash_signatures", "minhash_params")
+
+
+class MinHashIndex:
+    """Near-duplicate lookup of whole documents with MinHash signatures and LSH banding.
+
+    A document's signature holds, for each of num_perm hash permutations,
+    the smallest permuted hash of its word shingles; the share of equal
+    positions in two signatures estimates the Jaccard similarity of their
+    shingle sets. Signatures are cut into bands of num_perm / bands values
+    and each band is a key into its own bucket table, so a query only
+    compares against documents that share a whole band with it: pairs at
+    Jaccard s become candidates with probability 1 - (1 - s^rows)^bands.
+    """
+
+    def __init__(self, num_perm=128, bands=16, shingle_words=5, seed=1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_words = shingle_words
+        self.seed = seed
+        # Fixed seed: signatures saved by one process must match queries hashed by another
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(0, np.iinfo(np.uint64).max, num_perm, dtype=np.uint64) | np.uint64(1)  # Odd multipliers
+        self.b = rng.randint(0, np.iinfo(np.uint64).max, num_perm, dtype=np.uint64)
+        self.signatures = {}  # doc id -> uint32 signature
+        self.unsigned = set()  # Documents without a word to shingle: never matched, but known to be indexed
+        self.buckets = [{} for _ in range(bands)]  # band key -> set of doc ids, per band
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.signatures or doc_id in self.unsigned
+
+    def doc_ids(self):
+        """Every document added, with or without a signature."""
+        return set(self.signatures) | self.unsigned
+
+    def signature(self, text):
+        """MinHash signature of a text (uint32 array), or None if it has no words."""
+        hashes = shingle_hashes(text, self.shingle_words)
+        if not len(hashes):
+            return None
+        signature = np.full(self.num_perm, MAX_HASH, dtype="uint64")
+        for first in range(0, len(hashes), HASH_CHUNK):
+            chunk = hashes[first:first + HASH_CHUNK, None]
+            permuted = (chunk * self.a + self.b) >> HASH_SHIFT  # Multiply-shift hashing: wraps modulo 2**64, keep the top 32 bits
+            np.minimum(signature, permuted.min(axis=0), out=signature)
+        return signature.astype("uint32")
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    # Updates (the owner serializes them with queries)
+    def add(self, doc_id, signature):
+        self.remove(doc_id)
+        if signature is None:
+            self.unsigned.add(doc_id)
+            return
+        self.signatures[doc_id] = signature
+        for buckets, key in zip(self.buckets, self._band_keys(signature)):
+            buckets.setdefault(key, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        self.unsigned.discard(doc_id)
+        signature = self.signatures.pop(doc_id, None)
+        if signature is None:
+            return
+        for buckets, key in zip(self.buckets, self._band_keys(signature)):
+            bucket = buckets.get(key)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del buckets[key]
+
+    def query(self, signature, threshold):
+        """[(doc id, estimated Jaccard)] of the documents at or above threshold, most similar first."""
+        if signature is None:
+            return []
+        candidates = set()
+        for buckets, key in zip(self.buckets, self._band_keys(signature)):
+            candidates.update(buckets.get(key, ()))
+        matches = []
+        for doc_id in candidates:
+            jaccard = float(np.count_nonzero(self.signatures[doc_id] == signature)) / self.num_perm
+            if jaccard >= threshold:
+                matches.append((doc_id, jaccard))
+        matches.sort(key=lambda match: match[1], reverse=True)
+        return matches
+
+    def arrays(self):
+        doc_ids = np.fromiter(self.signatures, dtype="int64", count=len(self.signatures))
+        signatures = np.stack(list(self.signatures.values())) if self.signatures else np.empty((0, self.num_perm), dtype="uint32")
+        return {
+            "minhash_docs": doc_ids,
+            "minhash_signatures": signatures,
+            "minhash_unsigned": np.array(sorted(self.unsigned), dtype="int64"),
+            "minhash_params": np.array([self.num_perm, self.shingle_words, self.seed], dtype="int64")
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, **params):
+        """An index over saved signatures, or None if they are missing or were made with other parameters."""
+        if not all(name in arrays for name in ARRAY_NAMES):
+            return None
+        index = cls(**params)
+        if np.asarray(arrays["minhash_params"]).tolist() != [index.num_perm, index.shingle_words, index.seed]:
+            return None  # Hashed differently; the band count can change freely since buckets are rebuilt
+        signatures = np.array(arrays["minhash_signatures"])
+        for doc_id, signature in zip(arrays["minhash_docs"].tolist(), signatures):
+            index.add(doc_id, signature)
+        for doc_id in np.asarray(arrays.get("minhash_unsigned", [])).tolist():  # Not saved by older versions
+            index.add(doc_id, None)
+        return index
+
+    def stats(self):
+        return {
+            "documents": len(self.signatures),
+            "permutations": self.num_perm,
+            "bands": self.bands,
+            "shingle_words": self.shingle_words
+        }
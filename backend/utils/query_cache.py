@@ -0,0 +1,142 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+def normalize_query(text):
+    """Collapse whitespace so re-submitted copies of a text share a cache entry."""
+    return " ".join(text.split())
+
+
+class LRUCache:
+    """Thread-safe LRU map with an optional time-to-live per entry."""
+
+    def __init__(self, max_items, ttl=None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.items = OrderedDict()  # key -> (value, expires at or None), most recently used last
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.items.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                self.items.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self.items[key]  # Expired
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_items <= 0:
+            return
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + self.ttl if self.ttl else None)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def metrics(self):
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self.items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None
+        }
+
+
+class QueryCache:
+    """Two-level cache in front of query encoding and index search.
+
+    Level one maps the hash of the normalized query text to its embedding
+    (LRU with a TTL). Level two maps the hash of an embedding, the search
+    parameters and the reference index version to the search hits; it is
+    emptied whenever the index version changes, since any corpus change can
+    change the hits. The time saved is estimated from the running average
+    cost of the misses.
+    """
+
+    def __init__(self, embedding_items=1024, embedding_ttl=3600, result_items=1024):
+        self.embeddings = LRUCache(embedding_items, embedding_ttl)
+        self.results = LRUCache(result_items)
+        self.index_version = None
+        self.lock = threading.Lock()
+        self.encode_ms = 0.0  # Total time spent on misses, per level
+        self.search_ms = 0.0
+
+    @staticmethod
+    def text_key(text):
+        return hashlib.sha256(normalize_query(text).encode("utf-8")).hexdigest()
+
+    def embedding(self, text, encode):
+        """The embedding of text, from the cache or encode(text)."""
+        key = self.text_key(text)
+        embedding = self.embeddings.get(key)
+        if embedding is None:
+            start = time.perf_counter()
+            embedding = encode(text)
+            embedding.setflags(write=False)  # Shared between requests
+            with self.lock:
+                self.encode_ms += (time.perf_counter() - start) * 1000
+            self.embeddings.put(key, embedding)
+        return embedding
+
+    def embed_many(self, texts, encode):
+        """(n, dim) embeddings of texts; the uncached ones are encoded together in one encode(list) call."""
+        keys = [self.text_key(text) for text in texts]
+        found = [self.embeddings.get(key) for key in keys]
+        missing = [position for position, embedding in enumerate(found) if embedding is None]
+        if missing:
+            start = time.perf_counter()
+            encoded = encode([texts[position] for position in missing])
+            with self.lock:
+                self.encode_ms += (time.perf_counter() - start) * 1000
+            for position, embedding in zip(missing, encoded):
+                embedding.setflags(write=False)
+                self.embeddings.put(keys[position], embedding)
+                found[position] = embedding
+        return np.vstack(found)
+
+    def hits(self, embedding, index_version, params, search):
+        """Search hits for an embedding, from the cache or search()."""
+        with self.lock:
+            if index_version != self.index_version:
+                self.results.clear()
+                self.index_version = index_version
+
+        key = (hashlib.sha256(embedding.tobytes()).hexdigest(), index_version, params)
+        hits = self.results.get(key)
+        if hits is None:
+            start = time.perf_counter()
+            hits = search()
+            with self.lock:
+                self.search_ms += (time.perf_counter() - start) * 1000
+            self.results.put(key, hits)
+        return hits
+
+    def metrics(self):
+        embeddings, results = self.embeddings.metrics(), self.results.metrics()
+        mean_encode_ms = self.encode_ms / embeddings["misses"] if embeddings["misses"] else 0.0
+        mean_search_ms = self.search_ms / results["misses"] if results["misses"] else 0.0
+        return {
+            "embeddings": embeddings,
+            "results": results,
+            "index_version": self.index_version,
+            "saved_encode_ms": embeddings["hits"] * mean_encode_ms,
+            "saved_search_ms": results["hits"] * mean_search_ms
+        }
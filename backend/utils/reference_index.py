@@ -0,0 +1,739 @@
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import numpy as np
+import faiss
+from utils.index_store import (
+    file_sha256, load_index_cache, save_index_cache, read_index_file, cache_lock, cache_revision, manifest_stat
+)
+from utils.lexical_index import LexicalIndex
+from utils.minhash_index import MinHashIndex
+from utils.winnowing import Winnower, empty_fingerprints
+from utils.text_processing import tokenize
+from utils.index_factory import (
+    build_index, index_description, min_training_points, apply_search_params, selector_params, train_index, recall_at_k
+)
+
+
+class RWLock:
+    """Readers-writer lock: searches run concurrently, index updates run alone."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            # Waiting writers go first so a steady stream of searches cannot starve them
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+# Passage IDs pack the document ID into the high bits, so all passages of a
+# document form one contiguous ID range that can be removed in a single call
+PASSAGE_ID_BITS = 20
+MAX_PASSAGES_PER_DOC = 1 << PASSAGE_ID_BITS
+
+# Layout used until a trainable index has seen enough vectors to be trained
+STAGING_LAYOUT = "Flat"
+RECALL_SAMPLE_QUERIES = 200
+RECALL_K = 10
+
+
+def passage_id_range(doc_id):
+    """Return the [start, end) passage ID range owned by a document."""
+    return doc_id << PASSAGE_ID_BITS, (doc_id + 1) << PASSAGE_ID_BITS
+
+
+class ReferenceIndex:
+    """Reference corpus held in an ID-mapped FAISS index of passages.
+
+    Each document is split into overlapping passages and every passage gets
+    its own vector. Passage IDs are derived from a stable document ID, so
+    adding, replacing or removing one document only touches that document's
+    vectors. Embedding happens outside the index lock; searches only wait
+    for the short index update.
+
+    Passage text is not stored separately: each document keeps its text
+    plus an (n, 2) array of character spans, which keeps the chunk store
+    small enough to grow to millions of passages.
+
+    The index layout comes from index_config and the metric from metric
+    (see utils/index_factory.py). Search results carry a "score" where
+    higher is better: cosine similarity for "cosine", negated L2 distance
+    for "l2".
+    Layouts that need training start as an exact flat index and are trained
+    on the corpus once it holds enough passages; the recall@k of the trained
+    index against that exact baseline is recorded in the manifest.
+
+    The same passages are also indexed for BM25 (see utils/lexical_index.py,
+    configured by lexical_params) and saved alongside the vectors, as are
+    MinHash signatures of whole documents for near-duplicate lookups (see
+    utils/minhash_index.py, configured by minhash_params) and winnowing
+    fingerprints of every document, used to locate the passages a query
+    shares with a match (see utils/winnowing.py, fingerprint_params).
+
+    Several processes (gunicorn workers, scan workers) can open the same
+    index_dir. Updates hold the cache's exclusive file lock from reloading
+    the latest saved state to saving their own, so no process overwrites
+    another's change; reads reload the cache whenever another process has
+    saved a newer revision since (see refresh).
+    """
+
+    def __init__(self, encode, extract, chunk, dim, model_name, docs_dir, index_dir, index_config, metric="cosine", candidates_per_doc=10, extract_many=None, lexical_params=None, minhash_params=None, fingerprint_params=None):
+        self.encode = encode
+        self.extract = extract
+        # extract_many(paths) -> (path, text) in order, for extracting a whole sync in parallel
+        self.extract_many = extract_many or (lambda paths: ((path, self.extract(path)) for path in paths))
+        self.chunk = chunk
+        self.dim = dim
+        self.model_name = model_name
+        self.docs_dir = docs_dir
+        self.index_dir = index_dir
+        self.index_config = index_config
+        self.metric = metric
+        self.candidates_per_doc = candidates_per_doc
+        self.lexical_params = lexical_params or {}
+        self.minhash_params = minhash_params or {}
+        self.winnower = Winnower(**(fingerprint_params or {}))
+
+        self.lock = RWLock()
+        self.update_lock = threading.Lock()  # One ingestion at a time, end to end
+
+        self.index = self._new_index()
+        self.lexical = LexicalIndex(**self.lexical_params)
+        self.minhash = MinHashIndex(**self.minhash_params)
+        self.docs = {}  # doc id -> {"name", "sha256", "text", "spans", "fingerprints"}
+        self.ids_by_name = {}
+        self.skipped = {}  # name -> sha256 of files without extractable text
+        self.next_id = 0
+        self.mmapped = False
+        self.stale = 0  # Vectors of removed documents still inside an index that cannot delete
+        self.recall = None
+        self.version = 0  # Bumped on every change to what searches can return (cache key for results)
+        self.revision = None  # Revision of the saved cache the in-memory index matches
+        self.manifest_stat = None  # Manifest file as last checked, so an unchanged cache costs one stat
+
+    @property
+    def target_layout(self):
+        return index_description(self.index_config)
+
+    def _exact_index(self):
+        return build_index(self.dim, {"mode": "flat"}, self.metric)
+
+    def _new_index(self):
+        if min_training_points(self.index_config):
+            self.layout = STAGING_LAYOUT
+            return self._exact_index()
+        self.layout = self.target_layout
+        index = build_index(self.dim, self.index_config, self.metric)
+        apply_search_params(index, self.index_config)
+        return index
+
+    @property
+    def ntotal(self):
+        """Number of live indexed passages."""
+        return self.index.ntotal - self.stale
+
+    @property
+    def document_count(self):
+        return len(self.docs)
+
+    def documents(self):
+        """Return {document name: text} for every indexed document."""
+        self.refresh()
+        with self.lock.read():
+            return {doc["name"]: doc["text"] for doc in self.docs.values()}
+
+    # Persistence
+    def _load_cache(self):
+        """Load the saved index. Returns True if data derived from it had to be rebuilt and should be saved."""
+        cached = load_index_cache(self.index_dir, self.model_name)
+        if not cached:
+            return False
+
+        index, docs, manifest, arrays = cached
+        self.revision = manifest.get("revision", "")
+        if manifest.get("metric") != self.metric:
+            print(f"Index cache uses metric {manifest.get('metric')}, rebuilding for {self.metric}...")
+            return False
+
+        layout = manifest.get("layout")
+        allowed = {self.target_layout}
+        if min_training_points(self.index_config):
+            allowed.add(STAGING_LAYOUT)  # Not trained yet
+        if layout not in allowed:
+            print(f"Index cache uses layout {layout}, rebuilding as {self.target_layout}...")
+            return False
+
+        hashes = manifest.get("documents", {})
+        entries = docs.get("documents", [])
+        # Spans are small next to the vectors; copy them so the file can be rewritten later
+        passages = np.array(arrays.get("passages", np.empty((0, 3), dtype="int64")))
+        stale = manifest.get("stale", 0)
+        if index.ntotal != len(passages) + stale or any(doc["name"] not in hashes for doc in entries):
+            print("WARNING: Index cache is inconsistent with its metadata, rebuilding...")
+            return False
+
+        # passages rows are (doc id, start, end), grouped by document
+        doc_ids, first_rows = np.unique(passages[:, 0], return_index=True)
+        spans_by_doc = dict(zip(doc_ids.tolist(), np.split(passages[:, 1:], first_rows[1:])))
+
+        apply_search_params(index, self.index_config)
+        self.index = index
+        self.layout = layout
+        self.stale = stale
+        self.recall = manifest.get("recall")
+        self.mmapped = True
+        self.docs = {
+            doc["id"]: {
+                "name": doc["name"],
+                "sha256": hashes[doc["name"]],
+                "text": doc["text"],
+                "spans": spans_by_doc.get(doc["id"], np.empty((0, 2), dtype="int64"))
+            }
+            for doc in entries
+        }
+        self.ids_by_name = {doc["name"]: doc_id for doc_id, doc in self.docs.items()}
+        rebuilt = False
+        self.lexical = LexicalIndex.from_arrays(arrays, **self.lexical_params)
+        if self.lexical is None or self.lexical.live_rows != len(passages):
+            rebuilt = True
+            # Saved before lexical search existed: tokenize the cached passages once
+            print("Building the BM25 index from the cached passages...")
+            self.lexical = LexicalIndex(**self.lexical_params)
+            for doc_id, doc in self.docs.items():
+                self.lexical.add(doc_id, self._passage_terms(doc["text"], doc["spans"]))
+        self.minhash = MinHashIndex.from_arrays(arrays, **self.minhash_params)
+        if self.minhash is None or self.minhash.doc_ids() != set(self.docs):
+            rebuilt = True
+            # Saved before signatures existed, or with other MinHash settings: hash the cached texts once
+            print("Building MinHash signatures from the cached documents...")
+            self.minhash = MinHashIndex(**self.minhash_params)
+            for doc_id, doc in self.docs.items():
+                self.minhash.add(doc_id, self.minhash.signature(doc["text"]))
+        fingerprints = self.winnower.from_arrays(arrays)
+        if fingerprints is None:
+            rebuilt = True
+            print("Building winnowing fingerprints from the cached documents...")
+            fingerprints = {doc_id: self.winnower.fingerprint(doc["text"]) for doc_id, doc in self.docs.items()}
+        for doc_id, doc in self.docs.items():
+            doc["fingerprints"] = fingerprints.get(doc_id) or empty_fingerprints()
+        self.skipped = manifest.get("skipped", {})
+        self.next_id = docs.get("next_id", max(self.docs, default=-1) + 1)
+        self.version += 1
+        return rebuilt
+
+    def save(self):
+        """Write the index, document metadata, passage spans, BM25 postings, MinHash signatures and fingerprints to disk."""
+        with self.lock.write():
+            self.lexical.compact()
+        with self.lock.read():
+            docs = {
+                "next_id": self.next_id,
+                "documents": [
+                    {"id": doc_id, "name": doc["name"], "text": doc["text"]}
+                    for doc_id, doc in self.docs.items()
+                ]
+            }
+            manifest = {
+                "model": self.model_name,
+                "dim": self.dim,
+                "documents": {doc["name"]: doc["sha256"] for doc in self.docs.values()},
+                "skipped": self.skipped,
+                "metric": self.metric,
+                "layout": self.layout,
+                "stale": self.stale,
+                "recall": self.recall
+            }
+            passages = [
+                np.column_stack((np.full(len(doc["spans"]), doc_id, dtype="int64"), doc["spans"]))
+                for doc_id, doc in self.docs.items()
+            ]
+            passages = np.concatenate(passages) if passages else np.empty((0, 3), dtype="int64")
+            fingerprints = self.winnower.arrays({doc_id: doc["fingerprints"] for doc_id, doc in self.docs.items()})
+            arrays = {"passages": passages, **self.lexical.arrays(), **self.minhash.arrays(), **fingerprints}
+            manifest["revision"] = uuid.uuid4().hex
+            save_index_cache(self.index_dir, self.index, docs, manifest, arrays)
+            self.revision = manifest["revision"]
+            self.manifest_stat = manifest_stat(self.index_dir)
+
+    # Changes saved by other processes
+    def _reload_if_changed(self):
+        """Load the saved cache if it is newer than the in-memory index; callers hold update_lock and the cache lock.
+
+        Returns True if data derived from the cache had to be rebuilt and should be saved.
+        """
+        self.manifest_stat = manifest_stat(self.index_dir)
+        revision = cache_revision(self.index_dir)
+        if revision == self.revision:
+            return False
+        self.revision = revision  # Even if the cache turns out unusable, so it is not retried on every search
+        with self.lock.write():
+            return self._load_cache()
+
+    def refresh(self):
+        """Reload the index if another process saved a newer one; costs one stat when nothing changed.
+
+        Returns True if the saved cache was checked again.
+        """
+        if manifest_stat(self.index_dir) == self.manifest_stat:
+            return False
+        if not self.update_lock.acquire(blocking=False):
+            return False  # An update in this process reloaded first and holds the cache lock, so nothing newer exists
+        try:
+            # Another process still updating keeps the lock; serve the current index and check again next time
+            with cache_lock(self.index_dir, shared=True, blocking=False) as locked:
+                if locked:
+                    self._reload_if_changed()
+                return locked
+        finally:
+            self.update_lock.release()
+
+    # Index updates (callers hold self.lock.write())
+    def _make_writable(self):
+        # A memory-mapped index is read-only; load it into RAM before the first change
+        if self.mmapped:
+            self.index = read_index_file(self.index_dir)
+            apply_search_params(self.index, self.index_config)
+            self.mmapped = False
+
+    def _remove_locked(self, name):
+        doc_id = self.ids_by_name.pop(name, None)
+        if doc_id is None:
+            return False
+        try:
+            self.index.remove_ids(faiss.IDSelectorRange(*passage_id_range(doc_id)))
+        except RuntimeError:
+            # Layouts like HNSW cannot delete: the vectors stay behind and search
+            # skips IDs whose document is gone
+            self.stale += len(self.docs[doc_id]["spans"])
+        self.lexical.remove(doc_id)
+        self.minhash.remove(doc_id)
+        del self.docs[doc_id]
+        self.version += 1
+        return True
+
+    def _add_locked(self, name, sha256, text, spans, embeddings, terms, signature, fingerprints):
+        doc_id = self.next_id
+        self.next_id += 1
+        first_id, _ = passage_id_range(doc_id)
+        self.index.add_with_ids(
+            np.asarray(embeddings, dtype="float32").reshape(len(spans), -1),
+            np.arange(first_id, first_id + len(spans), dtype="int64")
+        )
+        self.lexical.add(doc_id, terms)
+        self.minhash.add(doc_id, signature)
+        self.docs[doc_id] = {"name": name, "sha256": sha256, "text": text, "spans": spans, "fingerprints": fingerprints}
+        self.ids_by_name[name] = doc_id
+        self.version += 1
+        return doc_id
+
+    @staticmethod
+    def _passage_terms(text, spans):
+        return [tokenize(text[start:end]) for start, end in spans]
+
+    def _prepare(self, name, text):
+        """Chunk, embed, tokenize, MinHash and fingerprint a document's text.
+
+        Returns (spans, embeddings, passage terms, signature, fingerprints).
+        """
+        spans = self.chunk(text)
+        if len(spans) > MAX_PASSAGES_PER_DOC:
+            print(f"WARNING: {name} has {len(spans)} passages, indexing the first {MAX_PASSAGES_PER_DOC}")
+            spans = spans[:MAX_PASSAGES_PER_DOC]
+        spans = np.asarray(spans, dtype="int64").reshape(-1, 2)
+        embeddings = self.encode([text[start:end] for start, end in spans])
+        return spans, embeddings, self._passage_terms(text, spans), self.minhash.signature(text), self.winnower.fingerprint(text)
+
+    def sync(self):
+        """Bring the index in line with the files in the reference folder.
+
+        The saved index is reused as-is; only new or changed files are
+        extracted and embedded, and deleted files are dropped from the index.
+        """
+        if not os.path.exists(self.docs_dir):
+            print(f"ERROR: Reference documents folder {self.docs_dir} not found!")
+            return {}
+
+        # Hash every reference file so unchanged ones can be taken from the cache
+        file_hashes = {}
+        for filename in sorted(os.listdir(self.docs_dir)):
+            file_path = os.path.join(self.docs_dir, filename)
+            if os.path.isfile(file_path):
+                file_hashes[filename] = file_sha256(file_path)
+
+        with self.update_lock, cache_lock(self.index_dir):
+            rebuilt = self._reload_if_changed()
+
+            indexed = {doc["name"]: doc["sha256"] for doc in self.docs.values()}
+            removed = [name for name in indexed if name not in file_hashes]
+            changed = [
+                name for name, sha256 in file_hashes.items()
+                if indexed.get(name) != sha256 and self.skipped.get(name) != sha256
+            ]
+
+            if not removed and not changed:
+                if rebuilt:
+                    self.save()
+                print(f"SUCCESS: Loaded {len(self.docs)} documents into FAISS from cache")
+                return self.documents()
+
+            with self.lock.write():
+                self._make_writable()
+                for name in removed:
+                    self._remove_locked(name)
+                for name in list(self.skipped):
+                    if file_hashes.get(name) != self.skipped[name]:
+                        del self.skipped[name]
+
+            # Files are extracted in parallel ahead of the loop; one document is embedded and added
+            # at a time, which keeps memory bounded and lets searches run in between
+            embedded = 0
+            texts = self.extract_many([os.path.join(self.docs_dir, name) for name in changed])
+            for name, (_, text) in zip(changed, texts):
+                spans, embeddings, terms, signature, fingerprints = self._prepare(name, text) if text else (None,) * 5
+                with self.lock.write():
+                    self._remove_locked(name)
+                    if spans is None or not len(spans):
+                        self.skipped[name] = file_hashes[name]
+                        print(f"ERROR: Failed to extract text from {name}!")
+                        continue
+                    self._add_locked(name, file_hashes[name], text, spans, embeddings, terms, signature, fingerprints)
+                embedded += 1
+                print(f"Embedded {len(spans)} passages from {name}!")
+
+            self._maybe_rebuild()
+            self.save()
+
+        if not self.docs:
+            print("ERROR: No reference documents loaded!")
+            return {}
+
+        print(f"SUCCESS: Loaded {len(self.docs)} documents ({self.ntotal} passages) into FAISS ({embedded} embedded)")
+        return self.documents()
+
+    def add_document(self, file_path, name=None):
+        """Index a single document, replacing any indexed document with the same name.
+
+        Returns the new document ID. Raises ValueError if no text can be extracted.
+        """
+        name = name or os.path.basename(file_path)
+        sha256 = file_sha256(file_path)
+
+        with self.update_lock, cache_lock(self.index_dir):
+            self._reload_if_changed()
+            text = self.extract(file_path)
+            spans, embeddings, terms, signature, fingerprints = self._prepare(name, text) if text else (None,) * 5
+            if spans is None or not len(spans):
+                raise ValueError(f"Failed to extract text from {name}")
+
+            with self.lock.write():
+                self._make_writable()
+                self._remove_locked(name)
+                doc_id = self._add_locked(name, sha256, text, spans, embeddings, terms, signature, fingerprints)
+                self.skipped.pop(name, None)
+
+            self._maybe_rebuild()
+            self.save()
+
+        print(f"SUCCESS: Indexed {name} as document {doc_id} ({len(spans)} passages)")
+        return doc_id
+
+    def remove_document(self, name):
+        """Drop a document from the index. Returns False if it was not indexed."""
+        with self.update_lock, cache_lock(self.index_dir):
+            self._reload_if_changed()
+            with self.lock.write():
+                self._make_writable()
+                removed = self._remove_locked(name)
+                self.skipped.pop(name, None)
+
+            if removed:
+                self._maybe_rebuild()
+                self.save()
+        return removed
+
+    # Training and compaction (callers hold self.update_lock)
+    def _live_vectors(self):
+        """Return (vectors, passage ids) of every live passage in the current index."""
+        with self.lock.read():
+            ivf = faiss.try_extract_index_ivf(self.index)
+            if ivf is None:
+                ids = faiss.vector_to_array(self.index.id_map)
+                # Flat and HNSW-flat storage keep raw vectors in id_map order
+                vectors = self.index.index.reconstruct_n(0, len(ids))
+            else:
+                # IVF layouts hold IDs in their inverted lists; reconstructing by ID needs a direct map for the duration
+                invlists = ivf.invlists
+                ids = np.concatenate([np.empty(0, dtype="int64")] + [
+                    faiss.rev_swig_ptr(invlists.get_ids(number), invlists.list_size(number)).copy()
+                    for number in range(ivf.nlist) if invlists.list_size(number)
+                ])
+                ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+                try:
+                    vectors = self.index.reconstruct_batch(ids) if len(ids) else np.empty((0, self.dim), dtype="float32")
+                finally:
+                    ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+            live = np.isin(ids >> PASSAGE_ID_BITS, np.fromiter(self.docs, dtype="int64"))
+        return vectors[live], ids[live]
+
+    def _maybe_rebuild(self):
+        """Train the configured index once the staging index is big enough, or compact dead vectors."""
+        needs_training = self.layout == STAGING_LAYOUT and self.layout != self.target_layout
+        if needs_training and self.ntotal < min_training_points(self.index_config):
+            return
+        if not needs_training and self.stale <= self.ntotal:
+            return
+
+        vectors, ids = self._live_vectors()
+        print(f"Building {self.target_layout} index over {len(ids)} passages...")
+        index = build_index(self.dim, self.index_config, self.metric)
+        if not index.is_trained:
+            train_index(index, vectors, max_points=self.index_config.get("nlist", 0) * 256 or None)
+        index.add_with_ids(vectors, ids)
+        apply_search_params(index, self.index_config)
+
+        # Measure recall@k of the new index against exact search on a sample of the corpus
+        rows = np.random.default_rng(0).choice(len(vectors), min(len(vectors), RECALL_SAMPLE_QUERIES), replace=False)
+        if self.layout == STAGING_LAYOUT:
+            baseline = self.index  # Already exact, no need for a second copy
+        else:
+            baseline = self._exact_index()
+            baseline.add_with_ids(vectors, ids)
+        recall = recall_at_k(index, baseline, vectors[rows], RECALL_K)
+        print(f"SUCCESS: {self.target_layout} index ready, recall@{RECALL_K} vs Flat = {recall:.3f}")
+
+        with self.lock.write():
+            self.index = index
+            self.layout = self.target_layout
+            self.stale = 0
+            self.mmapped = False
+            self.recall = {"k": RECALL_K, "value": recall, "queries": len(rows)}
+            self.version += 1
+
+    def stats(self):
+        """Describe the index layout, size and measured recall."""
+        self.refresh()
+        with self.lock.read():
+            return {
+                "metric": self.metric,
+                "layout": self.layout,
+                "target_layout": self.target_layout,
+                "documents": len(self.docs),
+                "passages": self.ntotal,
+                "stale_vectors": self.stale,
+                "version": self.version,
+                "nprobe": self.index_config.get("nprobe"),
+                "ef_search": self.index_config.get("ef_search"),
+                "recall": self.recall,
+                "lexical": self.lexical.stats(),
+                "minhash": self.minhash.stats(),
+                "fingerprints": {
+                    "k": self.winnower.k,
+                    "window": self.winnower.window,
+                    "count": sum(len(doc["fingerprints"][0]) for doc in self.docs.values())
+                }
+            }
+
+    def _search_index(self, query_embeddings, top_k, doc_ids=None):
+        """Nearest passages as FAISS (scores, ids); callers hold self.lock.read().
+
+        With doc_ids only those documents' passages are searched, and all of
+        them are returned, so every listed document gets its exact score.
+        """
+        if doc_ids is None:
+            # Fetch enough passages that top_k distinct documents are likely among them
+            return self.index.search(query_embeddings, min(self.index.ntotal, top_k * self.candidates_per_doc))
+
+        ranges = [passage_id_range(doc_id)[0] + np.arange(len(self.docs[doc_id]["spans"])) for doc_id in doc_ids if doc_id in self.docs]
+        ids = np.concatenate(ranges).astype("int64") if ranges else np.empty(0, dtype="int64")
+        if not len(ids):
+            return np.empty((len(query_embeddings), 0), dtype="float32"), np.empty((len(query_embeddings), 0), dtype="int64")
+        selector = faiss.IDSelectorBatch(ids)  # Kept referenced until the search returns
+        return self.index.search(query_embeddings, len(ids), params=selector_params(self.index, selector, len(ids)))
+
+    def search(self, query_embeddings, top_k, pooling="max", pool_k=3, doc_ids=None):
+        """Search passages and aggregate the hits into document-level results.
+
+        pooling="max" scores a document by its best passage, "topk" by the
+        mean score of its best pool_k passages. Returns one list per query
+        of {"document", "score", "passage"} dicts, best first. doc_ids
+        limits the search to those documents (see _search_index).
+        """
+        query_embeddings = np.asarray(query_embeddings, dtype="float32").reshape(-1, self.dim)
+        # FAISS returns distances for L2; flip them so a higher score is always better
+        sign = -1.0 if self.metric == "l2" else 1.0
+
+        self.refresh()
+        with self.lock.read():
+            if self.ntotal == 0:
+                return [[] for _ in range(len(query_embeddings))]
+
+            scores, ids = self._search_index(query_embeddings, top_k, doc_ids)
+
+            results = []
+            for row_ids, row_scores in zip(ids, scores):
+                hits = {}  # doc id -> passage hits, best first
+                for passage_id, score in zip(row_ids.tolist(), row_scores.tolist()):
+                    if passage_id == -1:
+                        continue
+                    doc_id = passage_id >> PASSAGE_ID_BITS
+                    if doc_id in self.docs:
+                        hits.setdefault(doc_id, []).append((sign * score, passage_id))
+
+                ranked = []
+                for doc_id, doc_hits in hits.items():
+                    pooled = doc_hits[:pool_k] if pooling == "topk" else doc_hits[:1]
+                    _, best_passage = doc_hits[0]
+                    doc = self.docs[doc_id]
+                    start, end = doc["spans"][best_passage & (MAX_PASSAGES_PER_DOC - 1)]
+                    ranked.append({
+                        "document": doc,
+                        "score": sum(score for score, _ in pooled) / len(pooled),
+                        "passage": doc["text"][start:end]
+                    })
+
+                ranked.sort(key=lambda hit: hit["score"], reverse=True)
+                results.append(ranked[:top_k])
+            return results
+
+    def search_passages(self, query_embeddings, top_k, pooling="max", pool_k=3, timings=None, doc_ids=None):
+        """Search with a query split into passages: one batched search, evidence aggregated per document.
+
+        For every document, each query passage contributes the score of its
+        best passage in that document (when among its candidates); pooling
+        over those scores works as in search(). Returns one list of
+        {"document", "score", "passage", "coverage", "matched"} dicts, best
+        first: coverage is the share of query passages whose nearest
+        reference passage is in the document, matched the number of query
+        passages with any evidence for it. Search and aggregation times (ms)
+        are added to timings if given. doc_ids limits the search to those
+        documents (see _search_index).
+        """
+        query_embeddings = np.asarray(query_embeddings, dtype="float32").reshape(-1, self.dim)
+        sign = -1.0 if self.metric == "l2" else 1.0
+        timings = {} if timings is None else timings
+
+        self.refresh()
+        with self.lock.read():
+            if self.ntotal == 0:
+                return []
+
+            start = time.perf_counter()
+            scores, ids = self._search_index(query_embeddings, top_k, doc_ids)
+            timings["search"] = timings.get("search", 0) + (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            evidence = {}  # doc id -> {query row: (score, passage id)} of the best passage per query passage
+            nearest = {}  # doc id -> query passages whose nearest passage is in it
+            for row, (row_ids, row_scores) in enumerate(zip(ids.tolist(), scores.tolist())):
+                first = True  # Hits come best first
+                for passage_id, score in zip(row_ids, row_scores):
+                    doc_id = passage_id >> PASSAGE_ID_BITS
+                    if passage_id == -1 or doc_id not in self.docs:
+                        continue
+                    if first:
+                        nearest[doc_id] = nearest.get(doc_id, 0) + 1
+                        first = False
+                    doc_evidence = evidence.setdefault(doc_id, {})
+                    if row not in doc_evidence:
+                        doc_evidence[row] = (sign * score, passage_id)
+
+            ranked = []
+            for doc_id, doc_evidence in evidence.items():
+                hits = sorted(doc_evidence.values(), reverse=True)
+                pooled = hits[:pool_k] if pooling == "topk" else hits[:1]
+                doc = self.docs[doc_id]
+                start_char, end_char = doc["spans"][hits[0][1] & (MAX_PASSAGES_PER_DOC - 1)]
+                ranked.append({
+                    "document": doc,
+                    "score": sum(score for score, _ in pooled) / len(pooled),
+                    "passage": doc["text"][start_char:end_char],
+                    "coverage": nearest.get(doc_id, 0) / len(query_embeddings),
+                    "matched": len(doc_evidence)
+                })
+            ranked.sort(key=lambda hit: hit["score"], reverse=True)
+            timings["aggregate"] = timings.get("aggregate", 0) + (time.perf_counter() - start) * 1000
+            return ranked[:top_k]
+
+    def search_lexical(self, query_texts, top_k, pooling="max", pool_k=3):
+        """BM25 counterpart of search(): one list per query text of {"document", "score", "passage"}.
+
+        Scores are normalized BM25 in [0, 1] (see LexicalIndex.search), not
+        similarities in the index metric. Needs no embedding model.
+        """
+        self.refresh()
+        with self.lock.read():
+            results = []
+            for text in query_texts:
+                ranked = []
+                for doc_id, score, number in self.lexical.search(text, top_k, self.candidates_per_doc, pooling, pool_k):
+                    doc = self.docs.get(doc_id)
+                    if doc is None:
+                        continue
+                    start, end = doc["spans"][number]
+                    ranked.append({"document": doc, "score": score, "passage": doc["text"][start:end]})
+                results.append(ranked)
+            return results
+
+    def find_near_duplicates(self, query_text, threshold, top_k):
+        """Documents whose MinHash signature puts their Jaccard similarity with query_text at threshold or above.
+
+        Returns [{"document", "score", "passage"}] with the estimated Jaccard
+        similarity (0..1) as score and the document's first passage, most
+        similar first. Needs no embedding model.
+        """
+        self.refresh()
+        signature = self.minhash.signature(query_text)  # Hashing needs no lock
+        with self.lock.read():
+            ranked = []
+            for doc_id, jaccard in self.minhash.query(signature, threshold)[:top_k]:
+                doc = self.docs.get(doc_id)
+                if doc is None or not len(doc["spans"]):
+                    continue
+                start, end = doc["spans"][0]
+                ranked.append({"document": doc, "score": jaccard, "passage": doc["text"][start:end]})
+            return ranked
+
+    def find_overlaps(self, query_text, documents):
+        """Passages query_text shares with each of documents (entries of search results' "document").
+
+        Returns one {"spans", "coverage", "reference_coverage"} per document
+        (see Winnower.overlaps). Only the query is fingerprinted here; the
+        documents' fingerprints were computed when they were indexed.
+        """
+        query = self.winnower.fingerprint(query_text)
+        results = []
+        for doc in documents:
+            spans, coverage, reference_coverage = self.winnower.overlaps(query, doc["fingerprints"], len(query_text), len(doc["text"]))
+            results.append({"spans": spans, "coverage": coverage, "reference_coverage": reference_coverage})
+        return results
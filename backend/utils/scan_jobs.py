@@ -0,0 +1,155 @@
+import os
+import signal
+import socket
+import threading
+import time
+from config import (
+    JOB_MAX_ATTEMPTS, JOB_RETRY_SECONDS, JOB_LEASE_SECONDS, JOB_MAX_PENDING_PER_USER,
+    JOB_MAX_RUNNING_PER_USER, JOB_POLL_SECONDS, MAX_QUERY_CHARS
+)
+from utils.storage import create_job, claim_job, complete_job, fail_job, renew_job_lease
+from utils.credit_ledger import get_credit_ledger, job_key
+from utils.event_bus import get_event_bus
+
+
+class JobError(Exception):
+    """A failure that retrying cannot fix (e.g. no text in the file)."""
+
+
+def submit_scan_job(username, payload, client_key=None):
+    """Queue a scan for the workers, charging one credit; returns (status, job id) as create_job does.
+
+    payload holds either "text" or an uploaded file ("path", "sha256",
+    "filename"), plus "top_k" and "min_score". A client_key that already
+    queued a job returns "duplicate" with that job's id; one already used
+    for another charge (e.g. /scan/file) returns "conflict".
+    """
+    key = job_key(username, client_key) if client_key else None
+    result = create_job(username, payload, max_pending=JOB_MAX_PENDING_PER_USER, max_attempts=JOB_MAX_ATTEMPTS, key=key)
+    get_credit_ledger().forget(username)
+    return result
+
+
+def job_status(job):
+    """The client-facing view of a job row."""
+    view = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "error": job["error"],
+        "filename": job["payload"].get("filename")
+    }
+    if job["status"] == "done":
+        view["matches"] = (job["result"] or {}).get("matches", [])
+    return view
+
+
+def remove_job_file(job):
+    path = job["payload"].get("path")
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def run_job(job):
+    """Extract (for files) and match one job; returns (query text, match result)."""
+    # Imported here: loading routes.match pulls in the embedding service, which only workers need
+    from routes.match import match_with_faiss, get_reference_index, load_reference_docs
+    from utils.extraction import get_extractor
+
+    payload = job["payload"]
+    query_text = (payload.get("text") or "").strip()
+    if payload.get("path"):
+        pieces = get_extractor().iter_text(payload["path"], payload.get("sha256"), max_chars=MAX_QUERY_CHARS)
+        query_text = "\n".join(pieces).strip()[:MAX_QUERY_CHARS]
+    if not query_text:
+        raise JobError("Failed to extract text" if payload.get("path") else "No text provided")
+
+    if get_reference_index().ntotal == 0:
+        load_reference_docs()
+    return query_text, match_with_faiss(query_text, top_k=payload["top_k"], min_score=payload["min_score"])
+
+
+def keep_lease(job_id, worker, done):
+    """Renew a job's lease until done is set, so a long job is not handed to a second worker."""
+    while not done.wait(JOB_LEASE_SECONDS / 3):
+        if not renew_job_lease(job_id, worker, JOB_LEASE_SECONDS):
+            return
+
+
+def work_on(job, worker):
+    from routes.match import queue_scan_event
+
+    done = threading.Event()
+    threading.Thread(target=keep_lease, args=(job["id"], worker, done), name="job-lease", daemon=True).start()
+    try:
+        query_text, result = run_job(job)
+    except JobError as e:
+        status = fail_job(job["id"], worker, str(e))
+    except Exception as e:
+        print(f"ERROR: Scan job {job['id']} attempt {job['attempts']} failed! ({e})")
+        status = fail_job(job["id"], worker, str(e), retry_seconds=JOB_RETRY_SECONDS * 2 ** (job["attempts"] - 1))
+    else:
+        # Only a job still ours counts: a cancelled job was refunded and leaves no history
+        status = "done" if complete_job(job["id"], worker, result) else None
+        if status == "done":
+            queue_scan_event(job["username"], query_text, result)
+    finally:
+        done.set()
+
+    if status != "queued":
+        remove_job_file(job)  # Finished, failed for good or cancelled: the upload is no longer needed
+    return status
+
+
+def run_worker(stop=None, worker=None):
+    """Claim and run jobs until stop (a threading or multiprocessing Event) is set.
+
+    Meant to own its process: on the way out it closes the process's event
+    bus, flushing the history of the jobs it finished.
+    """
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    stop = stop or threading.Event()
+    print(f"SUCCESS: Scan job worker {worker} started")
+    try:
+        while not stop.is_set():
+            try:
+                job = claim_job(worker, JOB_LEASE_SECONDS, JOB_MAX_RUNNING_PER_USER)
+            except Exception as e:
+                print(f"ERROR: Failed to claim a scan job! ({e})")
+                job = None
+            if job is None:
+                stop.wait(JOB_POLL_SECONDS)
+                continue
+            start = time.perf_counter()
+            status = work_on(job, worker)
+            print(f"DEBUG: Scan job {job['id']} {status or 'dropped'} in {time.perf_counter() - start:.2f}s")
+    finally:
+        # Forked workers leave through os._exit, which skips the bus's atexit close and kills its daemon thread
+        get_event_bus().close()
+        print(f"SUCCESS: Scan job worker {worker} stopped")
+
+
+def start_workers(count):
+    """Fork count worker processes; returns (processes, stop event).
+
+    Call after the model weights are loaded so the workers share them
+    copy-on-write, as gunicorn's preloading does for the web workers.
+    """
+    import multiprocessing
+    context = multiprocessing.get_context("fork")
+    stop = context.Event()
+    processes = [context.Process(target=_worker_main, args=(stop,), name=f"scan-worker-{n}", daemon=False) for n in range(count)]
+    for process in processes:
+        process.start()
+    return processes, stop
+
+
+def _worker_main(stop):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent handles Ctrl+C and sets stop
+    run_worker(stop)
+
@@ -0,0 +1,725 @@
+import base64
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from config import DATABASE_PATH, STORAGE_PATH
+from utils.activity_log import get_activity_log
+from utils.keyword_stats import term_weights, weight_deltas
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL DEFAULT 'user',
+    credits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS users_role ON users (role);
+
+-- Append-only credit ledger: one row per balance change, with the balance after it. Every change to
+-- users.credits writes its row in the same transaction, so the amounts of a user sum to their balance
+CREATE TABLE IF NOT EXISTS credit_transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    balance INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    idempotency_key TEXT UNIQUE,
+    reference TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS credit_transactions_user ON credit_transactions (username, id);
+CREATE TRIGGER IF NOT EXISTS credit_transactions_no_update BEFORE UPDATE ON credit_transactions
+BEGIN SELECT RAISE(ABORT, 'credit_transactions is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS credit_transactions_no_delete BEFORE DELETE ON credit_transactions
+BEGIN SELECT RAISE(ABORT, 'credit_transactions is append-only'); END;
+
+CREATE TABLE IF NOT EXISTS credit_requests (
+    username TEXT PRIMARY KEY,
+    credits INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    created_at TEXT NOT NULL
+);
+
+-- match_count and top_score summarize result for history list views, which never read result itself
+CREATE TABLE IF NOT EXISTS scans (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    document_name TEXT,
+    result TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    match_count INTEGER,
+    top_score REAL
+);
+CREATE INDEX IF NOT EXISTS scans_user_time ON scans (username, created_at);
+
+CREATE TABLE IF NOT EXISTS scans_per_user (
+    username TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS scans_per_document (
+    document_name TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS credit_usage (
+    username TEXT PRIMARY KEY,
+    credits INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS document_texts (
+    document_name TEXT PRIMARY KEY,
+    text TEXT NOT NULL
+);
+
+-- Running keyword totals over document_texts (see utils/keyword_stats.py)
+CREATE TABLE IF NOT EXISTS keyword_stats (
+    term TEXT PRIMARY KEY,
+    df INTEGER NOT NULL,
+    weight REAL NOT NULL
+);
+
+-- Asynchronous scan jobs: queued -> running -> done | failed | cancelled (see utils/scan_jobs.py)
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    available_at TEXT NOT NULL,
+    lease_until TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    idempotency_key TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available_at);
+CREATE INDEX IF NOT EXISTS jobs_user_status ON jobs (username, status);
+
+CREATE TABLE IF NOT EXISTS migrations (
+    name TEXT PRIMARY KEY,
+    applied_at TEXT NOT NULL
+);
+"""
+
+# Each thread of each worker process keeps one open connection
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = {}  # database path -> pid that created the schema
+
+
+def connect(db_path):
+    """Open a connection in autocommit mode with WAL journaling (readers never block the writer)."""
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL: a crash can lose the last commits, never corrupt
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+def get_db(db_path=None):
+    """Return this thread's connection, opening it (and creating the schema) on first use.
+
+    Connections are not shared across fork: a child process opens its own.
+    """
+    db_path = db_path or DATABASE_PATH
+
+    connections = getattr(_local, "connections", None)
+    if connections is None or getattr(_local, "pid", None) != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connections[db_path] = connect(db_path)
+        with _init_lock:
+            if _initialized.get(db_path) != os.getpid():
+                init_db(conn)
+                _initialized[db_path] = os.getpid()
+    return conn
+
+
+@contextmanager
+def transaction(conn=None):
+    """Run a block in one write transaction, taking the write lock up front."""
+    conn = conn or get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def now():
+    return datetime.now().isoformat()
+
+
+def later(seconds):
+    return (datetime.now() + timedelta(seconds=seconds)).isoformat()
+
+
+# Schema and one-shot migration from the JSON files
+def init_db(conn, storage_dir=STORAGE_PATH):
+    conn.executescript(SCHEMA)
+    migrate_json_storage(conn, storage_dir)
+    migrate_activity_logs(conn, storage_dir)
+    with transaction(conn):
+        if not conn.execute("SELECT 1 FROM migrations WHERE name = 'keyword_stats'").fetchone():
+            rebuild_keyword_stats(conn)
+            conn.execute("INSERT INTO migrations (name, applied_at) VALUES ('keyword_stats', ?)", (now(),))
+        if not conn.execute("SELECT 1 FROM migrations WHERE name = 'scan_summaries'").fetchone():
+            add_scan_summaries(conn)
+            conn.execute("INSERT INTO migrations (name, applied_at) VALUES ('scan_summaries', ?)", (now(),))
+        if not conn.execute("SELECT 1 FROM migrations WHERE name = 'credit_ledger'").fetchone():
+            open_credit_ledger(conn)
+            conn.execute("INSERT INTO migrations (name, applied_at) VALUES ('credit_ledger', ?)", (now(),))
+        if not conn.execute("SELECT 1 FROM migrations WHERE name = 'job_keys'").fetchone():
+            add_job_keys(conn)
+            conn.execute("INSERT INTO migrations (name, applied_at) VALUES ('job_keys', ?)", (now(),))
+
+
+def _read_json(path, default):
+    if not os.path.exists(path) or os.stat(path).st_size == 0:
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"WARNING: Skipping unreadable {path} during migration ({e})")
+        return default
+
+
+def migrate_json_storage(conn, storage_dir):
+    """Copy users, credit requests, scans and analytics from the old JSON files, once.
+
+    The JSON files are left in place; the migration is recorded in the
+    migrations table so it never runs twice, even with several workers.
+    """
+    with transaction(conn):
+        if conn.execute("SELECT 1 FROM migrations WHERE name = 'json_storage'").fetchone():
+            return
+
+        users = _read_json(os.path.join(storage_dir, "users.json"), {})
+        users = users.get("users", []) if isinstance(users, dict) else users
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (username, password, role, credits) VALUES (?, ?, ?, ?)",
+            [(u["username"], u["password"], u.get("role", "user"), u.get("credits", 0)) for u in users if u.get("username")]
+        )
+
+        requests = _read_json(os.path.join(storage_dir, "credits.json"), [])
+        conn.executemany(
+            "INSERT OR IGNORE INTO credit_requests (username, credits, status, created_at) VALUES (?, ?, ?, ?)",
+            [(r["username"], r["credits"], r.get("status", "pending"), now()) for r in requests if isinstance(r, dict) and r.get("username")]
+        )
+
+        scans = _read_json(os.path.join(storage_dir, "scans.json"), {})
+        rows = []
+        for scan_id, scan in scans.items():
+            matches = scan.get("result", {}).get("matches", [])
+            document_name = matches[0].get("document_name") if matches else None
+            rows.append((scan_id, scan.get("username"), document_name, json.dumps(scan.get("result", {})), now()))
+        conn.executemany("INSERT OR IGNORE INTO scans (id, username, document_name, result, created_at) VALUES (?, ?, ?, ?, ?)", rows)
+
+        analytics = _read_json(os.path.join(storage_dir, "analytics.json"), {})
+        conn.executemany("INSERT OR IGNORE INTO scans_per_user VALUES (?, ?)", analytics.get("scans_per_user", {}).items())
+        conn.executemany("INSERT OR IGNORE INTO scans_per_document VALUES (?, ?)", analytics.get("most_scanned_documents", {}).items())
+        conn.executemany("INSERT OR IGNORE INTO credit_usage VALUES (?, ?)", analytics.get("credit_usage", {}).items())
+        conn.executemany("INSERT OR IGNORE INTO document_texts VALUES (?, ?)", analytics.get("document_texts", {}).items())
+
+        conn.execute("INSERT INTO migrations (name, applied_at) VALUES ('json_storage', ?)", (now(),))
+        print(f"SUCCESS: Migrated {len(users)} users and {len(scans)} scans from JSON storage")
+
+
+def migrate_activity_logs(conn, storage_dir):
+    """Move activity logs to the NDJSON activity log, once.
+
+    They come from the activity_logs table of earlier databases, or from
+    activity_logs.json when the database is new.
+    """
+    with transaction(conn):
+        if conn.execute("SELECT 1 FROM migrations WHERE name = 'activity_logs_ndjson'").fetchone():
+            return
+
+        has_table = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'activity_logs'").fetchone()
+        if has_table:
+            logs = (dict(row) for row in conn.execute("SELECT username, action, details, timestamp FROM activity_logs ORDER BY id"))
+        else:
+            logs = _read_json(os.path.join(storage_dir, "activity_logs.json"), [])
+
+        count = get_activity_log().append_many(
+            {"username": log.get("username"), "action": log.get("action", ""), "details": log.get("details", ""), "timestamp": log.get("timestamp") or now()}
+            for log in logs
+        )
+        if has_table:
+            conn.execute("DROP TABLE activity_logs")
+
+        conn.execute("INSERT INTO migrations (name, applied_at) VALUES ('activity_logs_ndjson', ?)", (now(),))
+        print(f"SUCCESS: Moved {count} activity log entries to the NDJSON activity log")
+
+
+# Users and credits
+def get_user(username):
+    row = get_db().execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+    return dict(row) if row else None
+
+
+def create_user(username, password_hash, role, credits):
+    """Insert a user with an opening ledger entry; returns False if the username is taken."""
+    try:
+        with transaction() as conn:
+            conn.execute(
+                "INSERT INTO users (username, password, role, credits) VALUES (?, ?, ?, 0)",
+                (username, password_hash, role)
+            )
+            _change_credits(conn, username, credits, "opening")
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+
+# Credit ledger (see utils/credit_ledger.py for the cached front end)
+SPEND_KINDS = ("scan", "refund")  # Counted in credit_usage
+
+
+def _balance(conn, username):
+    row = conn.execute("SELECT credits FROM users WHERE username = ?", (username,)).fetchone()
+    return row["credits"] if row else None
+
+
+def _change_credits(conn, username, amount, kind, key=None, reference=None):
+    """Add amount (negative to take) to a user's credits and log it; call inside a transaction.
+
+    Taking is a compare-and-decrement: it only happens if the balance covers
+    it. A key already in the ledger makes the call a no-op, so a retried
+    charge or refund is applied once. Returns (status, balance after):
+    status is "ok", "duplicate", "insufficient" or "not_found".
+    """
+    if key is not None and conn.execute("SELECT 1 FROM credit_transactions WHERE idempotency_key = ?", (key,)).fetchone():
+        return "duplicate", _balance(conn, username)
+    if amount < 0:
+        cursor = conn.execute(
+            "UPDATE users SET credits = credits + ? WHERE username = ? AND credits >= ?", (amount, username, -amount)
+        )
+    else:
+        cursor = conn.execute("UPDATE users SET credits = credits + ? WHERE username = ?", (amount, username))
+    balance = _balance(conn, username)
+    if not cursor.rowcount:
+        return ("insufficient" if balance is not None else "not_found"), balance
+
+    conn.execute(
+        "INSERT INTO credit_transactions (username, amount, balance, kind, idempotency_key, reference, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (username, amount, balance, kind, key, reference, now())
+    )
+    if kind in SPEND_KINDS and amount:
+        _count_credit_usage(conn, username, -amount)
+    return "ok", balance
+
+
+def change_credits(username, amount, kind, key=None, reference=None):
+    """Apply one credit change in its own transaction; returns (status, balance) as _change_credits does."""
+    with transaction() as conn:
+        return _change_credits(conn, username, amount, kind, key, reference)
+
+
+def reset_credits(role, credits):
+    """Set the credits of every user with a role, logging the difference for each."""
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO credit_transactions (username, amount, balance, kind, created_at) "
+            "SELECT username, ? - credits, ?, 'reset', ? FROM users WHERE role = ? AND credits != ?",
+            (credits, credits, now(), role, credits)
+        )
+        conn.execute("UPDATE users SET credits = ? WHERE role = ?", (credits, role))
+
+
+def get_credit_transactions(username, limit=50, before_id=None):
+    """A user's ledger entries, newest first; pass the smallest id seen as before_id for the next page."""
+    rows = get_db().execute(
+        "SELECT id, amount, balance, kind, reference, created_at FROM credit_transactions "
+        "WHERE username = ? AND id < ? ORDER BY id DESC LIMIT ?",
+        (username, before_id if before_id is not None else 2 ** 63 - 1, limit)
+    )
+    return [dict(row) for row in rows]
+
+
+def open_credit_ledger(conn):
+    """Give every user without ledger entries an opening entry for their current balance."""
+    conn.execute(
+        "INSERT INTO credit_transactions (username, amount, balance, kind, created_at) "
+        "SELECT username, credits, credits, 'opening', ? FROM users "
+        "WHERE username NOT IN (SELECT DISTINCT username FROM credit_transactions)",
+        (now(),)
+    )
+
+
+def audit_credit_ledger():
+    """Users whose balance differs from the sum of their ledger entries (empty when the ledger is consistent)."""
+    rows = get_db().execute(
+        "SELECT users.username, users.credits, COALESCE(SUM(credit_transactions.amount), 0) AS ledger "
+        "FROM users LEFT JOIN credit_transactions ON credit_transactions.username = users.username "
+        "GROUP BY users.username HAVING ledger != users.credits"
+    )
+    return [dict(row) for row in rows]
+
+
+# Credit requests
+def get_credit_requests():
+    rows = get_db().execute("SELECT username, credits, status FROM credit_requests ORDER BY created_at")
+    return [dict(row) for row in rows]
+
+
+def add_credit_request(username, credits):
+    """Record a pending request; returns False if the user already has one."""
+    try:
+        get_db().execute(
+            "INSERT INTO credit_requests (username, credits, status, created_at) VALUES (?, ?, 'pending', ?)",
+            (username, credits, now())
+        )
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+
+def resolve_credit_request(username, approve, credits=None):
+    """Remove a user's pending request, adding its credits (or `credits`) if approved.
+
+    Returns the request with the credits granted, or None if there is no
+    request (or, when approving, no such user).
+    """
+    with transaction() as conn:
+        row = conn.execute("SELECT username, credits, status FROM credit_requests WHERE username = ?", (username,)).fetchone()
+        if not row:
+            return None
+        request = {**dict(row), "credits": row["credits"] if credits is None else credits}
+        if approve and _change_credits(conn, username, request["credits"], "grant", reference="credit_request")[0] != "ok":
+            return None
+        conn.execute("DELETE FROM credit_requests WHERE username = ?", (username,))
+    return request
+
+
+# Scans
+def scan_summary(result):
+    """(match count, best similarity in percent or None) of a scan result."""
+    matches = result.get("matches") or []
+    scores = []
+    for match in matches:
+        try:
+            scores.append(float(str(match.get("similarity_score", "")).rstrip("%")))
+        except ValueError:
+            pass
+    return len(matches), max(scores) if scores else None
+
+
+def _scan_row(scan_id, username, document_name, result, created_at):
+    return (scan_id, username, document_name, json.dumps(result), created_at, *scan_summary(result))
+
+
+INSERT_SCAN = (
+    "INSERT OR IGNORE INTO scans (id, username, document_name, result, created_at, match_count, top_score) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def add_scan_summaries(conn):
+    """Add and fill the summary columns on a scans table created before they existed."""
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(scans)")}
+    for column, kind in (("match_count", "INTEGER"), ("top_score", "REAL")):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE scans ADD COLUMN {column} {kind}")
+    rows = conn.execute("SELECT rowid, result FROM scans WHERE match_count IS NULL").fetchall()
+    conn.executemany(
+        "UPDATE scans SET match_count = ?, top_score = ? WHERE rowid = ?",
+        [(*scan_summary(json.loads(row["result"])), row["rowid"]) for row in rows]
+    )
+
+
+def _encode_cursor(created_at, rowid):
+    return base64.urlsafe_b64encode(f"{created_at}|{rowid}".encode()).decode()
+
+
+def _decode_cursor(cursor):
+    """(created_at, rowid) from a cursor; raises ValueError if it is malformed."""
+    try:
+        created_at, rowid = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return created_at, int(rowid)
+    except (UnicodeError, ValueError) as e:  # binascii.Error is a ValueError
+        raise ValueError("Invalid cursor") from e
+
+
+def get_user_scans(username, limit=50, cursor=None, summary=False):
+    """A page of a user's scans, newest first; returns (scans, cursor of the next page or None).
+
+    Pages are read from the (username, created_at) index starting after the
+    cursor, so a page costs the same however long the history is. Summary
+    scans carry match_count and top_score instead of the full result.
+    """
+    columns = "id, document_name, created_at, match_count, top_score" if summary else "id, document_name, created_at, result"
+    where, params = "username = ?", [username]
+    if cursor:
+        where += " AND (created_at, rowid) < (?, ?)"
+        params.extend(_decode_cursor(cursor))
+    rows = get_db().execute(
+        f"SELECT rowid, {columns} FROM scans WHERE {where} ORDER BY created_at DESC, rowid DESC LIMIT ?",
+        (*params, limit + 1)
+    ).fetchall()
+
+    scans = [{key: row[key] for key in row.keys() if key != "rowid"} for row in rows[:limit]]
+    if not summary:
+        for scan in scans:
+            scan["result"] = json.loads(scan["result"])
+    next_cursor = _encode_cursor(rows[limit - 1]["created_at"], rows[limit - 1]["rowid"]) if len(rows) > limit else None
+    return scans, next_cursor
+
+
+def get_scan(scan_id):
+    row = get_db().execute(
+        "SELECT id, username, document_name, result, created_at, match_count, top_score FROM scans WHERE id = ?", (scan_id,)
+    ).fetchone()
+    return {**dict(row), "result": json.loads(row["result"])} if row else None
+
+
+# Analytics counters
+def _count_scan(conn, username, document_name, query_text):
+    row = conn.execute("SELECT text FROM document_texts WHERE document_name = ?", (document_name,)).fetchone()
+    deltas = weight_deltas(row["text"] if row else None, query_text)
+    conn.executemany(
+        "INSERT INTO keyword_stats VALUES (?, ?, ?) "
+        "ON CONFLICT (term) DO UPDATE SET df = df + excluded.df, weight = weight + excluded.weight",
+        [(term, df, weight) for term, (df, weight) in deltas.items()]
+    )
+    conn.executemany(
+        "DELETE FROM keyword_stats WHERE term = ? AND df <= 0",
+        [(term,) for term, (df, _) in deltas.items() if df < 0]
+    )
+    conn.execute(
+        "INSERT INTO scans_per_user VALUES (?, 1) ON CONFLICT (username) DO UPDATE SET count = count + 1",
+        (username,)
+    )
+    conn.execute(
+        "INSERT INTO scans_per_document VALUES (?, 1) ON CONFLICT (document_name) DO UPDATE SET count = count + 1",
+        (document_name,)
+    )
+    conn.execute(
+        "INSERT INTO document_texts VALUES (?, ?) ON CONFLICT (document_name) DO UPDATE SET text = excluded.text",
+        (document_name, query_text)
+    )
+
+
+def record_scans(scans):
+    """Store a batch of completed scans and update the analytics counters in one transaction.
+
+    Each scan is a dict with id, username, document_name, query_text, result and created_at.
+    Scans already stored are skipped, counters included, so a batch can be written again.
+    """
+    with transaction() as conn:
+        for scan in scans:
+            row = _scan_row(scan["id"], scan["username"], scan["document_name"], scan["result"], scan["created_at"])
+            if conn.execute(INSERT_SCAN, row).rowcount:
+                _count_scan(conn, scan["username"], scan["document_name"], scan["query_text"])
+
+
+def _count_credit_usage(conn, username, credits):
+    conn.execute(
+        "INSERT INTO credit_usage VALUES (?, ?) ON CONFLICT (username) DO UPDATE SET credits = credits + excluded.credits",
+        (username, credits)
+    )
+
+
+
+def get_keyword_stats():
+    """Return (number of documents, cursor over (term, df, weight) rows)."""
+    conn = get_db()
+    n_docs = conn.execute("SELECT COUNT(*) FROM document_texts").fetchone()[0]
+    return n_docs, conn.execute("SELECT term, df, weight FROM keyword_stats")
+
+
+def rebuild_keyword_stats(conn=None):
+    """Recompute the keyword totals from document_texts (corrects any floating-point drift)."""
+    conn = conn or get_db()
+    totals = {}
+    for (text,) in conn.execute("SELECT text FROM document_texts"):
+        for term, weight in term_weights(text).items():
+            df, total = totals.get(term, (0, 0.0))
+            totals[term] = (df + 1, total + weight)
+    conn.execute("DELETE FROM keyword_stats")
+    conn.executemany("INSERT INTO keyword_stats VALUES (?, ?, ?)", [(term, df, weight) for term, (df, weight) in totals.items()])
+    return len(totals)
+
+
+def get_analytics():
+    """Return the analytics counters as {"scans_per_user", "most_scanned_documents", "credit_usage", "document_texts"}."""
+    conn = get_db()
+    return {
+        "scans_per_user": dict(conn.execute("SELECT username, count FROM scans_per_user").fetchall()),
+        "most_scanned_documents": dict(conn.execute("SELECT document_name, count FROM scans_per_document ORDER BY count DESC").fetchall()),
+        "credit_usage": dict(conn.execute("SELECT username, credits FROM credit_usage").fetchall()),
+        "document_texts": dict(conn.execute("SELECT document_name, text FROM document_texts").fetchall())
+    }
+
+
+# Scan jobs
+JOB_FINISHED = ("done", "failed", "cancelled")
+
+
+def _job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def add_job_keys(conn):
+    """Add the idempotency key column to a jobs table created before it existed."""
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    if "idempotency_key" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN idempotency_key TEXT")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS jobs_idempotency_key ON jobs (idempotency_key)")
+
+
+def create_job(username, payload, max_pending, max_attempts, credits=1, key=None):
+    """Queue a job and charge its credits in one transaction.
+
+    Returns (status, job id): status is "ok", "duplicate" (key already
+    queued a job; the id is that job's), "conflict" (key was already used
+    to charge something other than a job), "too_many" (the user already
+    has max_pending unfinished jobs), "insufficient" or "not_found".
+    """
+    job_id = str(uuid.uuid4())
+    with transaction() as conn:
+        if key is not None:
+            row = conn.execute("SELECT id FROM jobs WHERE idempotency_key = ?", (key,)).fetchone()
+            if row:
+                return "duplicate", row["id"]
+            if conn.execute("SELECT 1 FROM credit_transactions WHERE idempotency_key = ?", (key,)).fetchone():
+                return "conflict", None
+        pending = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE username = ? AND status IN ('queued', 'running')", (username,)
+        ).fetchone()[0]
+        if pending >= max_pending:
+            return "too_many", None
+        status, _ = _change_credits(conn, username, -credits, "scan", key or f"job:{job_id}", reference=job_id)
+        if status != "ok":
+            return status, None
+        timestamp = now()
+        conn.execute(
+            "INSERT INTO jobs (id, username, status, payload, max_attempts, available_at, created_at, updated_at, idempotency_key) "
+            "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+            (job_id, username, json.dumps({**payload, "credits": credits}), max_attempts, timestamp, timestamp, timestamp, key)
+        )
+    return "ok", job_id
+
+
+def _finish_job(conn, job, status, error=None, result=None):
+    """Move a job to a final state, refunding its credits unless it succeeded."""
+    conn.execute(
+        "UPDATE jobs SET status = ?, error = ?, result = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+        (status, error, json.dumps(result) if result is not None else None, now(), job["id"])
+    )
+    if status != "done":
+        credits = json.loads(job["payload"]).get("credits", 0)
+        _change_credits(conn, job["username"], credits, "refund", key=f"refund:job:{job['id']}", reference=job["id"])
+
+
+def claim_job(worker, lease_seconds, max_running_per_user):
+    """Take the oldest runnable job for a worker, or return None.
+
+    Runnable means queued and past its retry delay, or running with an
+    expired lease (its worker died). Users already running
+    max_running_per_user jobs are skipped so one user cannot take every worker.
+    """
+    timestamp = now()
+    with transaction() as conn:
+        # Jobs whose worker died on their last attempt are not retried again
+        for row in conn.execute(
+            "SELECT * FROM jobs WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts", (timestamp,)
+        ).fetchall():
+            _finish_job(conn, row, "failed", error="Worker stopped responding")
+
+        row = conn.execute(
+            "SELECT * FROM jobs "
+            "WHERE ((status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_until < ?)) "
+            "AND username NOT IN ("
+            "    SELECT username FROM jobs WHERE status = 'running' AND lease_until >= ? "
+            "    GROUP BY username HAVING COUNT(*) >= ?"
+            ") ORDER BY created_at LIMIT 1",
+            (timestamp, timestamp, timestamp, max_running_per_user)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+            (worker, later(lease_seconds), timestamp, row["id"])
+        )
+    return get_job(row["id"])
+
+
+def complete_job(job_id, worker, result):
+    """Store a job's result; returns False if the job was cancelled or taken over meanwhile."""
+    cursor = get_db().execute(
+        "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_until = NULL, updated_at = ? "
+        "WHERE id = ? AND status = 'running' AND worker = ?",
+        (json.dumps(result), now(), job_id, worker)
+    )
+    return cursor.rowcount > 0
+
+
+def renew_job_lease(job_id, worker, lease_seconds):
+    """Extend a running job's lease; returns False once the job is no longer this worker's (e.g. cancelled)."""
+    cursor = get_db().execute(
+        "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running' AND worker = ?",
+        (later(lease_seconds), job_id, worker)
+    )
+    return cursor.rowcount > 0
+
+
+def fail_job(job_id, worker, error, retry_seconds=None):
+    """Record a failed attempt: requeue after retry_seconds if attempts remain, otherwise fail and refund.
+
+    Returns the job's new status, or None if it was cancelled or taken over meanwhile.
+    """
+    with transaction() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ? AND status = 'running' AND worker = ?", (job_id, worker)).fetchone()
+        if row is None:
+            return None
+        if retry_seconds is not None and row["attempts"] < row["max_attempts"]:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, available_at = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+                (error, later(retry_seconds), now(), job_id)
+            )
+            return "queued"
+        _finish_job(conn, row, "failed", error=error)
+    return "failed"
+
+
+def cancel_job(job_id, username=None):
+    """Cancel an unfinished job and refund it.
+
+    Returns "ok", the job's status if it had already finished, or None if
+    there is no such job.
+    """
+    with transaction() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or (username and row["username"] != username):
+            return None
+        if row["status"] in JOB_FINISHED:
+            return row["status"]
+        _finish_job(conn, row, "cancelled")
+    return "ok"
+
+
+def get_job(job_id):
+    return _job(get_db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
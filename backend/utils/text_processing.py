@@ -0,0 +1,98 @@
+import hashlib
+import re
+import unicodedata
+import numpy as np
+
+WORD_PATTERN = re.compile(r"\S+")
+
+
+def word_offsets(text):
+    """Character offsets of whitespace-separated words (fallback when no tokenizer is given)."""
+    return [match.span() for match in WORD_PATTERN.finditer(text)]
+
+
+def chunk_spans(text, max_tokens=256, overlap=32, token_offsets=None):
+    """Split text into overlapping passages of at most max_tokens tokens.
+
+    token_offsets maps the text to per-token (start, end) character offsets,
+    e.g. from the embedding model's tokenizer; it defaults to plain words.
+    Returns a list of (start, end) character spans into text.
+    """
+    offsets = (token_offsets or word_offsets)(text)
+    if not offsets:
+        return []
+
+    step = max(1, max_tokens - overlap)
+    spans = []
+    for first in range(0, len(offsets), step):
+        last = min(first + max_tokens, len(offsets)) - 1
+        spans.append((offsets[first][0], offsets[last][1]))
+        if last == len(offsets) - 1:
+            break
+    return spans
+
+
+# Same tokens as scikit-learn's default token_pattern
+KEYWORD_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+_stop_words = None
+
+
+def stop_words():
+    """scikit-learn's English stop words, imported on first use."""
+    global _stop_words
+    if _stop_words is None:
+        from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+        _stop_words = ENGLISH_STOP_WORDS
+    return _stop_words
+
+
+def keyword_terms(text):
+    """Lowercased terms of text without stop words, as TfidfVectorizer(stop_words="english") sees them."""
+    excluded = stop_words()
+    return [term for term in KEYWORD_PATTERN.findall(text.lower()) if term not in excluded]
+
+
+# Lexical search terms: Unicode words of two or more characters, case-folded and NFKC-normalized
+# (so "ﬁle" matches "file" and full-width digits match ASCII), without stop words. Longer tokens
+# than MAX_TERM_LENGTH are usually hashes, URLs or extraction junk and are dropped
+MAX_TERM_LENGTH = 40
+
+
+def normalize_text(text):
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def tokenize(text):
+    """Terms of text for the BM25 index, in order (repeats kept)."""
+    excluded = stop_words()
+    return [
+        term for term in KEYWORD_PATTERN.findall(normalize_text(text))
+        if term not in excluded and len(term) <= MAX_TERM_LENGTH
+    ]
+
+
+# Word shingles for near-duplicate detection: every run of k consecutive words (stop words kept, since
+# copies keep them too), hashed to 32 bits. Word hashes come from BLAKE2b so they are the same in every process
+SHINGLE_WORD_PATTERN = re.compile(r"\w+")
+SHINGLE_BASE = np.uint64(1099511628211)
+
+
+def _word_hash(word):
+    return int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def shingle_hashes(text, k=5):
+    """Distinct 32-bit hashes of the k-word shingles of text (one shingle for texts shorter than k words)."""
+    words = SHINGLE_WORD_PATTERN.findall(normalize_text(text))
+    if not words:
+        return np.empty(0, dtype="uint64")
+    vocabulary = {word: _word_hash(word) for word in set(words)}
+    hashes = np.fromiter((vocabulary[word] for word in words), dtype="uint64", count=len(words))
+
+    k = min(k, len(hashes))
+    shingles = hashes[:len(hashes) - k + 1].copy()
+    with np.errstate(over="ignore"):  # Multiplication wraps around modulo 2**64, as intended
+        for offset in range(1, k):
+            shingles = shingles * SHINGLE_BASE + hashes[offset:len(hashes) - k + 1 + offset]
+    return np.unique((shingles ^ (shingles >> np.uint64(32))) & np.uint64(0xFFFFFFFF))
@@ -0,0 +1,162 @@
+import re
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Characters left out of k-grams, so spacing, punctuation and line breaks do not hide a copy
+SKIPPED_CHARS = re.compile(r"[\W_]")
+KGRAM_BASE = np.uint64(1000003)
+MIX_MULTIPLIER = np.uint64(0xFF51AFD7ED558CCD)
+
+# Arrays saved next to the FAISS index (see ReferenceIndex.save)
+ARRAY_NAMES = ("fingerprint_docs", "fingerprint_hashes", "fingerprint_spans", "fingerprint_params")
+
+
+def empty_fingerprints():
+    return np.empty(0, dtype="uint32"), np.empty((0, 2), dtype="int64")
+
+
+def _union_length(spans):
+    """Number of characters covered by a list of (start, end) spans."""
+    covered, reach = 0, 0
+    for start, end in sorted(spans):
+        start = max(start, reach)
+        if end > start:
+            covered += end - start
+            reach = end
+    return covered
+
+
+class Winnower:
+    """Winnowing fingerprints (Schleimer, Wilkerson and Aiken, 2003) for locating copied passages.
+
+    Texts are lower-cased and stripped of everything but letters and digits;
+    every run of k remaining characters (a k-gram) is hashed, and in each
+    window of `window` consecutive k-gram hashes the smallest is kept as a
+    fingerprint. Any passage two texts share that spans at least
+    k + window - 1 such characters yields at least one common fingerprint,
+    while runs shorter than k never do. A fingerprint keeps the character
+    span of its k-gram in the original text, so matches map back to exact
+    offsets.
+    """
+
+    def __init__(self, k=25, window=20, max_occurrences=8):
+        self.k = k
+        self.window = window
+        self.max_occurrences = max_occurrences  # Reference copies of one fingerprint paired per query fingerprint
+
+    def fingerprint(self, text):
+        """(hashes, spans) of a text's fingerprints, sorted by hash; spans are (start, end) character offsets."""
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            lowered = text  # A few characters lower-case to two; keep offsets exact instead
+        kept = SKIPPED_CHARS.sub("\0", lowered)
+        codes = np.frombuffer(kept.encode("utf-32-le", "surrogatepass"), dtype="uint32")
+        positions = np.flatnonzero(codes)  # Offset in text of each kept character
+        if not len(positions):
+            return empty_fingerprints()
+
+        chars = codes[positions].astype("uint64")
+        k = min(self.k, len(chars))
+        count = len(chars) - k + 1
+        hashes = np.zeros(count, dtype="uint64")
+        for offset in range(k):  # Polynomial hash of every k-gram; wraps modulo 2**64
+            hashes = hashes * KGRAM_BASE + chars[offset:offset + count]
+        hashes ^= hashes >> np.uint64(33)
+        hashes *= MIX_MULTIPLIER
+        hashes = (hashes >> np.uint64(32)).astype("uint32")
+
+        # Rightmost minimum of every window; a run of windows sharing one minimum selects it once
+        window = min(self.window, count)
+        windows = sliding_window_view(hashes, window)
+        selected = np.unique(np.arange(len(windows)) + window - 1 - np.argmin(windows[:, ::-1], axis=1))
+
+        order = np.argsort(hashes[selected], kind="stable")
+        selected = selected[order]
+        spans = np.column_stack((positions[selected], positions[selected + k - 1] + 1)).astype("int64")
+        return hashes[selected], spans
+
+    def _pairs(self, query, reference):
+        """(query rows, reference rows) of every pair of equal fingerprints."""
+        query_hashes, _ = query
+        reference_hashes, _ = reference
+        first = np.searchsorted(reference_hashes, query_hashes, side="left")
+        counts = np.minimum(np.searchsorted(reference_hashes, query_hashes, side="right") - first, self.max_occurrences)
+        query_rows = np.repeat(np.arange(len(query_hashes)), counts)
+        # Offset of each pair within its run of equal reference hashes
+        within = np.arange(len(query_rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return query_rows, np.repeat(first, counts) + within
+
+    def overlaps(self, query, reference, query_length, reference_length):
+        """Passages shared by two fingerprinted texts.
+
+        Returns (spans, coverage, reference coverage): spans are (query start,
+        query end, reference start, reference end) character offsets in query
+        order, made by merging matched fingerprints that overlap in both texts
+        and dropping those mostly inside a longer span of the query;
+        coverage is the share of the query's characters inside a span, and
+        reference coverage the same for the reference.
+        """
+        query_rows, reference_rows = self._pairs(query, reference)
+        if not len(query_rows):
+            return [], 0.0, 0.0
+        pairs = np.column_stack((query[1][query_rows], reference[1][reference_rows]))
+        pairs = pairs[np.lexsort((pairs[:, 2], pairs[:, 0]))]
+
+        # Greedy chaining: a pair extends an open span it overlaps on both sides, else opens a new one
+        spans, active = [], []
+        for query_start, query_end, reference_start, reference_end in pairs.tolist():
+            still_open = []
+            for span in active:
+                if span[1] >= query_start:
+                    still_open.append(span)
+                else:
+                    spans.append(span)
+            active = still_open
+            for span in active:
+                if span[2] <= reference_start <= span[3]:
+                    span[1] = max(span[1], query_end)
+                    span[3] = max(span[3], reference_end)
+                    break
+            else:
+                active.append([query_start, query_end, reference_start, reference_end])
+        spans.extend(active)
+
+        # Repeated text (page headers, boilerplate) matches in many places; keep the longest span over each query region
+        kept = []
+        for span in sorted(spans, key=lambda span: span[1] - span[0], reverse=True):
+            shared = sum(max(0, min(span[1], other[1]) - max(span[0], other[0])) for other in kept)
+            if shared * 2 < span[1] - span[0]:
+                kept.append(span)
+        spans = sorted(kept)
+
+        coverage = _union_length([(span[0], span[1]) for span in spans]) / max(query_length, 1)
+        reference_coverage = _union_length([(span[2], span[3]) for span in spans]) / max(reference_length, 1)
+        return [tuple(span) for span in spans], coverage, reference_coverage
+
+    def arrays(self, fingerprints_by_doc):
+        """Fingerprints of every document ({doc id: (hashes, spans)}) as numpy arrays for saving."""
+        docs = [np.full(len(hashes), doc_id, dtype="int64") for doc_id, (hashes, _) in fingerprints_by_doc.items()]
+        hashes = [hashes for hashes, _ in fingerprints_by_doc.values()]
+        spans = [spans for _, spans in fingerprints_by_doc.values()]
+        empty_hashes, empty_spans = empty_fingerprints()
+        return {
+            "fingerprint_docs": np.concatenate(docs) if docs else np.empty(0, dtype="int64"),
+            "fingerprint_hashes": np.concatenate(hashes) if hashes else empty_hashes,
+            "fingerprint_spans": np.concatenate(spans) if spans else empty_spans,
+            "fingerprint_params": np.array([self.k, self.window], dtype="int64")
+        }
+
+    def from_arrays(self, arrays):
+        """{doc id: (hashes, spans)} from saved arrays, or None if they are missing or were made with other parameters."""
+        if not all(name in arrays for name in ARRAY_NAMES):
+            return None
+        if np.asarray(arrays["fingerprint_params"]).tolist() != [self.k, self.window]:
+            return None
+        # Rows are grouped by document; copy them so the files can be rewritten later
+        docs = np.array(arrays["fingerprint_docs"])
+        hashes = np.array(arrays["fingerprint_hashes"])
+        spans = np.array(arrays["fingerprint_spans"])
+        doc_ids, first_rows = np.unique(docs, return_index=True)
+        order = np.argsort(first_rows)
+        doc_ids, first_rows = doc_ids[order], first_rows[order]
+        return dict(zip(doc_ids.tolist(), zip(np.split(hashes, first_rows[1:]), np.split(spans, first_rows[1:]))))
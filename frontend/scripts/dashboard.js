@@ -44,10 +44,13 @@ async function fetchProfile() {
 document.addEventListener("DOMContentLoaded", fetchProfile);
 
 
-// Fetch Scan History
-async function fetchScanHistory(username) {
+// Fetch Scan History, a page at a time (next_cursor points at the following page)
+let scanHistoryCursor = null;
+
+async function fetchScanHistory(username, cursor = null) {
     try {
-        const response = await fetch(`${API_URL}/scan/history?username=${username}`, {
+        const query = cursor ? `&cursor=${encodeURIComponent(cursor)}` : "";
+        const response = await fetch(`${API_URL}/scan/history?username=${username}${query}`, {
             method: "GET"
         });
 
@@ -55,7 +58,9 @@ async function fetchScanHistory(username) {
         console.log("Scan History Data:", data);  // Debugging: Check response
 
         const tableBody = document.getElementById("scanHistory");
-        tableBody.innerHTML = ""; // Clear existing content
+        if (!cursor) {
+            tableBody.innerHTML = ""; // Clear existing content
+        }
 
         if (data.history.length > 0) {
             data.history.forEach(scan => {
@@ -78,18 +83,33 @@ async function fetchScanHistory(username) {
                         tableBody.appendChild(row);
                     });
                 } else {
-                    tableBody.innerHTML = `<tr><td colspan="2">No matches found.</td></tr>`;
+                    const row = document.createElement("tr");
+                    row.innerHTML = `<td colspan="2">No matches found.</td>`;
+                    tableBody.appendChild(row);
                 }
             });
-        } else {
+        } else if (!cursor) {
             document.getElementById("scan-download-btn").style.display = "none";
             tableBody.innerHTML = `<tr><td colspan="2">No scan history found.</td></tr>`;
         }
+
+        // Older scans are one click away instead of silently left out
+        scanHistoryCursor = data.next_cursor;
+        document.getElementById("scan-more-btn").style.display = scanHistoryCursor ? "inline-block" : "none";
     } catch (error) {
         console.error("Error fetching scan history:", error);
     }
 }
 
+// Load the next page of scan history below the rows already shown
+function loadMoreScanHistory() {
+    const cursor = scanHistoryCursor;
+    scanHistoryCursor = null;  // A second click before the page arrives must not load it twice
+    if (cursor) {
+        fetchScanHistory(localStorage.getItem("username"), cursor);
+    }
+}
+
 
 
 // Redirect Admins to Credit Management Page
@@ -138,12 +158,20 @@ async function downloadScanHistory() {
     if (!username) return;
 
     try {
-        const response = await fetch(`${API_URL}/scan/history?username=${username}`);
-        const data = await response.json();
-        console.log("📜 Preparing Scan History Report:", data);
+        // History comes a page at a time: follow next_cursor until the last page
+        let history = [];
+        let cursor = null;
+        do {
+            const query = cursor ? `&cursor=${encodeURIComponent(cursor)}` : "";
+            const response = await fetch(`${API_URL}/scan/history?username=${username}&limit=500${query}`);
+            const data = await response.json();
+            history = history.concat(data.history);
+            cursor = data.next_cursor;
+        } while (cursor);
+        console.log("📜 Preparing Scan History Report:", history);
 
         let reportContent = `📜 Scan History Report for ${username}\n\n`;
-        data.history.forEach(scan => {
+        history.forEach(scan => {
             scan.result.matches.forEach(match => {
                 reportContent += `📄 Document: ${match.document_name}\n`;
                 reportContent += `🔹 Similarity: ${match.similarity_score}\n`;
@@ -40,7 +40,36 @@ async function updateCredits() {
 
 
 
-// Upload and match document
+// Render match results
+function renderMatches(matches) {
+    const matchResults = document.getElementById("matchResults");
+
+    if (matches.length > 0) {
+        let resultText = "<h3>🔍Matched Documents:</h3><br><br>";
+        matches.forEach((match, index) => {
+            const truncatedDocument = match.document_excerpt
+                ? (match.document_excerpt.length > 100 ? match.document_excerpt.substring(0, 100) + "..." : match.document_excerpt)
+                : "N/A";
+
+            const insight = match.insight || "No additional insights available.";
+
+            resultText += `
+                <div style="border: 1px solid #ccc; padding: 12px; margin: 12px 0; border-radius: 8px; background: #f9f9f9;">
+                    <h4>📄 ${index + 1}. <strong>${match.document_name}</strong></h4>
+                    <p><strong>🔹 Similarity:</strong> ${match.similarity_score}</p>
+                    <p><strong>📜 Document Excerpt:</strong> <br><em>${truncatedDocument}</em></p>
+                    <p><strong>💡 Insight:</strong> ${insight}</p>
+                </div>
+            `;
+        });
+
+        matchResults.innerHTML = resultText;
+    } else {
+        matchResults.innerText = "No significant matches found.";
+    }
+}
+
+// Upload and match document in one request (/scan/file extracts, matches and charges the credit)
 async function uploadAndMatchDocument() {
     const fileInput = document.getElementById("documentUpload");
     const scanStatus = document.getElementById("scanStatus");
@@ -62,71 +91,53 @@ async function uploadAndMatchDocument() {
     formData.append("file", file);
 
     try {
-        // Upload file
         scanStatus.innerText = "Uploading document...";
-        const uploadResponse = await fetch(`${API_URL}/upload`, {
+        matchResults.innerText = "";
+        const response = await fetch(`${API_URL}/scan/file`, {
             method: "POST",
             body: formData
         });
 
-        if (!uploadResponse.ok) {
-            throw new Error(`Upload failed: ${uploadResponse.status}`);
-        }
-
-        const uploadData = await uploadResponse.json();
-        scanStatus.innerText = "Document uploaded. Matching now...";
-        // Match extracted text using BERT-based AI
-        const matchResponse = await fetch(`${API_URL}/scan/match`, {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ text: uploadData.extracted_text })
-        });
-
-        if (!matchResponse.ok) {
-            throw new Error(`Matching failed: ${matchResponse.status}`);
+        if (!response.ok) {
+            const errorData = await response.json().catch(() => ({}));
+            throw new Error(errorData.error || `Scan failed: ${response.status}`);
         }
 
-        const matchData = await matchResponse.json();
-        // Format results for display
-        const matches = matchData.matches || [];
-
-        if (matches.length > 0) {
-            let resultText = "<h3>🔍Matched Documents:</h3><br><br>";
-            matches.forEach((match, index) => {
-                const truncatedDocument = match.document_excerpt
-                    ? (match.document_excerpt.length > 100 ? match.document_excerpt.substring(0, 100) + "..." : match.document_excerpt)
-                    : "N/A";
-
-                const insight = match.insight || "No additional insights available.";
-
-                resultText += `
-                    <div style="border: 1px solid #ccc; padding: 12px; margin: 12px 0; border-radius: 8px; background: #f9f9f9;">
-                        <h4>📄 ${index + 1}. <strong>${match.document_name}</strong></h4>
-                        <p><strong>🔹 Similarity:</strong> ${match.similarity_score}</p>
-                        <p><strong>📜 Document Excerpt:</strong> <br><em>${truncatedDocument}</em></p>
-                        <p><strong>💡 Insight:</strong> ${insight}</p>
-                    </div>
-                `;
-            });
-
-            matchResults.innerHTML = resultText;
-        } else {
-            console.error("No matches found, or API returned incorrect format:", matchData);
-            matchResults.innerText = "No significant matches found.";
+        // The response is newline-delimited JSON: one progress line per stage
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let newline;
+            while ((newline = buffer.indexOf("\n")) >= 0) {
+                const line = buffer.slice(0, newline).trim();
+                buffer = buffer.slice(newline + 1);
+                if (!line) continue;
+
+                const event = JSON.parse(line);
+                if (event.stage === "uploaded") {
+                    scanStatus.innerText = "Document uploaded. Extracting text...";
+                } else if (event.stage === "extracted") {
+                    scanStatus.innerText = `Extracted ${event.characters} characters. Matching now...`;
+                } else if (event.stage === "matched") {
+                    scanStatus.innerText = "Scan complete.";
+                    renderMatches(event.matches || []);
+                } else if (event.stage === "error") {
+                    throw new Error(event.error);
+                }
+            }
         }
 
-
-        // Deduct 1 credit after scanning
-        await fetch(`${API_URL}/credits/deduct`, {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ username: localStorage.getItem("username") })
-        });
-
         // Fetch updated credits and update UI
         await updateCredits();
     } catch (error) {
         scanStatus.innerText = "Error: " + error.message;
+        await updateCredits();
     }
 }
 